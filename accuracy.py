@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# accuracy.py
+#
+# How tight is the drummer against the click? Listens to the pad's MIDI output,
+# timestamps every hit on arrival and matches it to the nearest step of the
+# engine's timeline (from a tick listener). Streaming stats in fixed memory:
+# overall mean/SD offset, rushing/dragging per beat position, accuracy per bar.
+#
+#   DRUMASSIST_LISTEN=1 python3 drum_assist_web.py          # first pad-looking input
+#   DRUMASSIST_LISTEN=SamplePad python3 drum_assist_laptop.py
+#
+# With DRUMASSIST_RECORD on, hits also go into the recording (recorder.py), and
+#
+#   python3 accuracy.py analyze recordings/
+#
+# analyzes a whole session at once with NumPy.
+import argparse
+import math
+import threading
+import time
+from collections import deque
+
+import recorder
+import scheduler
+
+clock = scheduler.clock
+
+MAX_STEPS = 32          # beat positions tracked (longest pattern we expect)
+BAR_HISTORY = 16        # closed bars kept for the UI
+ON_TIME_MS = 5.0        # within this much on average counts as "on the click"
+PORT_HINTS = ("SamplePad", "Alesis", "USB")
+
+
+def tendency(mean_ms):
+    if mean_ms <= -ON_TIME_MS:
+        return "rushing"
+    if mean_ms >= ON_TIME_MS:
+        return "dragging"
+    return "on"
+
+
+class _Welford:
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+    def sd(self):
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class Analyzer:
+    """Matches hits to the engine's click grid and keeps running stats."""
+
+    def __init__(self, eng):
+        self.engine = eng
+        self._lock = threading.Lock()
+        # (deadline, interval, step, pattern length, bar) of the last tick, replaced
+        # whole by the tick listener so hit() always sees a consistent one
+        self._last = None
+        self._bar = -1
+        self._idx = None
+        self._pattern_changed = False
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.total = _Welford()
+            self.positions = [_Welford() for _ in range(MAX_STEPS)]
+            self.bars = deque(maxlen=BAR_HISTORY)
+            self._cur_bar = None     # [bar, hits, sum ms, sum |ms|]
+
+    def on_tick(self, model):
+        # scheduler thread: no locks, no I/O
+        deadline, interval, abs_step, step, idx, bpm = model[:6]
+        if step == 0:
+            self._bar += 1
+        if idx != self._idx:
+            self._idx = idx
+            self._pattern_changed = True
+        plen = len(self.engine.patterns[idx]["beats"])
+        self._last = (deadline, interval, step, plen, self._bar)
+
+    def hit(self, t, note=0):
+        last = self._last
+        if last is None:
+            return None
+        deadline, interval, step, plen, bar = last
+        if t - deadline > 1.5 * interval:
+            return None   # stopped, or nothing near the grid
+        if t - deadline > interval / 2:
+            # closer to the step that hasn't ticked yet
+            deadline += interval
+            step += 1
+            if step >= plen:
+                step = 0
+                bar += 1
+        offset = (t - deadline) * 1000.0
+
+        with self._lock:
+            if self._pattern_changed:
+                # positions mean something else in a different pattern
+                self._pattern_changed = False
+                self.positions = [_Welford() for _ in range(MAX_STEPS)]
+            self.total.add(offset)
+            if step < MAX_STEPS:
+                self.positions[step].add(offset)
+            cur = self._cur_bar
+            if cur is None or cur[0] != bar:
+                if cur is not None and cur[0] < bar:
+                    self._close(cur)
+                cur = self._cur_bar = [bar, 0, 0.0, 0.0]
+            cur[1] += 1
+            cur[2] += offset
+            cur[3] += abs(offset)
+
+        rec = self.engine.recorder
+        if rec is not None:
+            rec.hit(t, deadline, note, step, bar)
+        return offset
+
+    def _close(self, cur):
+        bar, n, s, sa = cur
+        self.bars.append({"bar": bar, "hits": n, "mean_ms": s / n, "mean_abs_ms": sa / n})
+
+    def summary(self):
+        with self._lock:
+            last = self._last
+            cur = self._cur_bar
+            if cur is not None and last is not None and cur[0] < last[4]:
+                self._close(cur)
+                self._cur_bar = None
+            total = self.total
+            positions = [
+                {"step": i, "hits": w.n, "mean_ms": w.mean, "sd_ms": w.sd(), "tendency": tendency(w.mean)}
+                for i, w in enumerate(self.positions) if w.n
+            ]
+            return {
+                "enabled": True,
+                "hits": total.n,
+                "mean_ms": total.mean,
+                "sd_ms": total.sd(),
+                "tendency": tendency(total.mean),
+                "positions": positions,
+                "bars": list(self.bars),
+            }
+
+
+class MidiListener:
+    """Input port -> Analyzer.hit(), stamped as soon as rtmidi hands us the message."""
+
+    def __init__(self, analyzer, port_match=None):
+        import engine
+        mido = engine.get_mido()
+        names = mido.get_input_names()
+        if not names:
+            raise OSError("no MIDI input ports")
+        hints = (port_match,) if port_match else PORT_HINTS
+        matching = [n for n in names if any(h in n for h in hints)]
+        if port_match and not matching:
+            raise OSError(f"no MIDI input port matching '{port_match}'")
+        self.name = matching[0] if matching else names[0]
+        self.analyzer = analyzer
+        self.port = mido.open_input(self.name, callback=self._on_message)
+
+    def _on_message(self, msg):
+        t = clock()
+        if msg.type == "note_on" and msg.velocity > 0:
+            self.analyzer.hit(t, msg.note)
+
+    def close(self):
+        self.port.close()
+
+
+def start(eng, port_match=None):
+    """Attach an Analyzer to eng (eng.analyzer) and listen on a MIDI input."""
+    analyzer = Analyzer(eng)
+    eng.add_tick_listener(analyzer.on_tick)
+    eng.analyzer = analyzer
+    analyzer.listener = None
+
+    def open_port():
+        # like init_midi: port enumeration is slow, the click doesn't wait for it
+        try:
+            analyzer.listener = MidiListener(analyzer, port_match)
+            print(f"MIDI in: listening on {analyzer.listener.name}")
+        except Exception as e:
+            print(f"MIDI in: {e}. Timing analysis off.")
+
+    threading.Thread(target=open_port, daemon=True, name=f"midi-in-{eng.name}").start()
+    return analyzer
+
+
+def format_summary(s):
+    if not s or not s.get("hits"):
+        return "Timing: no hits yet"
+    beats = " ".join(f"{p['step'] + 1}:{p['mean_ms']:+.0f}" for p in s["positions"])
+    line = f"Timing: {s['mean_ms']:+.1f} ms ({s['tendency']}), SD {s['sd_ms']:.1f} ms, {s['hits']} hits | {beats}"
+    if s["bars"]:
+        b = s["bars"][-1]
+        line += f" | last bar {b['mean_abs_ms']:.1f} ms off"
+    return line
+
+
+# ---- batch analysis of recordings ----
+
+def _record_dtype(np):
+    # recorder.RECORD as a NumPy dtype
+    return np.dtype([("t", "<f8"), ("ref", "<f8"), ("kind", "u1"), ("a", "u1"), ("b", "<i2"), ("c", "<i4")])
+
+
+def load_hits(paths):
+    """All hit records in the given recordings, as one NumPy structured array."""
+    import numpy as np
+    dtype = _record_dtype(np)
+    chunks = []
+    for path in recorder.expand_paths(paths):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, rec_size, capacity, count, no, wall0, clock0 = recorder.HEADER.unpack_from(data, 0)
+        if magic != recorder.MAGIC or rec_size != dtype.itemsize:
+            print(f"{path}: not a DrumAssist recording, skipped")
+            continue
+        count = min(count, capacity, (len(data) - recorder.HEADER_SIZE) // rec_size)
+        recs = np.frombuffer(data, dtype, count, recorder.HEADER_SIZE)
+        chunks.append(recs[recs["kind"] == recorder.HIT])
+    return np.concatenate(chunks) if chunks else np.zeros(0, dtype)
+
+
+def analyze(hits):
+    """Same numbers as Analyzer.summary(), for a whole session at once (vectorized)."""
+    import numpy as np
+    if len(hits) == 0:
+        return {"hits": 0}
+    off = (hits["t"] - hits["ref"]) * 1000.0
+    step = hits["b"].astype(np.intp)
+
+    n = np.bincount(step)
+    s = np.bincount(step, off)
+    s2 = np.bincount(step, off * off)
+    used = np.nonzero(n)[0]
+    mean = s[used] / n[used]
+    # sample SD, like the live Welford numbers
+    sd = np.sqrt(np.maximum(s2[used] - n[used] * mean * mean, 0.0) / np.maximum(n[used] - 1, 1))
+
+    bars, inv = np.unique(hits["c"], return_inverse=True)
+    bn = np.bincount(inv)
+    bar_mean = np.bincount(inv, off) / bn
+    bar_abs = np.bincount(inv, np.abs(off)) / bn
+    worst = np.argsort(bar_abs)[::-1][:5]
+
+    return {
+        "hits": int(len(off)),
+        "mean_ms": float(off.mean()),
+        "sd_ms": float(off.std(ddof=1)) if len(off) > 1 else 0.0,
+        "tendency": tendency(float(off.mean())),
+        "positions": [
+            {"step": int(i), "hits": int(n[i]), "mean_ms": float(m), "sd_ms": float(d), "tendency": tendency(m)}
+            for i, m, d in zip(used, mean, sd)
+        ],
+        "bars": int(len(bars)),
+        "bar_mean_abs_ms": float(bar_abs.mean()),
+        "worst_bars": [{"bar": int(bars[i]), "hits": int(bn[i]), "mean_ms": float(bar_mean[i]),
+                        "mean_abs_ms": float(bar_abs[i])} for i in worst],
+    }
+
+
+def _synthetic_hits(minutes, bpm=120, steps=8):
+    # a drummer on 8ths at `bpm` for `minutes`, slightly dragging beat 3
+    import numpy as np
+    dtype = _record_dtype(np)
+    count = int(minutes * 60 * bpm / 60 * 2)
+    rng = np.random.default_rng(1)
+    hits = np.zeros(count, dtype)
+    ref = np.arange(count) * (30.0 / bpm)
+    step = np.arange(count) % steps
+    hits["ref"] = ref
+    hits["t"] = ref + rng.normal(0.002, 0.006, count) + (step == 4) * 0.008
+    hits["kind"] = recorder.HIT
+    hits["b"] = step
+    hits["c"] = np.arange(count) // steps
+    return hits
+
+
+def _print_report(r, seconds):
+    if not r["hits"]:
+        print("no hits recorded")
+        return
+    print(f"{r['hits']} hits in {r['bars']} bars (analyzed in {seconds * 1000:.1f} ms)")
+    print(f"offset: mean {r['mean_ms']:+.2f} ms ({r['tendency']}), SD {r['sd_ms']:.2f} ms, "
+          f"average bar {r['bar_mean_abs_ms']:.2f} ms off")
+    print(f"{'step':>4} {'hits':>7} {'mean ms':>8} {'SD ms':>7}")
+    for p in r["positions"]:
+        print(f"{p['step'] + 1:>4} {p['hits']:>7} {p['mean_ms']:>+8.2f} {p['sd_ms']:>7.2f}  {p['tendency']}")
+    print("loosest bars: " + ", ".join(f"#{b['bar']} ({b['mean_abs_ms']:.1f} ms)" for b in r["worst_bars"]))
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Drummer timing analysis")
+    ap.add_argument("command", choices=("analyze", "bench"))
+    ap.add_argument("paths", nargs="*", default=["recordings"], help="recordings (files or directories)")
+    ap.add_argument("--minutes", type=float, default=60.0, help="bench: length of synthetic session")
+    args = ap.parse_args()
+
+    hits = load_hits(args.paths) if args.command == "analyze" else _synthetic_hits(args.minutes)
+    t0 = time.perf_counter()
+    report = analyze(hits)
+    _print_report(report, time.perf_counter() - t0)
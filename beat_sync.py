@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# beat_sync.py
+#
+# Keep several DrumAssist nodes phase-locked over the LAN.
+#
+# The leader multicasts its timing model after every step (plus a heartbeat when
+# stopped): which absolute step it just played, at what time on its own clock,
+# the step interval, pattern, bpm and fill counters. Followers estimate the
+# offset and drift between the leader's clock and their own from those packets,
+# map the leader's step grid onto local time and slave their engine to it.
+#
+# Lost packets just mean a follower free-runs on the last model for a bit; a
+# restarted leader shows up with a new leader id and followers re-learn the clock.
+#
+#   DRUMASSIST_SYNC=leader   python3 drum_assist2.py
+#   DRUMASSIST_SYNC=follower python3 drum_assist2.py
+#   python3 beat_sync.py --demo 3        # leader + 3 followers on loopback
+import os
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+import scheduler
+
+GROUP = os.environ.get("DRUMASSIST_SYNC_GROUP", "239.255.42.99")
+PORT = int(os.environ.get("DRUMASSIST_SYNC_PORT", "5099"))
+HEARTBEAT = 0.25        # seconds between packets when nothing is playing
+LEADER_TIMEOUT = 3.0    # no packets for this long -> forget the clock estimate
+
+MAGIC = b"DAS1"
+# magic, leader id, seq, sent, anchor, interval, abs step, step, idx, bpm, fill active, fill pending, playing
+PACKET = struct.Struct("!4sQIdddqHHHBBB")
+
+clock = scheduler.clock
+
+
+def pack(leader_id, seq, sent, model):
+    anchor, interval, abs_step, step, idx, bpm, fill_active, fill_pending, playing = model
+    return PACKET.pack(MAGIC, leader_id, seq & 0xFFFFFFFF, sent,
+                       anchor if anchor is not None else 0.0,
+                       interval if interval is not None else 0.0,
+                       abs_step, step, idx, bpm, fill_active, fill_pending, 1 if playing else 0)
+
+
+def unpack(data):
+    if len(data) != PACKET.size or data[:4] != MAGIC:
+        return None
+    return PACKET.unpack(data)
+
+
+class ClockEstimator:
+    """
+    Maps leader clock -> local clock from (leader send time, local receive time) pairs.
+    Drift is the least-squares slope of the one-way delay over the window; the offset
+    follows the lower envelope (the least-delayed packets), which is what the true
+    offset looks like once queueing noise is discounted.
+    """
+    WINDOW = 64
+    MIN_DRIFT_SPAN = 2.0   # seconds of history before we trust a drift estimate
+
+    def __init__(self):
+        self.samples = deque(maxlen=self.WINDOW)
+        self.offset = None
+        self.drift = 0.0
+        self.ref = 0.0
+
+    def reset(self):
+        self.samples.clear()
+        self.offset = None
+        self.drift = 0.0
+
+    def add(self, remote, local):
+        self.samples.append((remote, local - remote))
+        n = len(self.samples)
+        self.ref = self.samples[-1][0]
+        drift = 0.0
+        if n >= 8 and self.samples[-1][0] - self.samples[0][0] >= self.MIN_DRIFT_SPAN:
+            mx = sum(r for r, _ in self.samples) / n
+            my = sum(d for _, d in self.samples) / n
+            sxx = sum((r - mx) ** 2 for r, _ in self.samples)
+            if sxx > 0:
+                drift = sum((r - mx) * (d - my) for r, d in self.samples) / sxx
+        self.drift = drift
+        self.offset = min(d - drift * (r - self.ref) for r, d in self.samples)
+
+    def to_local(self, remote):
+        return remote + self.offset + self.drift * (remote - self.ref)
+
+
+def _socket(group, port, receive):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+    if receive:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", port))
+        mreq = struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton("0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+    return sock
+
+
+class Leader:
+    """Broadcasts an engine's timing model. Packets are sent off the scheduler thread."""
+
+    def __init__(self, eng, group=GROUP, port=PORT, loss=0.0):
+        self.engine = eng
+        self.addr = (group, port)
+        self.loss = loss        # drop this fraction of packets (testing)
+        self.leader_id = random.getrandbits(64)
+        self.seq = 0
+        self._q = queue.SimpleQueue()
+        self._sock = _socket(group, port, receive=False)
+        self._running = True
+        eng.add_tick_listener(self._q.put)
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sync-leader")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.engine.remove_tick_listener(self._q.put)
+        self._q.put(None)
+
+    def _run(self):
+        while self._running:
+            try:
+                model = self._q.get(timeout=HEARTBEAT)
+            except queue.Empty:
+                model = self.engine.timing_model()
+                if model[8]:
+                    continue  # playing: tick packets are the heartbeat
+            if model is None:
+                break
+            self.seq += 1
+            if self.loss and random.random() < self.loss:
+                continue
+            try:
+                self._sock.sendto(pack(self.leader_id, self.seq, clock(), model), self.addr)
+            except OSError as e:
+                print(f"Sync send error: {e}")
+
+
+class Follower:
+    """Slaves an engine to whatever leader is multicasting on the group."""
+
+    def __init__(self, eng, group=GROUP, port=PORT):
+        self.engine = eng
+        self.clock = ClockEstimator()
+        self.leader_id = None
+        self.last_seq = 0
+        self.last_packet = 0.0
+        self.packets = 0
+        self.lost = 0
+        self._sock = _socket(group, port, receive=True)
+        self._sock.settimeout(0.5)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="sync-follower")
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def status(self):
+        return {
+            "leader_id": self.leader_id,
+            "packets": self.packets,
+            "lost": self.lost,
+            "offset_ms": None if self.clock.offset is None else 1000.0 * self.clock.offset,
+            "drift_ppm": 1e6 * self.clock.drift,
+        }
+
+    def _run(self):
+        while self._running:
+            try:
+                data, _ = self._sock.recvfrom(256)
+            except socket.timeout:
+                if self.leader_id is not None and clock() - self.last_packet > LEADER_TIMEOUT:
+                    print("Sync: leader lost, free-running")
+                    self.leader_id = None
+                    self.clock.reset()
+                    self.engine.unfollow()
+                continue
+            except OSError:
+                continue
+            local = clock()
+            pkt = unpack(data)
+            if pkt is None:
+                continue
+            self._handle(pkt, local)
+
+    def _handle(self, pkt, local):
+        (_, leader_id, seq, sent, anchor, interval, abs_step, step, idx, bpm,
+         fill_active, fill_pending, playing) = pkt
+
+        if leader_id != self.leader_id:
+            # new or restarted leader: its clock and step counter start over
+            print(f"Sync: following leader {leader_id:016x}")
+            self.leader_id = leader_id
+            self.clock.reset()
+            self.last_seq = seq - 1
+        if seq > self.last_seq + 1:
+            self.lost += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.last_packet = local
+        self.packets += 1
+
+        self.clock.add(sent, local)
+        eng = self.engine
+
+        state = {"current_idx": idx, "bpm": bpm, "playing": playing,
+                 "fill_active_bars": fill_active, "fill_pending_bars": fill_pending}
+        if not playing or interval <= 0:
+            eng.unfollow()
+            eng.apply_remote(state)
+            return
+
+        local_anchor = self.clock.to_local(anchor)
+        eng.follow(local_anchor, abs_step, step, interval, fill_active, fill_pending)
+        # if we're just starting, join on the next grid point rather than "now"
+        k = max(1, int((clock() - local_anchor) / interval) + 1)
+        eng.apply_remote(state, local_anchor + k * interval)
+
+
+def start(eng, role, **kw):
+    if role == "leader":
+        print(f"Sync: leading on {kw.get('group', GROUP)}:{kw.get('port', PORT)}")
+        return Leader(eng, **kw)
+    if role == "follower":
+        print(f"Sync: following on {kw.get('group', GROUP)}:{kw.get('port', PORT)}")
+        return Follower(eng, **kw)
+    raise ValueError(f"Unknown sync role: {role}")
+
+
+def _demo(n_followers, seconds, loss, restart):
+    # Leader and followers as separate engines on separate schedulers, like separate Pis.
+    import engine
+
+    def make(name):
+        eng = engine.Engine(name=name, save_file=None, patterns_file=None)
+        sched = scheduler.Scheduler(name=f"sched-{name}")
+        sched.start()
+        eng.attach(sched)
+        return eng
+
+    ticks = {}
+
+    def recorder(name):
+        ticks[name] = {}
+        def on_tick(model):
+            ticks[name][model[2]] = clock()
+        return on_tick
+
+    leader_eng = make("leader")
+    leader_eng.state["bpm"] = 120
+    leader_eng.add_tick_listener(recorder("leader"))
+    followers = []
+    for i in range(n_followers):
+        eng = make(f"f{i}")
+        eng.add_tick_listener(recorder(f"f{i}"))
+        followers.append(Follower(eng))
+    leader = Leader(leader_eng, loss=loss)
+
+    leader_eng.toggle_play()
+    if restart:
+        time.sleep(seconds / 2)
+        print("Restarting leader...")
+        leader.stop()
+        leader = Leader(leader_eng, loss=loss)
+        time.sleep(seconds / 2)
+    else:
+        time.sleep(seconds)
+    leader_eng.toggle_play()
+    time.sleep(0.5)
+
+    lead = ticks["leader"]
+    for i, f in enumerate(followers):
+        mine = ticks[f"f{i}"]
+        # only compare the second half, after the clock estimate has settled
+        common = sorted(set(lead) & set(mine))
+        common = common[len(common) // 2:]
+        errs = sorted(abs(mine[s] - lead[s]) * 1000.0 for s in common)
+        if not errs:
+            print(f"f{i}: no common steps")
+            continue
+        st = f.status()
+        print(f"f{i}: steps={len(errs)} median={errs[len(errs) // 2]:.3f} ms "
+              f"max={errs[-1]:.3f} ms lost={st['lost']}/{st['packets'] + st['lost']}")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="DrumAssist LAN beat sync loopback demo")
+    ap.add_argument("--demo", type=int, default=3, metavar="N", help="number of followers")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--loss", type=float, default=0.2, help="fraction of leader packets to drop")
+    ap.add_argument("--restart", action="store_true", help="restart the leader half-way")
+    args = ap.parse_args()
+    _demo(args.demo, args.seconds, args.loss, args.restart)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# bench_layers.py
+#
+# Cost of one sequencer step vs number of pattern layers (layers.py). The layers
+# are compiled into one event grid up front, so a step costs the same with 2 layers
+# or 16 on the same rhythms: one burst on the step, one layer-job wake per distinct
+# time in between. Only distinct times cost more, never extra layers on them.
+#
+#   python3 bench_layers.py
+#   python3 bench_layers.py --steps 50000 --counts 0,1,4,16
+import argparse
+import time
+
+import engine
+import layers
+import scheduler
+
+DIVS = (3, 16)   # triplet quarters and 16ths: 4 distinct times per quarter, however many layers
+
+
+class _NullPort:
+    # stands in for the MIDI Sender without a thread competing for the GIL
+    def put(self, item):
+        pass
+
+
+def _engine(n_layers):
+    eng = engine.Engine(name=f"bench{n_layers}", save_file=None, patterns_file=None)
+    p = {"name": "bench", "beats": [1, 2, 2, 2], "fill": None}
+    raw = [{"sound": 40 + i, "beats": [2] * DIVS[i % len(DIVS)]} for i in range(n_layers)]
+    engine._with_layers(p, raw or None)
+    eng.patterns.append(p)
+    eng.state.update(current_idx=len(eng.patterns) - 1, bpm=120, playing=True)
+    eng._midi = _NullPort()
+    eng._scheduler = scheduler.Scheduler(name="bench-layers")   # never started
+    return eng, p.get("grid")
+
+
+def bench(n_layers, steps, repeat=5):
+    # best of `repeat` runs: what the code costs, not what else the machine was doing
+    eng, grid = _engine(n_layers)
+    sched = eng._scheduler
+    t = 0.0
+    tick_ns = all_ns = float("inf")
+    for _ in range(repeat):
+        # ticks only
+        start = time.perf_counter()
+        for _ in range(steps):
+            eng.tick(t, t)
+            t += 0.5
+        tick_ns = min(tick_ns, (time.perf_counter() - start) / steps * 1e9)
+        while sched._heap:
+            sched.dispatch_due(sched._heap[0][0])
+
+        # plus everything the step puts on the heap: bursts in between, note-offs
+        dispatches = 0
+        start = time.perf_counter()
+        for _ in range(steps):
+            nxt = eng.tick(t, t)
+            while sched._heap and sched._heap[0][0] < nxt:
+                sched.dispatch_due(sched._heap[0][0])
+                dispatches += 1
+            t = nxt
+        all_ns = min(all_ns, (time.perf_counter() - start) / steps * 1e9)
+    notes = 0
+    if grid is not None:
+        for on, between in zip(grid.on, grid.between):
+            key = on[2]
+            notes += len(key) if type(key) is tuple else 1
+            for _, key in between:
+                notes += len(key) if type(key) is tuple else 1
+        notes /= grid.steps
+    return tick_ns, all_ns, dispatches / steps, notes
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sequencer step cost vs pattern layers")
+    ap.add_argument("--steps", type=int, default=10000)
+    ap.add_argument("--counts", default="0,1,2,4,8,16")
+    args = ap.parse_args()
+    engine.get_mido()   # build messages now, not in the first timed step
+
+    print(f"{'layers':>6} {'notes/step':>10} {'tick ns':>9} {'dispatches/step':>15} {'ns/step, all of it':>19}")
+    for n in (int(c) for c in args.counts.split(",")):
+        if n > layers.MAX_LAYERS:
+            continue
+        tick_ns, all_ns, dispatches, notes = bench(n, args.steps)
+        print(f"{n:>6} {notes:>10.1f} {tick_ns:>9.0f} {1 + dispatches:>15.1f} {all_ns:>19.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# bench_realtime.py
+#
+# Effect of each realtime.py measure on tick lateness, under load that looks like
+# a busy web server: threads serializing status JSON and making cyclic garbage
+# (so the collector has real work to do).
+#
+# Measures are added one at a time on top of each other. SCHED_FIFO and mlockall
+# need privileges; without them those rows say "skipped" and match the row before.
+#
+#   sudo python3 bench_realtime.py
+#   python3 bench_realtime.py --seconds 10 --engines 4 --load 3
+import argparse
+import json
+import threading
+import time
+
+import engine
+import realtime
+import scheduler
+
+STEPS = [
+    ("baseline", ()),
+    ("+gc", ("gc",)),
+    ("+affinity", ("gc", "affinity")),
+    ("+priority", ("gc", "affinity", "priority")),
+    ("+mlock", ("gc", "affinity", "priority", "mlock")),
+]
+
+
+def _web_like_load(stop):
+    # roughly what Flask handlers do: build dicts, dump JSON, leave cycles behind
+    eng = engine.Engine(name="load", save_file=None, patterns_file=None)
+    junk = []
+    while not stop.is_set():
+        st = eng.get_status()
+        st["pattern_beats"] = list(eng.patterns[st["current_idx"]]["beats"])
+        json.dumps(st)
+        node = {"payload": [st] * 8}
+        node["self"] = node
+        junk.append(node)
+        if len(junk) > 500:
+            junk = []
+
+
+def run(measures, n_engines, seconds, n_load):
+    sched = scheduler.Scheduler(name="bench-rt")
+    sched.start()
+    for i in range(n_engines):
+        eng = engine.Engine(name=f"rt{i}", save_file=None, patterns_file=None)
+        eng.state["bpm"] = 90 + 11 * i
+        eng.state["current_idx"] = 1  # 8th-note grid: more ticks
+        eng.state["playing"] = True
+        eng.attach(sched)
+
+    results = realtime.enable(sched, measures) if measures else {}
+    for k in realtime.gc_stats:
+        realtime.gc_stats[k] = 0
+    stop = threading.Event()
+    loaders = [threading.Thread(target=_web_like_load, args=(stop,), daemon=True) for _ in range(n_load)]
+    for t in loaders:
+        t.start()
+
+    time.sleep(0.5)
+    sched.reset_metrics()
+    time.sleep(seconds)
+    stats = sched.lateness_stats()
+    gc_pause = realtime.gc_stats["max_pause_ms"]
+
+    stop.set()
+    for t in loaders:
+        t.join()
+    sched.stop()
+    if measures:
+        realtime.disable(sched)
+    return stats, results, gc_pause
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Realtime measures vs tick lateness")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    ap.add_argument("--engines", type=int, default=4)
+    ap.add_argument("--load", type=int, default=2, help="web-like load threads")
+    args = ap.parse_args()
+
+    print(f"{'config':10} {'ticks':>6} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'gc max ms':>9}  notes")
+    for label, measures in STEPS:
+        stats, results, gc_pause = run(measures, args.engines, args.seconds, args.load)
+        skipped = [m for m, r in results.items() if r.startswith("skipped")]
+        notes = ("skipped " + ",".join(skipped)) if skipped else ""
+        print(f"{label:10} {stats['count']:>6} {stats['mean_ms']:>8.3f} {stats['p50_ms']:>8.3f} "
+              f"{stats['p99_ms']:>8.3f} {stats['max_ms']:>8.3f} {gc_pause:>9.3f}  {notes}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# bench_scheduler.py
+#
+# Tick jitter vs number of metronome instances:
+#   heap    - every engine on one shared scheduler thread (what start_engine uses)
+#   threads - one scheduler thread per engine (the old thread-per-click layout)
+#
+#   python3 bench_scheduler.py                # 1..100 instances, both modes
+#   python3 bench_scheduler.py --seconds 5 --counts 1,10,50
+import argparse
+import time
+
+import engine
+import scheduler
+
+NULL_PORTS = 4  # engines share a few fake MIDI ports, like rooms sharing a USB hub
+
+
+def _make_engines(n, ports):
+    engines = []
+    for i in range(n):
+        eng = engine.Engine(name=f"bench{i}", save_file=None, patterns_file=None)
+        eng.state["bpm"] = 60 + (i * 7) % 180
+        eng.state["current_idx"] = i % len(eng.patterns)
+        eng.state["playing"] = True
+        eng._midi = ports[i % len(ports)]
+        engines.append(eng)
+    return engines
+
+
+def _merge_stats(scheds):
+    vals = []
+    count = 0
+    for s in scheds:
+        n = min(s.dispatched, scheduler.LATENESS_HISTORY)
+        vals.extend(s.lateness[:n])
+        count += s.dispatched
+    if not vals:
+        return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+    vals.sort()
+    n = len(vals)
+    return {
+        "count": count,
+        "mean_ms": 1000.0 * sum(vals) / n,
+        "p50_ms": 1000.0 * vals[n // 2],
+        "p99_ms": 1000.0 * vals[min(n - 1, (n * 99) // 100)],
+        "max_ms": 1000.0 * vals[-1],
+    }
+
+
+def run(mode, n, seconds, ports):
+    engines = _make_engines(n, ports)
+    if mode == "heap":
+        scheds = [scheduler.Scheduler(name="bench")]
+        for eng in engines:
+            eng.attach(scheds[0])
+    else:
+        scheds = []
+        for eng in engines:
+            s = scheduler.Scheduler(name=f"bench-{eng.name}")
+            eng.attach(s)
+            scheds.append(s)
+    for s in scheds:
+        s.start()
+    time.sleep(seconds)
+    for s in scheds:
+        s.stop()
+    return _merge_stats(scheds)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Scheduler jitter benchmark")
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--counts", default="1,2,5,10,20,50,100")
+    ap.add_argument("--modes", default="heap,threads")
+    args = ap.parse_args()
+
+    engine.get_mido()  # as init_midi would, before any engine has a port
+    ports = [scheduler.Sender(f"null{i}", lambda msg: None) for i in range(NULL_PORTS)]
+    counts = [int(c) for c in args.counts.split(",")]
+
+    print(f"{'mode':8} {'n':>4} {'ticks':>7} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode in args.modes.split(","):
+        for n in counts:
+            st = run(mode, n, args.seconds, ports)
+            print(f"{mode:8} {n:>4} {st['count']:>7} {st['mean_ms']:>8.3f} {st['p50_ms']:>8.3f} "
+                  f"{st['p99_ms']:>8.3f} {st['max_ms']:>8.3f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# bench_web.py
+#
+# How many phones can the web UI serve before the click suffers? Simulates N
+# browsers doing what the page does - /status every 100 ms, /accuracy every
+# second, the odd tap, pattern edits followed by a /patterns reload - against
+# drum_assist_web.py's app under the Flask dev server and waitress, while the
+# engine plays into a fake MIDI port in the same process (like on the Pi).
+#
+# Reports request latency percentiles, throughput, server CPU and the scheduler's
+# tick lateness for each N. Clients run in their own processes so they don't share
+# the server's GIL; on a one-core box they still share its CPU, so for real numbers
+# point them at an actual Pi with --url (lateness then comes from its /metrics).
+#
+#   python3 bench_web.py
+#   python3 bench_web.py --clients 1,10,25,50 --seconds 15 --server waitress
+#   python3 bench_web.py --longpoll                 # the page's ?since= long-poll instead
+#   python3 bench_web.py --url http://drumassist.local:5000 --clients 5,10,20
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+POLL = 0.1              # seconds between /status polls per browser
+TIMING_EVERY = 1.0      # /accuracy
+TAP_EVERY = 30.0        # seconds between tap-tempo bursts (4 taps at 120 BPM) per browser
+EDIT_RATE = 0.02        # pattern saves per second per browser
+PROBE = 0.005           # lateness probe period on the sequencer's scheduler
+TIMEOUT = 30.0
+ERROR_BACKOFF = 1.0     # the page's longPoll() waits this long after a failed request
+
+
+# ---- client side (runs in its own process) ----
+
+class Browser:
+    def __init__(self, url, rng, longpoll, results):
+        u = urlsplit(url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.base = u.path.rstrip("/")
+        self.rng = rng
+        self.longpoll = longpoll
+        self.results = results
+        self.conn = None
+        self.version = None
+
+    def request(self, label, method, path, body=None):
+        data = headers = None
+        if body is not None:
+            data = json.dumps(body)
+            headers = {"Content-Type": "application/json"}
+        t0 = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=TIMEOUT)
+            self.conn.request(method, self.base + path, data, headers or {})
+            resp = self.conn.getresponse()
+            payload = resp.read()
+            if resp.status >= 400:
+                raise OSError(f"HTTP {resp.status}")
+        except (OSError, http.client.HTTPException):
+            self.results["errors"] += 1
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+            return None
+        self.results["latency"].setdefault(label, []).append((time.perf_counter() - t0) * 1000.0)
+        return resp.status, payload, resp.getheader("Retry-After")
+
+    def run(self, end):
+        rng = self.rng
+        r = self.request("patterns", "GET", "/patterns")     # page load
+        patterns = json.loads(r[1]) if r else []
+        time.sleep(rng.random() * POLL)                      # browsers don't start in step
+        next_timing = time.monotonic() + rng.random() * TIMING_EVERY
+        taps = []
+        while time.monotonic() < end:
+            t = time.monotonic()
+            if self.longpoll and self.version is not None:
+                r = self.request("status?since", "GET", f"/status?since={self.version}&timeout=2")
+            else:
+                r = self.request("status", "GET", "/status")
+            if r and r[0] == 200:
+                self.version = json.loads(r[1]).get("version", self.version)
+
+            if t >= next_timing:
+                next_timing = t + TIMING_EVERY
+                self.request("accuracy", "GET", "/accuracy")
+            if not taps and rng.random() < POLL / TAP_EVERY:
+                taps = [t + 0.5 * i for i in range(4)]
+            if taps and t >= taps[0]:
+                taps.pop(0)
+                self.request("tap", "POST", "/tap")
+            if patterns and rng.random() < EDIT_RATE * POLL:
+                idx = rng.randrange(len(patterns))
+                p = patterns[idx]
+                text = lambda beats: " ".join(map(str, beats))
+                self.request("pattern/update", "POST", "/pattern/update",
+                             {"idx": idx, "name": p["name"], "main": text(p["beats"]),
+                              "fill": text(p["fill"]) if p.get("fill") else ""})
+                r = self.request("patterns", "GET", "/patterns")
+                if r:
+                    patterns = json.loads(r[1])
+
+            if not self.longpoll:
+                time.sleep(max(0.0, t + POLL - time.monotonic()))
+            elif r is None:
+                time.sleep(ERROR_BACKOFF)
+            elif r[2]:
+                # every long-poll slot taken: come back when the server says, like the page
+                time.sleep(float(r[2]))
+
+
+def run_clients(url, count, seconds, seed, longpoll):
+    results = {"latency": {}, "errors": 0}
+    end = time.monotonic() + seconds
+    browsers = [Browser(url, random.Random(seed + i), longpoll, results) for i in range(count)]
+    threads = [threading.Thread(target=b.run, args=(end,), daemon=True) for b in browsers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=seconds + TIMEOUT)
+    return results
+
+
+# ---- server side ----
+
+def _percentile(vals, q):
+    return vals[min(len(vals) - 1, int(len(vals) * q / 100.0))] if vals else 0.0
+
+
+class LocalServer:
+    """drum_assist_web's app plus a playing engine (fake MIDI port) in this process."""
+
+    def __init__(self, kind, threads):
+        import engine
+        import scheduler
+        import drum_assist_web
+
+        self.tmp = tempfile.mkdtemp(prefix="drumassist-bench-")
+        eng = engine.Engine(name="default", save_file=None,
+                            patterns_file=os.path.join(self.tmp, "patterns.json"))
+        eng.save_patterns()
+        eng.state.update(current_idx=1, bpm=120)   # 8ths: a tick every 250 ms
+        engine._default = eng
+        engine.print = lambda *a, **k: None        # keep "Tap Tempo: ..." out of the table
+        self.sched = scheduler.default_scheduler()
+        eng.attach(self.sched)
+        eng._midi = scheduler.Sender("fake-port", lambda msg: None)
+        eng._thread_started = True
+        eng.toggle_play()
+        # a fast periodic job next to the click, so each step has enough lateness samples
+        self.sched.at(scheduler.clock() + PROBE, lambda deadline, now: deadline + PROBE)
+
+        app = drum_assist_web.app
+        # one log line per request (werkzeug) or per queued task (waitress) would swamp the table
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        logging.getLogger("waitress").setLevel(logging.ERROR)
+        if kind == "flask":
+            from werkzeug.serving import make_server
+            self.server = make_server("127.0.0.1", 0, app, threaded=True)
+            port = self.server.server_port
+            target = self.server.serve_forever
+        else:
+            from waitress import create_server
+            self.server = create_server(app, host="127.0.0.1", port=0, threads=threads)
+            port = self.server.effective_port
+            target = self.server.run
+        self.kind = kind
+        self.url = f"http://127.0.0.1:{port}"
+        threading.Thread(target=target, daemon=True, name=f"bench-{kind}").start()
+
+    def reset(self):
+        self.sched.reset_metrics()
+        self.cpu0 = sum(os.times()[:2])
+        self.wall0 = time.monotonic()
+
+    def ticks(self):
+        import scheduler
+        s = self.sched
+        n = min(s.dispatched, scheduler.LATENESS_HISTORY)
+        vals = sorted(s.lateness[:n])
+        return {
+            "p50": _percentile(vals, 50) * 1000.0,
+            "p99": _percentile(vals, 99) * 1000.0,
+            "max": (vals[-1] if vals else 0.0) * 1000.0,
+            "over_1ms": sum(1 for v in vals if v > 0.001) / max(1, n) * 100.0,
+            "cpu": (sum(os.times()[:2]) - self.cpu0) / max(1e-9, time.monotonic() - self.wall0) * 100.0,
+        }
+
+    def close(self):
+        if self.kind == "flask":
+            self.server.shutdown()
+        else:
+            self.server.close()
+            self.server.task_dispatcher.shutdown()
+
+
+class RemoteServer:
+    """An already running DrumAssist (e.g. the Pi): lateness from its /metrics."""
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.kind = "remote"
+
+    def reset(self):
+        pass
+
+    def ticks(self):
+        # its last LATENESS_HISTORY dispatches, which may reach back before this step
+        u = urlsplit(self.url)
+        conn = http.client.HTTPConnection(u.hostname, u.port or 80, timeout=TIMEOUT)
+        conn.request("GET", u.path.rstrip("/") + "/metrics")
+        m = json.loads(conn.getresponse().read())
+        lat = m["lateness"]
+        if lat is None:
+            sys.exit(f"{self.url}/metrics: {m['error']}")
+        return {"p50": lat["p50_ms"], "p99": lat["p99_ms"], "max": lat["max_ms"],
+                "over_1ms": None, "cpu": None}
+
+    def close(self):
+        pass
+
+
+def step(server, n, args):
+    procs = max(1, min(n, args.client_procs))
+    per = [n // procs + (1 if i < n % procs else 0) for i in range(procs)]
+    cmd = [sys.executable, os.path.abspath(__file__), "--client", server.url,
+           "--seconds", str(args.seconds)] + (["--longpoll"] if args.longpoll else [])
+    server.reset()
+    start = time.monotonic()
+    children = [subprocess.Popen(cmd + ["--count", str(c), "--seed", str(1000 * i)],
+                                 stdout=subprocess.PIPE, text=True) for i, c in enumerate(per)]
+    latency = {}
+    errors = 0
+    for child in children:
+        out, _ = child.communicate(timeout=args.seconds + 2 * TIMEOUT)
+        r = json.loads(out or '{"latency": {}, "errors": 0}')
+        errors += r["errors"]
+        for label, vals in r["latency"].items():
+            latency.setdefault(label, []).extend(vals)
+    elapsed = time.monotonic() - start
+    ticks = server.ticks()
+
+    every = sorted(v for vals in latency.values() for v in vals)
+    status = sorted(latency.get("status?since" if args.longpoll else "status", []))
+    row = {
+        "clients": n,
+        "rps": len(every) / elapsed,
+        "p50": _percentile(every, 50), "p95": _percentile(every, 95),
+        "p99": _percentile(every, 99), "max": every[-1] if every else 0.0,
+        "status_p95": _percentile(status, 95),
+        "errors": errors,
+        "tick_p50": ticks["p50"], "tick_p99": ticks["p99"], "tick_max": ticks["max"],
+        "over_1ms": ticks["over_1ms"], "cpu": ticks["cpu"],
+    }
+    return row, latency
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Web UI load test: request latency and click jitter vs browsers")
+    ap.add_argument("--clients", default="1,5,10,25,50", help="browser counts to step through")
+    ap.add_argument("--seconds", type=float, default=10.0, help="per step")
+    ap.add_argument("--server", default="flask,waitress", help="flask, waitress or both")
+    ap.add_argument("--threads", type=int, default=4, help="waitress worker threads")
+    ap.add_argument("--client-procs", type=int, default=4, help="processes the browsers are spread over")
+    ap.add_argument("--longpoll", action="store_true", help="use /status?since= like the page does")
+    ap.add_argument("--url", help="load an already running DrumAssist instead of a local one")
+    ap.add_argument("--routes", action="store_true", help="also print latency per route")
+    # internal: one client process
+    ap.add_argument("--client", metavar="URL", help=argparse.SUPPRESS)
+    ap.add_argument("--count", type=int, default=1, help=argparse.SUPPRESS)
+    ap.add_argument("--seed", type=int, default=0, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.client:
+        print(json.dumps(run_clients(args.client, args.count, args.seconds, args.seed, args.longpoll)))
+        return
+
+    counts = [int(c) for c in args.clients.split(",")]
+    kinds = ["remote"] if args.url else [k.strip() for k in args.server.split(",")]
+    poll = "long-polled" if args.longpoll else f"every {POLL * 1000:.0f} ms"
+    print(f"{args.seconds:g} s per step, /status {poll}, {os.cpu_count()} CPU(s) here")
+    for kind in kinds:
+        server = RemoteServer(args.url) if kind == "remote" else LocalServer(kind, args.threads)
+        time.sleep(0.5)
+        print(f"\n{kind}" + (f" ({args.threads} threads)" if kind == "waitress" else "") + f"  {server.url}")
+        print(f"{'clients':>7} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>8} "
+              f"{'status p95':>10} {'errors':>6} | {'tick p50':>8} {'p99':>7} {'max ms':>7} {'>1ms %':>6} {'cpu %':>6}")
+        for n in counts:
+            row, latency = step(server, n, args)
+            over = f"{row['over_1ms']:>6.1f}" if row["over_1ms"] is not None else f"{'-':>6}"
+            cpu = f"{row['cpu']:>6.0f}" if row["cpu"] is not None else f"{'-':>6}"
+            print(f"{row['clients']:>7} {row['rps']:>7.0f} {row['p50']:>7.1f} {row['p95']:>7.1f} "
+                  f"{row['p99']:>7.1f} {row['max']:>8.1f} {row['status_p95']:>10.1f} {row['errors']:>6} | "
+                  f"{row['tick_p50']:>8.3f} {row['tick_p99']:>7.3f} {row['tick_max']:>7.3f} "
+                  f"{over} {cpu}", flush=True)
+            if args.routes:
+                for label, vals in sorted(latency.items()):
+                    vals.sort()
+                    print(f"{'':>9}{label:16} {len(vals):>6} req  p50 {_percentile(vals, 50):.1f}  "
+                          f"p95 {_percentile(vals, 95):.1f}  max {vals[-1]:.1f} ms")
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
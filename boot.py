@@ -0,0 +1,107 @@
+# boot.py
+#
+# Startup timing: how long heavy imports take and how long from process start
+# to "engine ready" and "startup complete". Entry points import this first.
+#
+#   DRUMASSIST_BOOT_REPORT=1 python3 drum_assist_web.py
+#
+# prints an `-X importtime`-style table once startup is complete (the engine boots
+# stopped, so that doesn't wait for anyone to press start) and appends one JSON line
+# per boot to boot_times.jsonl so it can be tracked. Marks that come later (MIDI
+# opening in the background, the first click after start) are printed as they happen.
+# For the full per-module picture use `python3 -X importtime drum_assist_web.py`.
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+
+REPORT_FILE = "boot_times.jsonl"
+ENABLED = os.environ.get("DRUMASSIST_BOOT_REPORT", "") not in ("", "0")
+
+_t0 = time.perf_counter()
+_wall0 = time.time()
+_imports = []   # (name, seconds, modules pulled in)
+_marks = []     # (label, seconds since start)
+_reported = False
+_lock = threading.Lock()
+
+
+def _process_age():
+    # seconds this process had already been alive when boot.py was imported
+    # (interpreter startup + anything imported before us). Linux only.
+    try:
+        with open("/proc/self/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        start_ticks = int(fields[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0.0
+
+
+_pre = _process_age()
+
+
+def elapsed():
+    return _pre + (time.perf_counter() - _t0)
+
+
+def timed_import(name):
+    """import_module(name), recording how long it took if it wasn't loaded yet."""
+    mod = sys.modules.get(name)
+    if mod is not None:
+        return mod
+    n0 = len(sys.modules)
+    t = time.perf_counter()
+    mod = importlib.import_module(name)
+    with _lock:
+        _imports.append((name, time.perf_counter() - t, len(sys.modules) - n0))
+    return mod
+
+
+def mark(label):
+    with _lock:
+        if any(lbl == label for lbl, _ in _marks):
+            return
+        t = elapsed()
+        _marks.append((label, t))
+        late = _reported
+    if not ENABLED:
+        return
+    if late:
+        print(f"boot: {label:<24} {t * 1000.0:10.1f} ms")
+    elif label == "startup complete":
+        report()
+
+
+def report(out=None):
+    global _reported
+    with _lock:
+        if _reported:
+            return
+        _reported = True
+        imports = list(_imports)
+        marks = list(_marks)
+    out = out or sys.stdout
+
+    print(f"boot: interpreter start before boot.py: {_pre * 1000.0:8.1f} ms", file=out)
+    print("boot: import time:   self [ms] | modules | package", file=out)
+    for name, secs, mods in imports:
+        print(f"boot: import time: {secs * 1000.0:10.1f} | {mods:7d} | {name}", file=out)
+    for label, t in marks:
+        print(f"boot: {label:<24} {t * 1000.0:10.1f} ms", file=out)
+
+    entry = {
+        "time": _wall0,
+        "argv0": os.path.basename(sys.argv[0]) if sys.argv else "",
+        "imports_ms": {name: round(secs * 1000.0, 2) for name, secs, _ in imports},
+        "marks_ms": {label: round(t * 1000.0, 2) for label, t in marks},
+    }
+    try:
+        with open(REPORT_FILE, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    except Exception as e:
+        print(f"Error saving boot report: {e}", file=out)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# calibrate_latency.py
+#
+# Measure MIDI output latency over a loopback: connect the MIDI output back to a
+# MIDI input (a cable from OUT to IN, or a device that echoes/thru's what it gets),
+# then
+#
+#   python3 calibrate_latency.py                     # measure and suggest a midi offset
+#   python3 calibrate_latency.py --apply             # ...and save it in the settings
+#   python3 calibrate_latency.py --out "USB MIDI" --in "USB MIDI" --count 100
+#
+# Each probe note goes out through the same port sender the click uses and is
+# timed until it comes back. Half the median round trip is the output's share;
+# the pad's own trigger-to-sound time comes on top of that (add it by hand with
+# --extra if you know it).
+import argparse
+import sys
+import threading
+import time
+
+import engine
+import scheduler
+
+clock = scheduler.clock
+
+PROBE_NOTE = 127        # well away from anything a kit plays
+PROBE_CHANNEL = 15
+TIMEOUT = 0.5
+
+
+def _pick(names, match, hints=("USB", "Alesis", "SamplePad")):
+    if match:
+        found = [n for n in names if match in n]
+        if not found:
+            raise SystemExit(f"No port matching '{match}' in: {', '.join(names) or 'none'}")
+        return found[0]
+    found = [n for n in names if any(h in n for h in hints)]
+    if found:
+        return found[0]
+    if not names:
+        raise SystemExit("No MIDI ports found")
+    return names[0]
+
+
+def measure(out_name, in_name, count, gap):
+    mido = engine.get_mido()
+    sender = scheduler.port_sender(out_name, mido.open_output)
+    got = threading.Event()
+    arrived = [0.0]
+
+    def on_message(msg):
+        t = clock()
+        if msg.type == "note_on" and msg.note == PROBE_NOTE and msg.channel == PROBE_CHANNEL:
+            arrived[0] = t
+            got.set()
+
+    inport = mido.open_input(in_name, callback=on_message)
+    on = mido.Message("note_on", note=PROBE_NOTE, velocity=1, channel=PROBE_CHANNEL)
+    off = mido.Message("note_off", note=PROBE_NOTE, velocity=0, channel=PROBE_CHANNEL)
+    rtts = []
+    lost = 0
+    try:
+        for _ in range(count):
+            got.clear()
+            sent = clock()
+            sender.put(on)
+            if got.wait(TIMEOUT):
+                rtts.append(arrived[0] - sent)
+            else:
+                lost += 1
+            sender.put(off)
+            time.sleep(gap)
+    finally:
+        inport.close()
+    return rtts, lost
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Measure MIDI loopback latency and suggest an offset")
+    ap.add_argument("--out", dest="out_port", help="MIDI output name to match")
+    ap.add_argument("--in", dest="in_port", help="MIDI input name to match")
+    ap.add_argument("--count", type=int, default=50)
+    ap.add_argument("--gap", type=float, default=0.05, help="seconds between probes")
+    ap.add_argument("--extra", type=float, default=0.0, help="ms to add (e.g. the pad's own trigger latency)")
+    ap.add_argument("--apply", action="store_true", help="save the suggested midi offset in the settings")
+    args = ap.parse_args()
+
+    mido = engine.get_mido()
+    out_name = _pick(mido.get_output_names(), args.out_port)
+    in_name = _pick(mido.get_input_names(), args.in_port)
+    print(f"Loopback: {out_name} -> {in_name}, {args.count} probes")
+
+    rtts, lost = measure(out_name, in_name, args.count, args.gap)
+    if not rtts:
+        print("Nothing came back - check the loopback connection.")
+        return 1
+    rtts.sort()
+    ms = [r * 1000.0 for r in rtts]
+    median = ms[len(ms) // 2]
+    print(f"round trip (ms): min {ms[0]:.2f}  median {median:.2f}  "
+          f"p90 {ms[min(len(ms) - 1, len(ms) * 9 // 10)]:.2f}  max {ms[-1]:.2f}  lost {lost}")
+    print(f"jitter (p90 - min): {ms[min(len(ms) - 1, len(ms) * 9 // 10)] - ms[0]:.2f} ms")
+
+    suggested = round(median / 2.0 + args.extra, 1)
+    print(f"Suggested midi offset: {suggested:+.1f} ms")
+    if args.apply:
+        engine.load_patterns()
+        engine.load_state()
+        engine.set_offsets(midi=suggested)
+        print("Saved. Restart DrumAssist to use it.")
+    else:
+        print(f"Run with --apply to save it (then restart DrumAssist), or POST {{\"midi\": {suggested}}} to /offsets.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# check_alloc.py
+#
+# Regression check: the sequencer's tick path must not allocate in steady state.
+# Drives an engine (MIDI out, beat callback, note-off slot, scheduler heap) through
+# thousands of ticks on a simulated clock and, under tracemalloc, measures the peak
+# memory of every single dispatch - so a temporary list or dict that's freed again
+# before the tick ends counts too. Senders are stubbed (nothing queued, no threads),
+# so the result doesn't depend on timing.
+#
+# The one allocation Python can't avoid: bumping a step counter past 256 makes a new
+# int (there's no free list for them). That floor is measured first, from a bare
+# counter bump; a dispatch that peaks above it fails. Runs once with a plain pattern
+# and once with a layered one (layers.py).
+#
+#   python3 check_alloc.py            # exit status 1 on failure
+import collections
+import gc
+import sys
+import tracemalloc
+
+import engine
+import scheduler
+
+WARMUP = 2000
+TICKS = 10000
+
+LAYERS = [{"sound": "cowbell", "beats": [1, 2, 2]},          # 3 over the bar
+          {"sound": "subdiv", "beats": [2] * 16},             # 16ths
+          {"sound": 60, "beats": [1, 0, 2], "div": 4}]        # 3-step cycle on quarters
+
+
+class _Null:
+    # stands in for a Sender: put() swallows the item in C, no queue, no thread
+    put = collections.deque(maxlen=0).append
+
+
+class _Counter:
+    __slots__ = ("n",)
+
+    def __init__(self):
+        self.n = 1 << 20
+
+    def bump(self):
+        self.n = self.n + 1
+
+
+def _peak(fn, *args):
+    # bytes above the starting point at the busiest moment of fn(*args)
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn(*args)
+    return tracemalloc.get_traced_memory()[1] - start
+
+
+def check(layered):
+    eng = engine.Engine(name="alloc", save_file=None, patterns_file=None)
+    eng.state["current_idx"] = 1   # 8ths with rests: accent, rest and click ticks
+    eng.state["playing"] = True
+    if layered:
+        engine._with_layers(eng.patterns[1], LAYERS)
+    eng._midi = _Null()
+
+    sched = scheduler.Scheduler(name="alloc-check")   # never started: we drive it
+    eng.attach(sched)
+    eng._callback = _Null()
+    heap = sched._heap
+    counter = _Counter()
+
+    # warm up under tracemalloc, so its own first-use allocations are behind us
+    gc.collect()
+    gc.disable()
+    tracemalloc.start()
+    for _ in range(WARMUP):
+        _peak(sched.dispatch_due, heap[0][0])
+        _peak(counter.bump)
+    floor = max(_peak(counter.bump) for _ in range(100))
+
+    start = tracemalloc.get_traced_memory()[0]
+    gc0 = gc.get_count()[0]
+    worst = 0
+    over = 0
+    for _ in range(TICKS):
+        peak = _peak(sched.dispatch_due, heap[0][0])
+        if peak > floor:
+            over += 1
+        if peak > worst:
+            worst = peak
+    growth = tracemalloc.get_traced_memory()[0] - start
+    gc_growth = gc.get_count()[0] - gc0
+    tracemalloc.stop()
+    gc.enable()
+
+    print(f"{'layered' if layered else 'plain'} pattern, ticks: {TICKS} (after {WARMUP} warm-up)")
+    print(f"peak per dispatch: {worst} bytes (a counter bump: {floor}), "
+          f"dispatches above that: {over}")
+    print(f"live memory growth: {growth} bytes, GC-tracked object growth: {gc_growth}")
+    return over == 0 and growth <= floor and gc_growth <= 0
+
+
+def main():
+    ok = check(False)
+    ok = check(True) and ok
+    print("OK" if ok else "FAIL: tick path allocates in steady state")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# check_offsets.py
+#
+# Regression check for latency offsets: every output's copy of every beat must go
+# out at its own deadline - offset, even when offsets are bigger than a step (a copy
+# still waiting when the next step ticks) and notes overlap their note_off.
+# Drives an engine on a simulated clock and compares the times each MIDI message,
+# beat callback and status update went out with the times they were due.
+#
+#   python3 check_offsets.py            # exit status 1 on failure
+import sys
+
+import engine
+import scheduler
+
+STEPS = 200
+TOLERANCE = 1e-9
+# MIDI 100 ms late, web 100 ms early: 200 ms apart, more than a step at 200 BPM 8ths
+OFFSETS = {"midi": -100, "web": 100, "led": 30}
+BPM = 200
+PATTERN = 2       # 6/8 in 8ths: a note on every step
+LAYERS = [{"sound": "cowbell", "beats": [1, 2, 2]},
+          {"sound": "subdiv", "beats": [2] * 16}]
+
+
+class _Clock:
+    now = 0.0
+
+
+class _Out:
+    # stands in for a Sender: records (simulated time, item)
+    def __init__(self, clock):
+        self.clock = clock
+        self.sent = []
+
+    def put(self, item):
+        self.sent.append((self.clock.now, item))
+
+
+def check(layered):
+    clock = _Clock()
+    eng = engine.Engine(name="offsets", save_file=None, patterns_file=None)
+    eng.state.update(current_idx=PATTERN, bpm=BPM, playing=True)
+    if layered:
+        engine._with_layers(eng.patterns[PATTERN], LAYERS)
+    eng._apply_offsets(OFFSETS)
+    eng._midi = _Out(clock)
+
+    sched = scheduler.Scheduler(name="offsets-check")   # never started: we drive it
+    eng.attach(sched)
+    eng._callback = _Out(clock)
+    published = []
+    eng._publish = lambda beat_type, step, pos: published.append((clock.now, step))
+
+    # what should go out when, from each step's own deadline
+    want_on, want_cb, want_pub, deadlines = [], [], [], []
+    grid = eng.patterns[PATTERN].get("grid")
+
+    def expect(model):
+        # a copy whose time has already passed when the step ticks (the very first
+        # step) goes out right away
+        deadline, interval, abs_step, step = model[:4]
+        due = lambda sink: max(clock.now, deadline - eng.offsets[sink])
+        beat_type = eng.patterns[PATTERN]["beats"][step]
+        midi_at = due("midi")
+        if grid is not None:
+            pos = abs_step % grid.steps
+            if grid.on[pos][beat_type] is not None:
+                want_on.append(midi_at)
+            want_on.extend(midi_at + frac * interval for frac, _ in grid.between[pos])
+        elif beat_type:
+            want_on.append(midi_at)
+        want_cb.append(due("led"))
+        want_pub.append((due("web"), step))
+        deadlines.append(deadline)
+    eng.add_tick_listener(expect)
+
+    heap = sched._heap
+    while eng._ticks < STEPS:
+        clock.now = heap[0][0]
+        sched.dispatch_due(clock.now)
+    # let the last steps' copies go out
+    end = clock.now + 1.0
+    while heap and heap[0][0] <= end and (eng._ticks == STEPS or heap[0][2] is not eng._job):
+        if heap[0][2] is eng._job:
+            eng.state["playing"] = False
+        clock.now = heap[0][0]
+        sched.dispatch_due(clock.now)
+
+    # a burst (layers) is one item: count it once, at its time
+    first = [(t, m[0] if type(m) is tuple else m) for t, m in eng._midi.sent]
+    ons = [t for t, m in first if m.type == "note_on"]
+    offs = [t for t, m in first if m.type == "note_off"]
+    got_cb = [t for t, _ in eng._callback.sent]
+
+    def same(got, want):
+        return len(got) == len(want) and all(abs(a - b) <= TOLERANCE for a, b in zip(got, want))
+
+    def ms(ts, t0):
+        return ", ".join(f"{(t - t0) * 1000.0:.0f}" for t in ts[:8])
+
+    t0 = deadlines[0]
+    results = [
+        ("midi note_on", same(ons, sorted(want_on)), ms(ons, t0), ms(sorted(want_on), t0)),
+        # each note held NOTE_ON_TIME, or released early by the next one
+        ("midi note_off", len(offs) == len(ons) and all(
+            abs(off - min(on + engine.NOTE_ON_TIME, nxt)) <= TOLERANCE
+            for on, off, nxt in zip(ons, offs, ons[1:] + [float("inf")])), ms(offs, t0), ""),
+        ("callback (led)", same(got_cb, want_cb), ms(got_cb, t0), ms(want_cb, t0)),
+        ("status (web)", published == want_pub,
+         ms([t for t, _ in published], t0), ms([t for t, _ in want_pub], t0)),
+    ]
+    print(f"{'layered' if layered else 'plain'} pattern, {BPM} BPM 8ths, offsets "
+          + ", ".join(f"{k} {v:+d} ms" for k, v in OFFSETS.items()))
+    ok = True
+    for name, good, got, want in results:
+        print(f"  {name:15} {'ok' if good else 'WRONG'}")
+        if not good:
+            print(f"    sent at (ms): {got}")
+            if want:
+                print(f"    due at (ms):  {want}")
+        ok = ok and good
+    return ok
+
+
+def main():
+    ok = check(False)
+    ok = check(True) and ok
+    print("OK" if ok else "FAIL: outputs don't go out at deadline - offset")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
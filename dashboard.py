@@ -0,0 +1,249 @@
+# dashboard.py
+#
+# Terminal dashboard for laptop mode. Its own thread redraws at a fixed frame rate
+# from engine.get_status() snapshots, so a slow terminal or SSH session only ever
+# slows the dashboard, never the click. Frames with nothing new are skipped and
+# only the cells that changed are written.
+#
+# While it runs, print() output (pattern changes, tap tempo, MIDI messages) is
+# collected and shown in the bottom lines instead of scrolling over the screen.
+import collections
+import sys
+import threading
+
+import scheduler
+
+clock = scheduler.clock
+
+FPS = 20
+METRICS_EVERY = 1.0      # seconds between lateness/accuracy refreshes (they sort/copy)
+LOG_LINES = 4
+
+KEYS = {
+    ord(" "): "tap",
+    10: "start", 13: "start",
+    ord("n"): "pattern", ord("N"): "pattern",
+    ord("f"): "fill", ord("F"): "fill",
+    ord("+"): "bpm_up", ord("="): "bpm_up",
+    ord("-"): "bpm_down",
+}
+
+
+def available():
+    try:
+        import curses  # noqa: F401  (windows-curses on Windows)
+    except ImportError:
+        return False
+    return sys.stdin.isatty() and sys.stdout.isatty()
+
+
+class _Log:
+    """Stand-in for sys.stdout while curses owns the terminal."""
+
+    def __init__(self):
+        self.lines = collections.deque(maxlen=LOG_LINES)
+        self.version = 0
+        self._partial = ""
+
+    def write(self, s):
+        s = self._partial + s.replace("\r", "\n")
+        *done, self._partial = s.split("\n")
+        for line in done:
+            line = line.replace("\033[K", "").strip()
+            if line:
+                self.lines.append(line)
+                self.version += 1
+        return len(s)
+
+    def flush(self):
+        pass
+
+
+def _step_cells(beats, step):
+    # " A  .  x " with the current step's cell marked for reverse video
+    text = "".join(f" {'A' if b == 1 else ('x' if b == 2 else '.')} " for b in beats)
+    return text, (step * 3, step * 3 + 3)
+
+
+class Dashboard:
+    """
+    eng: the engine module (or an Engine). inp: an inputs.InputQueue for keys
+    typed into the terminal; None when keys arrive some other way (keyboard hooks),
+    in which case only Q is read here.
+    """
+
+    def __init__(self, eng, inp=None, fps=FPS):
+        self.engine = eng
+        self.inp = inp
+        self.frame = 1.0 / fps
+        self.done = threading.Event()
+        self._thread = None
+        self._screen = []          # what's on the terminal: [(text, highlight span)]
+        self._log = _Log()
+        self._metrics = ""
+        self._timing = ""
+        self.frames = 0            # frames actually drawn (vs. skipped as unchanged)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._main, daemon=True, name="dashboard")
+        self._thread.start()
+        return self
+
+    def wait(self):
+        self.done.wait()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _main(self):
+        import curses
+        real_stdout = sys.stdout
+        sys.stdout = self._log
+        try:
+            curses.wrapper(self._loop)
+        except Exception as e:
+            sys.stdout = real_stdout
+            print(f"Dashboard error: {e}")
+        finally:
+            sys.stdout = real_stdout
+            self.done.set()
+
+    # ---- content ----
+
+    def _refresh_metrics(self):
+        eng = self.engine
+        try:
+            m = eng.metrics()
+            lat = m["lateness"]
+            if lat is None:   # the click runs in the sequencer process
+                self._metrics = f"Click lateness {m['error']}"
+            else:
+                self._metrics = (f"Click lateness  p50 {lat['p50_ms']:.2f} ms  p99 {lat['p99_ms']:.2f} ms  "
+                                 f"max {lat['max_ms']:.2f} ms  ({lat['count']} ticks)")
+        except Exception:
+            self._metrics = ""
+        try:
+            acc = eng.accuracy_summary()
+        except Exception:
+            acc = {"enabled": False}
+        if acc.get("enabled"):
+            import accuracy
+            self._timing = accuracy.format_summary(acc)
+        else:
+            self._timing = ""
+
+    def _lines(self, st):
+        eng = self.engine
+        patterns = eng.PATTERNS if hasattr(eng, "PATTERNS") else eng.patterns
+        p = patterns[st["current_idx"] if st["current_idx"] < len(patterns) else 0]
+        fill_on = st["fill_active_bars"] > 0 and p.get("fill")
+        beats = p["fill"] if fill_on else p["beats"]
+        steps, span = _step_cells(beats, st["step"] if st["playing"] else -1)
+
+        if not st["has_fill"]:
+            fill = "Fill: none for this pattern"
+        elif fill_on:
+            fill = f"Fill: PLAYING ({st['fill_active_bars']} bar(s) left, {st['fill_pending_bars']} queued)"
+        elif st["fill_pending_bars"]:
+            fill = f"Fill: {st['fill_pending_bars']} bar(s) from the next bar"
+        else:
+            fill = "Fill: ready (F)"
+
+        lines = [
+            ("DRUM ASSISTANT - LAPTOP MODE", None),
+            ("", None),
+            (f"{'PLAYING' if st['playing'] else 'STOPPED':8}  {st['bpm']:3d} BPM   "
+             f"{st['current_idx'] + 1}/{len(patterns)} {st['pattern_name']}", None),
+            ("", None),
+            (steps, span if st["playing"] else None),
+            ("", None),
+            (fill, None),
+            (self._metrics, None),
+            (self._timing, None),
+            ("", None),
+            ("SPACE tap  ENTER start/stop  N next pattern  F fill  +/- bpm  Q quit", None),
+            ("", None),
+        ]
+        lines.extend((line, None) for line in self._log.lines)
+        return lines
+
+    # ---- drawing ----
+
+    def _draw(self, win, lines):
+        import curses
+        height, width = win.getmaxyx()
+        old = self._screen
+        for y, (text, span) in enumerate(lines[:height]):
+            text = text[:width - 1]
+            prev = old[y] if y < len(old) else ("", None)
+            if prev == (text, span):
+                continue
+            if span != prev[1]:
+                # highlight moved: redraw the whole row
+                start, end = 0, max(len(text), len(prev[0]))
+            else:
+                # only the cells between the first and last difference
+                a, b = prev[0], text
+                n = max(len(a), len(b))
+                a, b = a.ljust(n), b.ljust(n)
+                start = next(i for i in range(n) if a[i] != b[i])
+                end = n - next(i for i in range(n) if a[n - 1 - i] != b[n - 1 - i])
+            seg = text.ljust(end)[start:end]
+            win.addstr(y, start, seg)
+            if span is not None:
+                lo, hi = max(span[0], start), min(span[1], end, width - 1)
+                if lo < hi:
+                    win.chgat(y, lo, hi - lo, curses.A_REVERSE)
+        for y in range(len(lines), min(len(old), height)):
+            win.move(y, 0)
+            win.clrtoeol()
+        self._screen = [(t[:width - 1], s) for t, s in lines[:height]]
+        win.noutrefresh()
+        curses.doupdate()
+        self.frames += 1
+
+    def _loop(self, win):
+        import curses
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        win.clear()
+        last_key = None
+        next_metrics = 0.0
+        next_frame = clock()
+        size = win.getmaxyx()
+        while True:
+            now = clock()
+            if now >= next_metrics:
+                self._refresh_metrics()
+                next_metrics = now + METRICS_EVERY
+            st = self.engine.get_status()
+            key = (st, self._metrics, self._timing, self._log.version)
+            if win.getmaxyx() != size:
+                size = win.getmaxyx()
+                win.clear()
+                self._screen = []
+                last_key = None
+            if key != last_key:   # coalesce: nothing new, nothing drawn
+                last_key = key
+                self._draw(win, self._lines(st))
+
+            # wait for the next frame in getch(), so keys are picked up (and stamped)
+            # as soon as they're typed rather than once per frame
+            next_frame += self.frame
+            if next_frame < clock():
+                next_frame = clock() + self.frame   # fell behind: skip, don't burst
+            while True:
+                remaining = next_frame - clock()
+                if remaining <= 0:
+                    break
+                win.timeout(max(1, int(remaining * 1000)))
+                ch = win.getch()
+                if ch == -1:
+                    continue
+                t = clock()
+                if ch in (ord("q"), ord("Q")):
+                    return
+                event = KEYS.get(ch)
+                if event and self.inp is not None:
+                    self.inp.press(event, t)
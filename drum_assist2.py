@@ -1,14 +1,11 @@
 # drum_assist2.py
 import time
 
-try:
-    from gpiozero import Button, LED
-    GPIO_AVAILABLE = True
-except (ImportError, RuntimeError):
-    GPIO_AVAILABLE = False
-    print("GPIO not available - buttons/LEDs disabled")
-
+import boot
 import engine
+import inputs
+
+GPIO_AVAILABLE = False
 
 # GPIO pins (same as your current file)
 PIN_START = 17   # Red
@@ -19,6 +16,7 @@ PIN_STATUS_LED = 23
 
 led_beat = None
 led_status = None
+btn_start = btn_tap = btn_next = None
 
 
 def beat_led_callback(beat_type, is_accent):
@@ -40,24 +38,40 @@ def set_status_led(on: bool):
         led_status.off()
 
 
-if GPIO_AVAILABLE:
-    btn_start = Button(PIN_START)
-    btn_tap = Button(PIN_TAP)
-    btn_next = Button(PIN_NEXT)
+def _after_input(event):
+    if event == "start":
+        set_status_led(engine.get_status()["playing"])
+
 
-    led_beat = LED(PIN_BEAT_LED)
-    led_status = LED(PIN_STATUS_LED)
+def setup_gpio():
+    # gpiozero + pin factory probing is slow on a Pi Zero, so this runs after the
+    # engine is already up.
+    global GPIO_AVAILABLE, led_beat, led_status, btn_start, btn_tap, btn_next
+    try:
+        gpiozero = boot.timed_import("gpiozero")
+        btn_start = gpiozero.Button(PIN_START)
+        btn_tap = gpiozero.Button(PIN_TAP)
+        btn_next = gpiozero.Button(PIN_NEXT)
+
+        led_beat = gpiozero.LED(PIN_BEAT_LED)
+        led_status = gpiozero.LED(PIN_STATUS_LED)
+    except Exception as e:
+        print(f"GPIO not available - buttons/LEDs disabled ({e})")
+        return
 
-    def _startstop():
-        engine.handle_start()
-        set_status_led(engine.state["playing"])
+    # callbacks only timestamp the edge; the input worker talks to the engine
+    inp = inputs.InputQueue(engine, after=_after_input)
+    btn_start.when_pressed = inp.handler("start")
+    btn_tap.when_pressed = inp.handler("tap")
+    btn_next.when_pressed = inp.handler("next")
+    GPIO_AVAILABLE = True
+    boot.mark("gpio ready")
 
-    btn_start.when_pressed = _startstop
-    btn_tap.when_pressed = engine.handle_tap
-    btn_next.when_pressed = engine.next_button_action
 
 if __name__ == "__main__":
     engine.start_engine(beat_callback=beat_led_callback)
+    setup_gpio()
+    engine.startup_complete()
     st = engine.get_status()
     print(f"Drum Assistant Ready! Pattern: {st['pattern_name']}, BPM: {st['bpm']}")
     print("Red button: Start/Stop, Blue button: Tap Tempo, White button: Next Pattern")
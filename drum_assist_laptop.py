@@ -2,21 +2,44 @@
 import time
 import threading
 
+import boot
+import dashboard
 import engine
+import inputs
 
-try:
-    import keyboard
-    KEYBOARD_AVAILABLE = True
-except ImportError:
-    KEYBOARD_AVAILABLE = False
+keyboard = None
+KEYBOARD_AVAILABLE = False
 
 
-def visual_beat(beat_type, is_accent):
-    # simple terminal flash
-    if beat_type == 1:
-        print("\r\033[K▮▮▮▮▮ BEAT 1 ▮▮▮▮▮", end="", flush=True)
-    elif beat_type == 2:
-        print("\r\033[K▯▯ • ▯▯", end="", flush=True)
+def load_keyboard():
+    global keyboard, KEYBOARD_AVAILABLE
+    try:
+        keyboard = boot.timed_import("keyboard")
+        KEYBOARD_AVAILABLE = True
+    except ImportError:
+        KEYBOARD_AVAILABLE = False
+
+
+def plain_display():
+    # no curses (not a terminal, or Windows without windows-curses): one status line,
+    # redrawn from its own thread at most every 50 ms, only when something changed
+    import accuracy
+    last = None
+    last_bar = None
+    while True:
+        time.sleep(0.05)
+        st = engine.get_status()
+        if st["playing"] and (st["beat_count"], st["last_beat_type"]) != last:
+            last = (st["beat_count"], st["last_beat_type"])
+            if st["last_beat_type"] == 1:
+                print("\r\033[K▮▮▮▮▮ BEAT 1 ▮▮▮▮▮", end="", flush=True)
+            elif st["last_beat_type"] == 2:
+                print("\r\033[K▯▯ • ▯▯", end="", flush=True)
+        acc = engine.accuracy_summary()
+        if acc["enabled"] and acc["bars"] and acc["bars"][-1]["bar"] != last_bar:
+            # one line per finished bar when listening to the pads (DRUMASSIST_LISTEN)
+            last_bar = acc["bars"][-1]["bar"]
+            print("\r\033[K" + accuracy.format_summary(acc), flush=True)
 
 
 def print_header():
@@ -26,13 +49,38 @@ def print_header():
     print("=" * 60)
     print(f"Pattern: {st['pattern_name']}")
     print(f"BPM: {st['bpm']}")
-    print("Controls: SPACE=tap, ENTER=start/stop, N=next pattern, +/- bpm, Q=quit")
+    print("Controls: SPACE=tap, ENTER=start/stop, N=next pattern, F=fill, +/- bpm, Q=quit")
     print("=" * 60 + "\n")
 
 
+def register_keys(inp):
+    keyboard.on_press_key("space", inp.key_handler("tap"))
+    keyboard.on_press_key("enter", inp.key_handler("start"))
+    keyboard.on_press_key("n", inp.key_handler("pattern"))
+    keyboard.on_press_key("f", inp.key_handler("fill"))
+    keyboard.on_press_key("+", inp.key_handler("bpm_up"))
+    keyboard.on_press_key("-", inp.key_handler("bpm_down"))
+
+
 def main():
-    engine.start_engine(beat_callback=visual_beat)
+    # no beat callback: the display reads state snapshots from its own thread
+    engine.start_engine()
+    engine.set_sinks(status="terminal")
+    load_keyboard()
+    engine.startup_complete()
+
+    inp = inputs.InputQueue(engine)
+
+    if dashboard.available():
+        if KEYBOARD_AVAILABLE:
+            # global hooks give better tap timestamps; the dashboard only reads Q
+            register_keys(inp)
+        dash = dashboard.Dashboard(engine, None if KEYBOARD_AVAILABLE else inp).start()
+        dash.wait()
+        return
+
     print_header()
+    threading.Thread(target=plain_display, daemon=True).start()
 
     if not KEYBOARD_AVAILABLE:
         print("Install 'keyboard' for best control: pip install keyboard")
@@ -41,23 +89,20 @@ def main():
             if cmd in ("q", "quit", "exit"):
                 break
             if cmd in ("tap", "t"):
-                engine.handle_tap()
+                inp.press("tap")
             elif cmd in ("start", "stop", "s"):
-                engine.handle_start()
+                inp.press("start")
             elif cmd in ("next", "n"):
-                engine.next_pattern()
+                inp.press("pattern")
+            elif cmd in ("fill", "f"):
+                inp.press("fill")
             elif cmd in ("+", "up"):
-                engine.adjust_bpm(5)
+                inp.press("bpm_up")
             elif cmd in ("-", "down"):
-                engine.adjust_bpm(-5)
+                inp.press("bpm_down")
         return
 
-    keyboard.on_press_key("space", lambda _: engine.handle_tap())
-    keyboard.on_press_key("enter", lambda _: engine.handle_start())
-    keyboard.on_press_key("n", lambda _: engine.next_pattern())
-    keyboard.on_press_key("+", lambda _: engine.adjust_bpm(5))
-    keyboard.on_press_key("-", lambda _: engine.adjust_bpm(-5))
-
+    register_keys(inp)
     while True:
         if keyboard.is_pressed("q"):
             break
@@ -1,8 +1,32 @@
-from flask import Flask, render_template_string, request, jsonify
+import os
+import threading
+from collections import OrderedDict
+
+import boot
 import engine
 
+if __name__ == "__main__":
+    # get the click running before paying for Flask's import (seconds on a Pi Zero)
+    engine.start_engine()
+
+boot.timed_import("flask")
+from flask import Flask, render_template_string, request, jsonify, abort, make_response
+
 app = Flask(__name__)
 
+LONGPOLL_TIMEOUT = 25.0   # seconds a /status?since= request is held open
+LONGPOLL_MAX = 60.0
+# long-polls held open at once (each one ties up a server thread); keep this below
+# the server's thread count - waitress has 4 unless given --threads
+LONGPOLL_WAITERS = int(os.environ.get("DRUMASSIST_LONGPOLL_WAITERS", "2"))
+LONGPOLL_BUSY_RETRY = 0.25   # seconds (Retry-After) before a browser without a slot asks again
+SNAPSHOT_HISTORY = 32
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+_parked = 0               # long-polls waiting right now, all rooms
+_parked_lock = threading.Lock()
+
 HTML = r"""
 <!doctype html>
 <html>
@@ -91,6 +115,7 @@ HTML = r"""
 
       <div id="pattern"></div>
       <div class="msg" id="fillInfo"></div>
+      <div class="small" id="timing" style="text-align:center;"></div>
     </div>
 
     <div class="editor">
@@ -117,7 +142,10 @@ HTML = r"""
 </div>
 
 <script>
+const BASE = "{{ base }}";
 let lastBeatCount = -1;
+let statusCache = {};
+let statusVersion = null;
 let patternsCache = [];
 let currentIdx = 0;
 
@@ -165,7 +193,7 @@ function loadPatternToEditor(i){
 }
 
 async function fetchPatterns(){
-  const r = await fetch('/patterns');
+  const r = await fetch(BASE + '/patterns');
   patternsCache = await r.json();
   renderTable(patternsCache, currentIdx);
 }
@@ -179,7 +207,7 @@ async function savePattern(){
     main: document.getElementById('editMain').value,
     fill: document.getElementById('editFill').value
   };
-  const r = await fetch('/pattern/update', {
+  const r = await fetch(BASE + '/pattern/update', {
     method:'POST',
     headers:{'Content-Type':'application/json'},
     body: JSON.stringify(payload)
@@ -233,21 +261,65 @@ function updateUI(data) {
   }
 }
 
+function applyStatus(data) {
+  // full payloads replace, deltas ({delta:true}) only carry changed fields
+  statusCache = data.delta ? Object.assign(statusCache, data) : data;
+  statusVersion = data.version;
+  updateUI(statusCache);
+}
+
 async function poll() {
-  const r = await fetch('/status');
-  updateUI(await r.json());
+  const r = await fetch(BASE + '/status');
+  applyStatus(await r.json());
+}
+
+async function longPoll() {
+  // held open by the server until something changes; 304 = nothing happened
+  for (;;) {
+    try {
+      const url = BASE + '/status' + (statusVersion === null ? '' : '?since=' + statusVersion);
+      const r = await fetch(url);
+      if (r.status === 200) applyStatus(await r.json());
+      // every long-poll slot taken: the server answered straight away, so come back later
+      const retry = r.headers.get('Retry-After');
+      if (retry) await new Promise(res => setTimeout(res, retry * 1000));
+    } catch (e) {
+      await new Promise(res => setTimeout(res, 1000));
+    }
+  }
+}
+
+async function pollTiming() {
+  // drummer vs click; the route says enabled:false when nobody is listening
+  try {
+    const r = await fetch(BASE + '/accuracy');
+    const a = await r.json();
+    if (!a.enabled) return;
+    const el = document.getElementById('timing');
+    if (a.hits) {
+      const beats = a.positions.map(p => `${p.step + 1}: ${p.mean_ms >= 0 ? '+' : ''}${p.mean_ms.toFixed(0)}`).join('  ');
+      const bar = a.bars.length ? ` · last bar ${a.bars[a.bars.length - 1].mean_abs_ms.toFixed(1)} ms off` : '';
+      el.textContent = `Timing ${a.mean_ms >= 0 ? '+' : ''}${a.mean_ms.toFixed(1)} ms (${a.tendency}), ` +
+                       `SD ${a.sd_ms.toFixed(1)} ms${bar} | ${beats}`;
+    } else {
+      el.textContent = 'Timing: no hits yet';
+    }
+    setTimeout(pollTiming, statusCache.playing ? 1000 : 3000);
+  } catch (e) {
+    setTimeout(pollTiming, 3000);
+  }
 }
 
-function togglePlay() { fetch('/toggle').then(r=>r.json()).then(updateUI); }
-function tap() { fetch('/tap', {method:'POST'}).then(r=>r.json()).then(updateUI); }
+function togglePlay() { fetch(BASE + '/toggle').then(r=>r.json()).then(applyStatus); }
+function tap() { fetch(BASE + '/tap', {method:'POST'}).then(r=>r.json()).then(applyStatus); }
 function adjust(delta) {
-  fetch('/bpm', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({delta})})
-    .then(r=>r.json()).then(updateUI);
+  fetch(BASE + '/bpm', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({delta})})
+    .then(r=>r.json()).then(applyStatus);
 }
-function next() { fetch('/next').then(r=>r.json()).then(updateUI); }
+function next() { fetch(BASE + '/next').then(r=>r.json()).then(applyStatus); }
 function fill(bars) {
-  fetch('/fill', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({bars})})
-    .then(r=>r.json()).then(updateUI);
+  fetch(BASE + '/fill', {method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({bars})})
+    .then(r=>r.json()).then(applyStatus);
 }
 
 document.addEventListener('keydown', (e) => {
@@ -255,82 +327,214 @@ document.addEventListener('keydown', (e) => {
   if (e.code === 'Enter') { togglePlay(); }
 });
 
-setInterval(poll, 100);
-(async () => { await fetchPatterns(); await poll(); })();
+(async () => { await fetchPatterns(); await poll(); longPoll(); pollTiming(); })();
 </script>
 </body>
 </html>
 """
 
+def _engine_for(room_id):
+    # no room -> the default engine the other front-ends use
+    if room_id is None:
+        return engine._default
+    if not engine.valid_room_id(room_id):
+        abort(404)
+    eng = engine.get_room(room_id)
+    if eng is None:
+        abort(404)   # not in rooms.json and MAX_ROOMS others are already open
+    return eng
+
 @app.route("/")
-def index():
-    return render_template_string(HTML)
+@app.route("/rooms/<room_id>/")
+def index(room_id=None):
+    _engine_for(room_id)
+    base = f"/rooms/{room_id}" if room_id else ""
+    return render_template_string(HTML, base=base)
+
+@app.route("/rooms")
+def rooms():
+    return jsonify(sorted(engine.rooms().keys()))
 
 @app.route("/patterns")
-def patterns():
-    out = []
-    for p in engine.PATTERNS:
-        out.append({
-            "name": p["name"],
-            "beats": p["beats"],
-            "fill": p.get("fill")
-        })
-    return jsonify(out)
+@app.route("/rooms/<room_id>/patterns")
+def patterns(room_id=None):
+    eng = _engine_for(room_id)
+    return jsonify(eng.export_patterns())
 
 @app.route("/pattern/update", methods=["POST"])
-def pattern_update():
+@app.route("/rooms/<room_id>/pattern/update", methods=["POST"])
+def pattern_update(room_id=None):
+    eng = _engine_for(room_id)
     data = request.get_json(force=True)
     try:
-        engine.update_pattern_from_text(
+        eng.update_pattern_from_text(
             idx=int(data.get("idx", 0)),
             name=str(data.get("name", "")),
             beats_text=str(data.get("main", "")),
             fill_text=str(data.get("fill", "")),
+            layers=data.get("layers"),   # absent: keep the pattern's layers
         )
         return jsonify({"ok": True})
     except Exception as e:
         return jsonify({"ok": False, "error": str(e)})
 
-@app.route("/status")
-def status():
-    st = engine.get_status()
-    beats = engine.PATTERNS[st["current_idx"]]["beats"]
+def _full_status(eng):
+    st = eng.get_status()
+    beats = eng.patterns[st["current_idx"]]["beats"]
     st["pattern_beats"] = beats
-    return jsonify(st)
+    return st
+
+def _remember(eng, st):
+    # keep the last few payloads we served so ?since=<version> can be answered as a delta
+    with _snapshots_lock:
+        snaps = _snapshots.setdefault(eng.name, OrderedDict())
+        snaps[st["version"]] = st
+        while len(snaps) > SNAPSHOT_HISTORY:
+            snaps.popitem(last=False)
+
+def _snapshot(eng, version):
+    with _snapshots_lock:
+        return _snapshots.get(eng.name, {}).get(version)
+
+@app.route("/status")
+@app.route("/rooms/<room_id>/status")
+def status(room_id=None):
+    """
+    Plain GET: full status.
+    ?since=<version>[&timeout=<s>]: long-poll. Waits until the state version moves
+    past <version>, then returns only the fields that changed ("delta": true), or
+    the full payload if that version is too old to diff against. 304 on timeout.
+    Only LONGPOLL_WAITERS requests wait at once; the rest are answered right away
+    with a Retry-After, so long-polls can't take every server thread.
+    """
+    global _parked
+    eng = _engine_for(room_id)
+    since = request.args.get("since", type=int)
+    if since is None:
+        st = _full_status(eng)
+        _remember(eng, st)
+        return jsonify(st)
+
+    timeout = request.args.get("timeout", LONGPOLL_TIMEOUT, type=float)
+    timeout = max(0.0, min(LONGPOLL_MAX, timeout))
+    with _parked_lock:
+        park = _parked < LONGPOLL_WAITERS
+        if park:
+            _parked += 1
+    try:
+        version = eng.wait_for_change(since, timeout if park else 0.0)
+    finally:
+        if park:
+            with _parked_lock:
+                _parked -= 1
+
+    if version == since:
+        resp = make_response("", 304)
+    else:
+        st = _full_status(eng)
+        _remember(eng, st)
+        old = _snapshot(eng, since)
+        if old is None:
+            st["delta"] = False
+            resp = jsonify(st)
+        else:
+            out = {k: v for k, v in st.items() if old.get(k) != v}
+            out["version"] = st["version"]
+            out["delta"] = True
+            resp = jsonify(out)
+    if not park:
+        resp.headers["Retry-After"] = str(LONGPOLL_BUSY_RETRY)
+    return resp
 
 @app.route("/toggle")
-def toggle():
-    engine.handle_start()
-    return status()
+@app.route("/rooms/<room_id>/toggle")
+def toggle(room_id=None):
+    _engine_for(room_id).handle_start()
+    return status(room_id)
 
 @app.route("/tap", methods=["POST"])
-def tap():
-    engine.handle_tap()
-    return status()
+@app.route("/rooms/<room_id>/tap", methods=["POST"])
+def tap(room_id=None):
+    _engine_for(room_id).handle_tap()
+    return status(room_id)
 
 @app.route("/bpm", methods=["POST"])
-def bpm():
+@app.route("/rooms/<room_id>/bpm", methods=["POST"])
+def bpm(room_id=None):
     data = request.get_json(force=True)
-    engine.adjust_bpm(int(data.get("delta", 0)))
-    return status()
+    _engine_for(room_id).adjust_bpm(int(data.get("delta", 0)))
+    return status(room_id)
 
 @app.route("/pattern/<int:idx>")
-def pattern(idx):
-    engine.set_pattern(idx)
-    return status()
+@app.route("/rooms/<room_id>/pattern/<int:idx>")
+def pattern(idx, room_id=None):
+    _engine_for(room_id).set_pattern(idx)
+    return status(room_id)
 
 @app.route("/next")
-def nextp():
+@app.route("/rooms/<room_id>/next")
+def nextp(room_id=None):
     # This calls "fill if playing, next pattern if stopped"
-    engine.next_button_action()
-    return status()
+    _engine_for(room_id).next_button_action()
+    return status(room_id)
 
 @app.route("/fill", methods=["POST"])
-def fill():
+@app.route("/rooms/<room_id>/fill", methods=["POST"])
+def fill(room_id=None):
     data = request.get_json(force=True)
-    engine.request_fill(int(data.get("bars", 1)))
-    return status()
+    _engine_for(room_id).request_fill(int(data.get("bars", 1)))
+    return status(room_id)
+
+@app.route("/batch", methods=["POST"])
+@app.route("/rooms/<room_id>/batch", methods=["POST"])
+def batch(room_id=None):
+    """
+    Several commands as one change, e.g.
+    {"commands": [{"cmd": "pattern", "idx": 3}, {"cmd": "bpm", "value": 132},
+                  {"cmd": "play", "value": true}], "at": "bar"}
+    "at": "now" (default) or "bar" (next bar line while playing). All or nothing.
+    """
+    eng = _engine_for(room_id)
+    data = request.get_json(force=True, silent=True) or {}
+    if isinstance(data, list):
+        data = {"commands": data}
+    try:
+        eng.apply_batch(data.get("commands"), data.get("at", "now"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)})
+    return status(room_id)
+
+@app.route("/offsets", methods=["GET", "POST"])
+@app.route("/rooms/<room_id>/offsets", methods=["GET", "POST"])
+def offsets(room_id=None):
+    # per-output latency offsets in ms, e.g. POST {"midi": 12, "web": 80}
+    eng = _engine_for(room_id)
+    if request.method == "POST":
+        data = request.get_json(force=True) or {}
+        if not isinstance(data, dict):
+            return jsonify({"ok": False, "error": "expected an object like {\"midi\": 12}"})
+        try:
+            eng.set_offsets(**{k: float(v) for k, v in data.items()})
+        except (TypeError, ValueError) as e:
+            return jsonify({"ok": False, "error": str(e)})
+    try:
+        return jsonify(eng.get_offsets())
+    except ValueError as e:   # process mode
+        return jsonify({"ok": False, "error": str(e)})
+
+@app.route("/accuracy")
+@app.route("/rooms/<room_id>/accuracy")
+def accuracy(room_id=None):
+    # drummer vs click, when listening to the pads (DRUMASSIST_LISTEN)
+    an = _engine_for(room_id).analyzer
+    return jsonify(an.summary() if an is not None else {"enabled": False})
+
+@app.route("/metrics")
+def metrics():
+    # sequencer tick lateness + which realtime measures are active
+    return jsonify(engine.metrics())
 
 if __name__ == "__main__":
-    engine.start_engine()
+    boot.mark("web ready")
+    engine.startup_complete()
     app.run(host="0.0.0.0", port=5000, debug=False)
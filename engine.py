@@ -1,28 +1,51 @@
 # engine.py
-import time
 import threading
 import json
 import os
+import re
 import sys
-import mido
+import copy
 
-if sys.platform.startswith('win'):
-    mido.set_backend('mido.backends.winmm')
+import boot
+import layers
+import scheduler
+from scheduler import Sender
 
 SAVE_FILE = "dh2_settings.json"
+MIDI_CACHE_FILE = "midi_ports.json"   # last port each engine opened, tried first on boot
 MIDI_CHANNEL = 9  # Channel 10 in MIDI terms (0-15)
 PATTERNS_FILE = "patterns.json"
+ROOMS_FILE = "rooms.json"
+MAX_ROOMS = 4   # rooms opened by URL alone; the ones in rooms.json don't count
 FILL_MAX_BARS = 2
+BATCH_COMMANDS = ("bpm", "pattern", "play", "toggle", "fill")
+MAX_BATCH = 32
 
 # Alesis SamplePad Note Numbers (GM-ish)
 SOUNDS = {
     "click": 37,    # Side Stick
     "accent": 49,   # Crash Cymbal (or reassign on device)
     "subdiv": 42,   # Closed Hi-Hat (optional)
+    "cowbell": 56,  # for pattern layers (layers.py)
 }
 
+VELOCITY = 110
+NOTE_ON_TIME = 0.05  # seconds between note_on and note_off
+
+# beat_callback arguments per beat type, built once so ticks don't make tuples
+_BEAT_ARGS = ((0, False), (1, True), (2, False))
+
+# Outputs with their own latency offset (ms in the settings file). Positive = that
+# output is slow, so its copy of each beat goes out that much early; negative = late.
+SINKS = ("midi", "audio", "led", "web", "terminal")
+MAX_OFFSET = 0.1  # seconds either way
+# copies of a beat one output can have waiting: offsets span up to 200 ms, the
+# shortest step (300 BPM 8ths) is 100 ms
+DELAY_SLOTS = 4
+
 # 1 = Accent, 2 = Click, 0 = Rest/Subdivision
-PATTERNS = [
+# optional "layers": extra sounds with their own length/subdivision, see layers.py
+DEFAULT_PATTERNS = [
     {"name": "4/4 Basic",         "beats": [1, 2, 2, 2]},
     {"name": "4/4 Subdivisions",  "beats": [1, 0, 2, 0, 2, 0, 2, 0]},
     {"name": "6/8 Feel",          "beats": [1, 2, 2, 1, 2, 2]},
@@ -30,25 +53,25 @@ PATTERNS = [
     {"name": "Prog Rock 7/8",     "beats": [1, 2, 1, 2, 1, 2, 2]},
 ]
 
-_lock = threading.Lock()
-_outport = None
-_thread_started = False
-
-state = {
-    "bpm": 85,
-    "current_idx": 4,
-    "playing": False,
-    "fill_pending_bars": 0,  # requested fills (queued to start at next bar)
-    "fill_active_bars": 0,   # fills currently being played (counts bars remaining)
-
-    # karaoke / UI helpers
-    "step": 0,
-    "pattern_changed": False,
-    "last_beat_type": 0,
-    "beat_count": 0,
-}
+_mido = None
+_midi_cache_lock = threading.Lock()
+
+
+def get_mido():
+    # mido (and rtmidi under it) is slow to import on a Pi Zero; only pay for it
+    # on the background MIDI thread, after the click is already running.
+    global _mido
+    if _mido is None:
+        mido = boot.timed_import("mido")
+        if sys.platform.startswith('win'):
+            mido.set_backend('mido.backends.winmm')
+        _mido = mido
+    return _mido
+
+
+# room ids end up in file names, so keep them boring
+_ROOM_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
 
-_tap_times = []
 
 def _norm_lines(text: str) -> str:
     return (text or "").replace("\r\n", "\n").replace("\r", "\n")
@@ -78,332 +101,1323 @@ def parse_rhythm(text: str):
             continue
     return out
 
+def _beat_list(values):
+    # beats/fill from a file or an import; raises ValueError on anything but 0, 1, 2
+    beats = [int(x) for x in values]
+    if any(b not in (0, 1, 2) for b in beats):
+        raise ValueError("beats must be 0 (rest), 1 (accent) or 2 (click)")
+    return beats
+
+def _whole(value, what):
+    # a JSON number with no fraction; int() would take 1.7, "132" and true
+    if type(value) is int:
+        return value
+    if type(value) is float and value.is_integer():
+        return int(value)
+    raise ValueError(f"{what} must be a whole number")
+
+def parse_batch(commands, n_patterns):
+    """
+    Web/JSON batch -> [(name, value)] for Engine._apply_commands(). Checks everything
+    up front so a bad command means nothing is applied. Commands:
+    {"cmd": "bpm", "value": 132} / {"cmd": "bpm", "delta": 5}, {"cmd": "pattern", "idx": 3},
+    {"cmd": "play", "value": true}, {"cmd": "toggle"}, {"cmd": "fill", "bars": 1}
+    """
+    if not isinstance(commands, list) or not commands:
+        raise ValueError("commands must be a non-empty list")
+    if len(commands) > MAX_BATCH:
+        raise ValueError(f"at most {MAX_BATCH} commands per batch")
+    out = []
+    for i, c in enumerate(commands, 1):
+        name = c.get("cmd") if isinstance(c, dict) else None
+        try:
+            if name == "bpm":
+                if "delta" in c:
+                    out.append(("bpm_delta", _whole(c["delta"], "delta")))
+                else:
+                    bpm = _whole(c["value"], "value")
+                    if not (30 <= bpm <= 300):
+                        raise ValueError("bpm must be 30-300")
+                    out.append(("bpm", bpm))
+            elif name == "pattern":
+                idx = _whole(c["idx"], "idx")
+                if not (0 <= idx < n_patterns):
+                    raise ValueError(f"no pattern {idx}")
+                out.append(("pattern", idx))
+            elif name == "play":
+                play = c.get("value", True)
+                if type(play) is not bool:   # bool("false") is True
+                    raise ValueError("value must be true or false")
+                out.append(("play", play))
+            elif name == "toggle":
+                out.append(("toggle", None))
+            elif name == "fill":
+                bars = _whole(c.get("bars", 1), "bars")
+                if bars < 1:
+                    raise ValueError("bars must be at least 1")
+                out.append(("fill", (min(FILL_MAX_BARS, bars), None)))
+            else:
+                raise ValueError(f"unknown command (use {', '.join(BATCH_COMMANDS)})")
+        except KeyError as e:
+            raise ValueError(f"command {i} ({name}): missing {e}")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"command {i} ({name}): {e}")
+    return out
+
+
+def _with_layers(p, raw):
+    # sets p["layers"] (cleaned) and p["grid"] (compiled); raises ValueError
+    p["layers"] = p["grid"] = None
+    clean = layers.clean_layers(raw, SOUNDS)
+    grid = layers.compile_grid(len(p["beats"]), clean, SOUNDS)
+    p["layers"], p["grid"] = clean, grid
+
+
+class _Delayed:
+    """
+    One output's copies of upcoming beats, each on its own reusable job at its own
+    time (with offsets, a copy can still be waiting when the next step ticks).
+    emit(item, deadline, now) -> when to call it again for the same item, or None.
+    """
+    __slots__ = ("emit", "items", "jobs", "next")
+
+    def __init__(self, emit, size=DELAY_SLOTS):
+        self.emit = emit
+        self.items = [None] * size
+        self.jobs = [scheduler.Job(self._runner(i)) for i in range(size)]
+        self.next = 0
+
+    def _runner(self, i):
+        items = self.items
+
+        def run(deadline, now):
+            nxt = self.emit(items[i], deadline, now)
+            if nxt is None:
+                items[i] = None
+            return nxt
+        return run
+
+    def slot(self, now):
+        # the next free slot; if all are taken, the oldest copy goes out now
+        i = self.next
+        self.next = (i + 1) % len(self.jobs)
+        item = self.items[i]
+        if item is not None:
+            at = self.jobs[i].entry[0]
+            while at is not None:
+                at = self.emit(item, at, now)
+            self.items[i] = None
+        return i
+
+    def start(self, sched, i, item, at):
+        self.items[i] = item
+        sched.reschedule(self.jobs[i], at)
+
+    def put(self, sched, item, at, now):
+        self.start(sched, self.slot(now), item, at)
+
+
+class _LayerRun:
+    # one step's between-step bursts, in flight on a _Delayed slot
+    __slots__ = ("events", "i", "t0", "interval")
+
+    def __init__(self):
+        self.events = None
+        self.i = 0
+        self.t0 = 0.0
+        self.interval = 0.0
+
+
 def rhythm_to_text(beats):
     # Single-line display (UI can still be multiline; this is just a formatter)
     return " ".join("A" if b == 1 else ("x" if b == 2 else ".") for b in beats)
 
-def patterns_default():
-    # Convert your in-code PATTERNS into file format with optional fill
-    return [
-        {"name": p["name"], "beats": p["beats"], "fill": p.get("fill")}
-        for p in PATTERNS
-    ]
 
-def save_patterns():
-    try:
-        with _lock:
-            data = patterns_default()
-        with open(PATTERNS_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"Error saving patterns: {e}")
+class Engine:
+    """
+    One metronome: its own state, patterns, MIDI port and settings files.
+    Pass save_file/patterns_file=None to run without persistence.
+    port_match picks the first MIDI output whose name contains that text.
+    """
+    # the click runs somewhere else (sequencer_process.ProcessEngine): this process's
+    # scheduler and offsets say nothing about it
+    remote_sequencer = False
+
+    def __init__(self, name="default", save_file=SAVE_FILE, patterns_file=PATTERNS_FILE,
+                 port_match=None):
+        self.name = name
+        self.save_file = save_file
+        self.patterns_file = patterns_file
+        self.port_match = port_match
+
+        self.patterns = copy.deepcopy(DEFAULT_PATTERNS)
+        self.state = {
+            "bpm": 85,
+            "current_idx": 4,
+            "playing": False,
+            "fill_pending_bars": 0,  # requested fills (queued to start at next bar)
+            "fill_active_bars": 0,   # fills currently being played (counts bars remaining)
+
+            # karaoke / UI helpers
+            "step": 0,
+            "pattern_changed": False,
+            "last_beat_type": 0,
+            "beat_count": 0,
+        }
 
-def load_patterns():
-    global PATTERNS
-    if not os.path.exists(PATTERNS_FILE):
-        return
-    try:
-        with open(PATTERNS_FILE, "r") as f:
-            data = json.load(f)
-        # validate minimally
-        cleaned = []
-        for p in data:
-            name = str(p.get("name", "Pattern"))
-            beats = p.get("beats", [])
-            fill = p.get("fill", None)
-            if not isinstance(beats, list) or not beats:
-                continue
-            beats = [int(x) for x in beats]
-            if fill is not None:
-                if not isinstance(fill, list) or len(fill) != len(beats):
-                    fill = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._version = 0          # bumped on every visible state change, see wait_for_change()
+        self._waiters = 0          # threads inside wait_for_change()
+        self._midi = None          # scheduler.Sender for the MIDI output (None = dummy)
+        self._messages = {}        # note or burst -> (note_on, note_off), built once each
+        self._off_job = scheduler.Job(self._note_off)  # the one pending note_off slot
+        self._off_msg = None
+        self._thread_started = False
+        self._tap_times = []
+        self.recorder = None       # recorder.Recorder, see set_recorder()
+        self.offsets = dict.fromkeys(SINKS, 0.0)   # seconds, see set_offsets()
+        self.callback_sink = "led"  # what beat_callback drives (see set_sinks())
+        self.status_sink = "web"    # who watches state/get_status() for the beat
+        self.analyzer = None       # accuracy.Analyzer when listening to the pads
+        self._batch = None         # commands waiting for the next bar line, see apply_batch()
+        self._batch_done = None    # Sender for their side effects (files, prints) once applied
+
+        # sequencer position, owned by the scheduler thread
+        self._scheduler = None
+        self._job = None
+        self._callback = None
+        self._step = 0
+        self._ticks = 0            # absolute step counter (never wraps)
+        self._listeners = []       # fn(model) after every tick, see add_tick_listener()
+        self._follow = None        # timing model imposed by a sync leader (beat_sync.py)
+        self._clicked = False
+        self._bar_deadline = 0.0   # when the current bar's first step played
+        self._bar_interval = 0.0   # and the step length it played at
+
+        # latency compensation: tick() runs _lead early, each sink's copy of the beat
+        # goes out from its own job at deadline - offset
+        self._lead = 0.0           # largest positive offset
+        self._lead_used = 0.0      # lead the pending tick was scheduled with
+        self._midi_out = _Delayed(self._emit_midi)
+        self._cb_out = _Delayed(self._emit_callback)
+        self._pub_out = _Delayed(self._emit_status)
+
+        # pattern layers: the bursts between a step and the next (one _LayerRun per
+        # _layers_out slot)
+        self._layers_out = _Delayed(self._emit_layers)
+        self._layer_runs = [_LayerRun() for _ in range(DELAY_SLOTS)]
+
+    # ---- patterns ----
+
+    def export_patterns(self):
+        # Convert the in-memory patterns into file format with optional fill
+        out = []
+        for p in self.patterns:
+            item = {"name": p["name"], "beats": p["beats"], "fill": p.get("fill")}
+            if p.get("layers"):
+                item["layers"] = p["layers"]
+            out.append(item)
+        return out
+
+    def save_patterns(self):
+        if not self.patterns_file:
+            return
+        try:
+            with self._lock:
+                data = self.export_patterns()
+            with open(self.patterns_file, "w") as f:
+                json.dump(data, f, indent=2)
+        except Exception as e:
+            print(f"Error saving patterns: {e}")
+
+    def load_patterns(self):
+        if not self.patterns_file or not os.path.exists(self.patterns_file):
+            return
+        try:
+            with open(self.patterns_file, "r") as f:
+                data = json.load(f)
+            # validate minimally
+            cleaned = []
+            for p in data:
+                name = str(p.get("name", "Pattern"))
+                beats = p.get("beats", [])
+                fill = p.get("fill", None)
+                if not isinstance(beats, list) or not beats:
+                    continue
+                try:
+                    beats = _beat_list(beats)
+                except (TypeError, ValueError) as e:
+                    print(f"Pattern '{name}': {e}; skipped")
+                    continue
+                if fill is not None:
+                    if not isinstance(fill, list) or len(fill) != len(beats):
+                        fill = None
+                    else:
+                        try:
+                            fill = _beat_list(fill)
+                        except (TypeError, ValueError) as e:
+                            print(f"Pattern '{name}' fill: {e}; fill dropped")
+                            fill = None
+                item = {"name": name, "beats": beats, "fill": fill}
+                try:
+                    _with_layers(item, p.get("layers"))
+                except ValueError as e:
+                    print(f"Pattern '{name}': {e}; layers dropped")
+                cleaned.append(item)
+            if cleaned:
+                with self._lock:
+                    # in place: front-ends hold a reference to this list
+                    self.patterns[:] = cleaned
+                    if self.state["current_idx"] >= len(self.patterns):
+                        self.state["current_idx"] = 0
+                    self._bump()
+                print(f"Loaded patterns from {self.patterns_file}")
+        except Exception as e:
+            print(f"Error loading patterns: {e}")
+
+    def update_pattern_from_text(self, idx: int, name: str, beats_text: str, fill_text: str,
+                                 layers=None):
+        # layers: None keeps the pattern's layers, [] removes them
+        idx = int(idx)
+        if not (0 <= idx < len(self.patterns)):
+            raise ValueError("Bad pattern index")
+
+        beats = parse_rhythm(beats_text)
+        if not beats:
+            raise ValueError("Main rhythm is empty (use A/x/.)")
+
+        fill_text = (fill_text or "").strip()
+        fill = parse_rhythm(fill_text) if fill_text else None
+
+        # Keep life simple: fill must match main length
+        if fill is not None and len(fill) != len(beats):
+            raise ValueError(f"Fill length ({len(fill)}) must match main length ({len(beats)})")
+
+        # compile before touching the live pattern: a bad layer changes nothing
+        new = {"beats": beats}
+        _with_layers(new, self.patterns[idx].get("layers") if layers is None else layers)
+
+        with self._lock:
+            p = self.patterns[idx]
+            p["name"] = (name or p["name"]).strip() or p["name"]
+            p["beats"] = beats
+            p["fill"] = fill
+            p["layers"] = new["layers"]
+            p["grid"] = new["grid"]
+            self.state["pattern_changed"] = True  # forces step reset cleanly
+            self._bump()
+
+        self.save_patterns()
+
+    def add_patterns(self, items):
+        """
+        Add a batch of {"name", "beats", "fill"} patterns (midi_import.py), saved once.
+        A pattern whose name already exists replaces it. Returns (added, replaced).
+        """
+        added = replaced = 0
+        with self._lock:
+            by_name = {p["name"]: i for i, p in enumerate(self.patterns)}
+            for item in items:
+                try:
+                    beats = _beat_list(item["beats"])
+                    fill = item.get("fill")
+                    if fill is not None:
+                        fill = _beat_list(fill) if len(fill) == len(beats) else None
+                except (TypeError, ValueError) as e:
+                    print(f"Pattern '{item['name']}': {e}; skipped")
+                    continue
+                if not beats:
+                    continue
+                p = {"name": str(item["name"]), "beats": beats, "fill": fill}
+                try:
+                    _with_layers(p, item.get("layers"))
+                except ValueError as e:
+                    print(f"Pattern '{p['name']}': {e}; layers dropped")
+                i = by_name.get(p["name"])
+                if i is None:
+                    by_name[p["name"]] = len(self.patterns)
+                    self.patterns.append(p)
+                    added += 1
                 else:
-                    fill = [int(x) for x in fill]
-            cleaned.append({"name": name, "beats": beats, "fill": fill})
-        if cleaned:
-            PATTERNS = cleaned
-            print(f"Loaded patterns from {PATTERNS_FILE}")
-    except Exception as e:
-        print(f"Error loading patterns: {e}")
+                    self.patterns[i] = p
+                    replaced += 1
+                    if i == self.state["current_idx"]:
+                        self.state["pattern_changed"] = True
+            self._bump()
+        self.save_patterns()
+        return added, replaced
+
+    # ---- settings ----
+
+    def save_state(self):
+        if not self.save_file:
+            return
+        with self._lock:
+            data = {"bpm": self.state["bpm"], "idx": self.state["current_idx"],
+                    "offsets": {k: round(v * 1000.0, 2) for k, v in self.offsets.items()}}
+        try:
+            with open(self.save_file, "w") as f:
+                json.dump(data, f)
+        except Exception as e:
+            print(f"Error saving state: {e}")
+
+    def load_state(self):
+        if not self.save_file or not os.path.exists(self.save_file):
+            return
+        try:
+            with open(self.save_file, "r") as f:
+                data = json.load(f)
+            with self._lock:
+                self.state["bpm"] = int(data.get("bpm", self.state["bpm"]))
+                idx = int(data.get("idx", self.state["current_idx"]))
+                if 0 <= idx < len(self.patterns):
+                    self.state["current_idx"] = idx
+                self._bump()
+            self._apply_offsets(data.get("offsets") or {})
+        except Exception as e:
+            print(f"Error loading state: {e}")
+
+    # ---- latency compensation ----
+
+    def _apply_offsets(self, ms):
+        for sink, v in ms.items():
+            if sink not in SINKS:
+                raise ValueError(f"Unknown output '{sink}' (use {', '.join(SINKS)})")
+            self.offsets[sink] = max(-MAX_OFFSET, min(MAX_OFFSET, float(v) / 1000.0))
+        self._lead = max(0.0, max(self.offsets.values()))
+
+    def set_offsets(self, **ms):
+        """
+        Per-output latency offsets in ms, e.g. set_offsets(midi=12, web=80).
+        Positive: that output is slow, so it gets each beat early. Clamped to +/-100 ms.
+        """
+        self._apply_offsets(ms)
+        self.save_state()
+        print("Offsets: " + ", ".join(f"{k} {v * 1000.0:+.0f} ms" for k, v in self.offsets.items()))
+
+    def get_offsets(self):
+        return {k: v * 1000.0 for k, v in self.offsets.items()}
+
+    def set_sinks(self, callback=None, status=None):
+        # which offsets the beat callback / state updates follow in this front-end
+        for sink in (callback, status):
+            if sink is not None and sink not in SINKS:
+                raise ValueError(f"Unknown output '{sink}'")
+        if callback is not None:
+            self.callback_sink = callback
+        if status is not None:
+            self.status_sink = status
+
+    def _emit_time(self, sink, deadline, now):
+        # when this sink's copy of the step due at `deadline` should go out, or None
+        # for right away (the no-offsets case costs one dict lookup)
+        off = self.offsets[sink]
+        if not off and not self._lead:
+            return None
+        t = deadline - off
+        return t if t > now else None
+
+    def _emit_midi(self, note, deadline, now):
+        self._play_note(note, deadline)
+        return None
+
+    def _emit_callback(self, args, deadline, now):
+        if self._callback is not None:
+            self._callback.put(args)
+        return None
+
+    def _emit_status(self, pub, deadline, now):
+        self._lock.acquire()
+        try:
+            self._publish(*pub)
+        finally:
+            self._lock.release()
+        return None
+
+    def _emit_layers(self, run, deadline, now):
+        events = run.events
+        self._play_note(events[run.i][1], deadline)
+        run.i += 1
+        if run.i >= len(events):
+            return None
+        return run.t0 + events[run.i][0] * run.interval
+
+    def _publish(self, beat_type, count, step):
+        # call with self._lock held: what get_status()/the web UI see for a step
+        state = self.state
+        state["last_beat_type"] = beat_type
+        state["beat_count"] = count
+        state["step"] = step
+        self._bump()
+
+    # ---- MIDI ----
+
+    def _cached_port(self):
+        try:
+            with open(MIDI_CACHE_FILE, "r") as f:
+                name = json.load(f).get(self.name)
+        except (OSError, ValueError, AttributeError):
+            return None
+        if not name or (self.port_match and self.port_match not in name):
+            return None
+        return name
+
+    def _cache_port(self, port_name):
+        with _midi_cache_lock:
+            try:
+                with open(MIDI_CACHE_FILE, "r") as f:
+                    data = json.load(f)
+                if not isinstance(data, dict):
+                    data = {}
+            except (OSError, ValueError):
+                data = {}
+            if data.get(self.name) == port_name:
+                return
+            data[self.name] = port_name
+            try:
+                with open(MIDI_CACHE_FILE, "w") as f:
+                    json.dump(data, f)
+            except Exception as e:
+                print(f"Error saving MIDI port cache: {e}")
+
+    def init_midi(self):
+        try:
+            mido = get_mido()
+
+            # fast path: reopen last boot's port without a full enumeration
+            cached = self._cached_port()
+            if cached:
+                try:
+                    self._midi = scheduler.port_sender(cached, mido.open_output)
+                    self._hook_midi()
+                    print(f"MIDI: Connected to {cached}")
+                    return
+                except Exception:
+                    pass
+
+            ports = mido.get_output_names()
+            if not ports:
+                print("MIDI: No output ports found (dummy mode).")
+                self._midi = None
+                return
+
+            if self.port_match:
+                matching = [p for p in ports if self.port_match in p]
+                if not matching:
+                    print(f"MIDI: No output port matching '{self.port_match}' (dummy mode).")
+                    self._midi = None
+                    return
+            else:
+                matching = [p for p in ports if ("USB" in p) or ("Alesis" in p)]
+            port_name = matching[0] if matching else ports[0]
+            self._midi = scheduler.port_sender(port_name, mido.open_output)
+            self._hook_midi()
+            print(f"MIDI: Connected to {port_name}")
+            self._cache_port(port_name)
+        except Exception as e:
+            print(f"MIDI Error: {e}. Running in dummy mode.")
+            self._midi = None
+            if self.recorder is not None:
+                self.recorder.midi_error()
+        finally:
+            boot.mark("midi ready")
+
+    def set_recorder(self, rec):
+        """Log ticks, MIDI sends/errors and control changes to a recorder.Recorder (None = off)."""
+        self.recorder = rec
+        self._hook_midi()
+
+    def _hook_midi(self):
+        midi, rec = self._midi, self.recorder
+        if midi is not None:
+            midi.on_sent = rec.midi_sent if rec is not None else None
+            midi.on_error = rec.midi_error if rec is not None else None
+
+    def _note_messages(self, note):
+        Message = get_mido().Message
+        if isinstance(note, tuple):
+            # a burst (layers.py): all notes in one item for the port sender
+            ons = tuple(Message("note_on", note=n % layers.ACCENT, channel=MIDI_CHANNEL,
+                                velocity=layers.ACCENT_VELOCITY if n >= layers.ACCENT else VELOCITY)
+                        for n in note)
+            offs = tuple(Message("note_off", note=n % layers.ACCENT, velocity=0, channel=MIDI_CHANNEL)
+                         for n in note)
+            msgs = (ons, offs)
+        else:
+            msgs = (Message("note_on", note=note, velocity=VELOCITY, channel=MIDI_CHANNEL),
+                    Message("note_off", note=note, velocity=0, channel=MIDI_CHANNEL))
+        self._messages[note] = msgs
+        return msgs
+
+    def _send_note(self, note, deadline, now):
+        at = self._emit_time("midi", deadline, now)
+        if at is None:
+            self._play_note(note, now if self._lead else deadline)
+            return
+        self._midi_out.put(self._scheduler, note, at, now)
 
-def update_pattern_from_text(idx: int, name: str, beats_text: str, fill_text: str):
-    idx = int(idx)
-    if not (0 <= idx < len(PATTERNS)):
-        raise ValueError("Bad pattern index")
+    def _play_note(self, note, at):
+        # note_on now, note_off as its own scheduler event; the port sender does the I/O.
+        # Messages and the note_off slot are reused, so this allocates nothing.
+        midi = self._midi
+        if midi is None:
+            return
+        msgs = self._messages.get(note)
+        if msgs is None:
+            msgs = self._note_messages(note)
+        off_job = self._off_job
+        if off_job.active:
+            # previous note still held (very fast grid): release it before the next one
+            midi.put(self._off_msg)
+        midi.put(msgs[0])
+        self._off_msg = msgs[1]
+        # moves a pending note_off, so this note is held its own NOTE_ON_TIME
+        self._scheduler.reschedule(off_job, at + NOTE_ON_TIME)
+
+    def _note_off(self, deadline, now):
+        midi = self._midi
+        if midi is not None and self._off_msg is not None:
+            midi.put(self._off_msg)
+        return None
+
+    # ---- controls ----
+
+    def set_bpm(self, new_bpm: int, save=True):
+        # save=False: the caller calls save_state() once a run of changes settles
+        if not (30 <= int(new_bpm) <= 300):
+            return
+        with self._lock:
+            self.state["bpm"] = int(new_bpm)
+            self._bump()
+        if self.recorder is not None:
+            self.recorder.bpm(int(new_bpm))
+        if save:
+            self.save_state()
+
+    def adjust_bpm(self, delta: int):
+        with self._lock:
+            bpm = self.state["bpm"]
+        self.set_bpm(bpm + int(delta))
+
+    def set_pattern(self, idx: int, save=True):
+        idx = int(idx)
+        if not (0 <= idx < len(self.patterns)):
+            return
+        with self._lock:
+            self.state["current_idx"] = idx
+            self.state["pattern_changed"] = True
+            self._bump()
+        if self.recorder is not None:
+            self.recorder.pattern(idx)
+        if save:
+            self.save_state()
+        print(f"Pattern: {self.patterns[idx]['name']}")
+
+    def request_fill(self, bars: int = 1, t=None):
+        """
+        t: scheduler.clock() time of the actual press, if known (see inputs.py).
+        A press that landed less than a step before the bar line we've just played -
+        but reached us after it - takes the bar that just started instead of waiting
+        for the next. Anything older waits for the next bar like any other press.
+        """
+        bars = int(bars)
+        if bars < 1:
+            return
+        bars = min(FILL_MAX_BARS, bars)
+
+        with self._lock:
+            if not self._fill_locked(bars, t):
+                return
+            self._bump()
+        if self.recorder is not None:
+            self.recorder.fill(t, bars)
+
+    def _fill_locked(self, bars, t):
+        # call with self._lock held; False when stopped (nothing to fill)
+        st = self.state
+        if not st["playing"]:
+            return False
+        bar = self._bar_deadline
+        if (t is not None and bar - self._bar_interval <= t < bar
+                and st["fill_active_bars"] <= 0 and st["fill_pending_bars"] == 0):
+            st["fill_active_bars"] = bars
+        else:
+            # queue to start at the next bar boundary
+            st["fill_pending_bars"] = min(FILL_MAX_BARS, st["fill_pending_bars"] + bars)
+        return True
+
+    def next_button_action(self, t=None):
+        # Stopped -> next pattern (current behavior)
+        # Playing -> request 1 bar fill (press twice to request 2 bars)
+        with self._lock:
+            playing = self.state["playing"]
+        if playing:
+            self.request_fill(1, t)
+        else:
+            self.next_pattern()
+
+    def next_pattern(self):
+        with self._lock:
+            idx = self.state["current_idx"]
+        self.set_pattern((idx + 1) % len(self.patterns))
+
+    def toggle_play(self):
+        with self._lock:
+            self.state["playing"] = not self.state["playing"]
+            playing = self.state["playing"]
+            if not playing:
+                self._batch = None   # no next bar to wait for
+            self._bump()
+        if self.recorder is not None:
+            self.recorder.play(playing)
+        if playing:
+            self._tap_times = []
+            if self._job is not None:
+                self._scheduler.wake(self._job)
+        return playing
+
+    def handle_start(self):
+        playing = self.toggle_play()
+        with self._lock:
+            name = self.patterns[self.state["current_idx"]]["name"]
+            bpm = self.state["bpm"]
+        if playing:
+            print(f"Started: {name} at {bpm} BPM")
+        else:
+            print("Stopped")
+
+    def handle_tap(self, t=None):
+        # t: when the tap really happened (scheduler.clock()); defaults to now
+        now = scheduler.clock() if t is None else t
+
+        if self._tap_times and (now - self._tap_times[-1] > 2.0):
+            self._tap_times = []
+
+        self._tap_times.append(now)
+        self._tap_times = self._tap_times[-4:]
+
+        if len(self._tap_times) >= 2:
+            intervals = [t - s for s, t in zip(self._tap_times, self._tap_times[1:])]
+            avg_interval = sum(intervals) / len(intervals)
+            if avg_interval > 0:
+                new_bpm = int(60.0 / avg_interval)
+                if 30 < new_bpm < 300:
+                    self.set_bpm(new_bpm)
+                    print(f"Tap Tempo: {new_bpm} BPM")
+
+        if self.recorder is not None:
+            with self._lock:
+                bpm = self.state["bpm"]
+            self.recorder.tap(now, bpm)
+
+    # ---- batches ----
+
+    def apply_batch(self, commands, at="now"):
+        """
+        Apply a list of commands (see parse_batch()) as one change: one state version,
+        one settings save. at="bar": while playing, hold them until the next bar line,
+        like a fill. Raises ValueError, applying nothing, if any command is bad.
+        Returns True if applied now, False if waiting for the bar.
+        """
+        if at not in ("now", "bar"):
+            raise ValueError("at must be 'now' or 'bar'")
+        return self._apply_commands(parse_batch(commands, len(self.patterns)), at)
+
+    def _apply_commands(self, cmds, at="now"):
+        if at == "bar" and self._batch_done is None:
+            self._batch_done = Sender(f"{self.name}-batch", self._after_batch)
+        with self._lock:
+            if at == "bar" and self.state["playing"] and self._job is not None:
+                self._batch = (self._batch or []) + list(cmds)
+                self._bump()
+                return False
+            effects = self._apply_locked(cmds)
+        if effects[1][2] and not effects[0][2]:
+            self._tap_times = []
+            if self._job is not None:
+                self._scheduler.wake(self._job)
+        self._after_batch(effects)
+        return True
+
+    def _apply_locked(self, cmds):
+        # call with self._lock held. Returns (before, after, fill) for _after_batch()
+        st = self.state
+        before = (st["bpm"], st["current_idx"], st["playing"])
+        fill = None
+        for name, value in cmds:
+            if name == "bpm":
+                st["bpm"] = value
+            elif name == "bpm_delta":
+                if 30 <= st["bpm"] + value <= 300:
+                    st["bpm"] += value
+            elif name == "pattern":
+                if 0 <= value < len(self.patterns):
+                    st["current_idx"] = value
+                    st["pattern_changed"] = True
+            elif name == "play":
+                st["playing"] = value
+            elif name == "toggle":
+                st["playing"] = not st["playing"]
+            elif name == "fill":
+                if self._fill_locked(*value):
+                    fill = value
+        if not st["playing"]:
+            self._batch = None
+        self._bump()
+        return before, (st["bpm"], st["current_idx"], st["playing"]), fill
+
+    def _after_batch(self, effects):
+        # the slow part of a batch (recording, settings file, prints), off the scheduler thread
+        (bpm0, idx0, play0), (bpm, idx, playing), fill = effects
+        rec = self.recorder
+        if rec is not None:
+            if idx != idx0:
+                rec.pattern(idx)
+            if bpm != bpm0:
+                rec.bpm(bpm)
+            if playing != play0:
+                rec.play(playing)
+            if fill is not None:
+                rec.fill(fill[1], fill[0])
+        if (bpm, idx) != (bpm0, idx0):
+            self.save_state()
+        if idx != idx0:
+            print(f"Pattern: {self.patterns[idx]['name']}")
+        if playing != play0:
+            print(f"Started: {self.patterns[idx]['name']} at {bpm} BPM" if playing else "Stopped")
+
+    def _bump(self):
+        # call with self._lock held
+        self._version += 1
+        if self._waiters:
+            self._changed.notify_all()
+
+    def wait_for_change(self, since, timeout):
+        """
+        Block until the state version differs from `since` (or timeout).
+        Returns the current version; equal to `since` means nothing changed.
+        """
+        with self._changed:
+            self._waiters += 1
+            try:
+                self._changed.wait_for(lambda: self._version != since, timeout)
+            finally:
+                self._waiters -= 1
+            return self._version
+
+    def get_status(self):
+        with self._lock:
+            st = self.state
+            p = self.patterns[st["current_idx"]]
+            return {
+                "version": self._version,
+                "bpm": st["bpm"],
+                "playing": st["playing"],
+                "current_idx": st["current_idx"],
+                "pattern_name": p["name"],
+                "step": st.get("step", 0),
+                "pattern_len": len(p["beats"]),
+                "last_beat_type": st.get("last_beat_type", 0),
+                "beat_count": st.get("beat_count", 0),
+                "has_fill": bool(p.get("fill")),
+                "fill_pending_bars": st.get("fill_pending_bars", 0),
+                "fill_active_bars": st.get("fill_active_bars", 0),
+                "batch_pending": self._batch is not None,
+            }
+
+    # ---- sequencer ----
+
+    def tick(self, deadline, now):
+        """
+        Play one step. Called by the scheduler at `deadline`; returns the next
+        step's deadline, or None to park until toggle_play() wakes us again.
+        With latency offsets we're woken _lead early and `deadline` is the beat's own time.
+        """
+        state = self.state
+        due = deadline
+        if self._lead_used:
+            deadline += self._lead_used
+        lock = self._lock
+        lock.acquire()   # not `with`: that makes a bound method every tick (check_alloc.py)
+        try:
+            if not state["playing"]:
+                return None
+
+            follow = self._follow
+            boundary = True
+            if state["pattern_changed"]:
+                self._step = 0
+                state["step"] = 0
+                state["pattern_changed"] = False
 
-    beats = parse_rhythm(beats_text)
-    if not beats:
-        raise ValueError("Main rhythm is empty (use A/x/.)")
+            if follow is None:
+                step = self._step
+                abs_step = self._ticks
+            else:
+                # slave the step grid to the leader's timeline (see follow())
+                anchor, anchor_abs, anchor_step, f_interval, snap_abs, snap_active, snap_pending = follow
+                k = round((deadline - anchor) / f_interval)
+                abs_step = anchor_abs + k
+                step = anchor_step + k
+                if snap_abs >= abs_step - 1:
+                    state["fill_active_bars"] = snap_active
+                    state["fill_pending_bars"] = snap_pending
+                    # leader already did this step's bar bookkeeping
+                    boundary = snap_abs < abs_step
+
+            p = self.patterns[state["current_idx"]]
+            main = p["beats"]
+            fill = p.get("fill")
+            step %= len(main)
+
+            if step == 0 and boundary and self._batch is not None:
+                # commands held for this bar line (apply_batch(at="bar"))
+                batch, self._batch = self._batch, None
+                self._batch_done.put(self._apply_locked(batch))
+                if not state["playing"]:
+                    return None
+                state["pattern_changed"] = False
+                p = self.patterns[state["current_idx"]]
+                main = p["beats"]
+                fill = p.get("fill")
+
+            # At bar boundary (step==0), decide whether to start/continue a fill
+            if step == 0:
+                self._bar_deadline = deadline
+            if boundary and step == 0:
+                if state.get("fill_active_bars", 0) > 0:
+                    # continue fill, decrement bar count now that a new bar is starting
+                    state["fill_active_bars"] -= 1
+                # if no active fill bars remaining, start queued fill
+                if state.get("fill_active_bars", 0) <= 0 and state.get("fill_pending_bars", 0) > 0:
+                    state["fill_active_bars"] = state["fill_pending_bars"]
+                    state["fill_pending_bars"] = 0
 
-    fill_text = (fill_text or "").strip()
-    fill = parse_rhythm(fill_text) if fill_text else None
+            use_fill = (state.get("fill_active_bars", 0) > 0) and (fill is not None)
+            pattern = fill if use_fill else main
+            beat_type = pattern[step % len(pattern)]
+
+            grid = p.get("grid")
+            if grid is not None:
+                # this bar's place in the grid's period, from the absolute step the
+                # bar started on (a follower's step can jump; the bar count can't)
+                pos = (abs_step - step) % grid.steps
+                pos = pos - pos % len(main) + step
+
+            pub_at = self._emit_time(self.status_sink, deadline, now)
+            if pub_at is None:
+                self._publish(beat_type, step, step % len(pattern))
+            else:
+                pub = (beat_type, step, step % len(pattern))
+            bpm = state["bpm"]
 
-    # Keep life simple: fill must match main length
-    if fill is not None and len(fill) != len(beats):
-        raise ValueError(f"Fill length ({len(fill)}) must match main length ({len(beats)})")
+            # timing: next step is relative to this deadline, not to when we woke up,
+            # so lateness doesn't accumulate
+            interval = 60.0 / max(30, bpm)
+            if len(pattern) > 4:
+                interval /= 2  # simple heuristic for 8th-note grids
+            if follow is not None:
+                interval = follow[3]
+                nxt = follow[0] + (k + 1) * interval
+            else:
+                nxt = deadline + interval
+            if step == 0:
+                self._bar_interval = interval
+
+            self._step = (step + 1) % len(pattern)
+            self._ticks = abs_step + 1
+            listeners = self._listeners
+            if listeners:
+                model = (deadline, interval, abs_step, step, state["current_idx"], bpm,
+                         state["fill_active_bars"], state["fill_pending_bars"], True)
+        finally:
+            lock.release()
 
-    with _lock:
-        PATTERNS[idx]["name"] = (name or PATTERNS[idx]["name"]).strip() or PATTERNS[idx]["name"]
-        PATTERNS[idx]["beats"] = beats
-        PATTERNS[idx]["fill"] = fill
-        state["pattern_changed"] = True  # forces step reset cleanly
+        note = None
+        if grid is not None:
+            # the click and whatever the layers play on this step, as one burst
+            note = grid.on[pos][beat_type]
+        elif beat_type == 1:
+            note = SOUNDS["accent"]
+        elif beat_type == 2:
+            note = SOUNDS["click"]
+        elif beat_type == 0:
+            note = None  # or give the pattern a "subdiv" layer (layers.py)
 
-    save_patterns()
+        if note is not None:
+            self._send_note(note, deadline, now)
+
+        if grid is not None and grid.between[pos]:
+            self._queue_layers(grid.between[pos], deadline, interval, now)
+
+        if pub_at is not None:
+            self._pub_out.put(self._scheduler, pub, pub_at, now)
+
+        if self._callback is not None:
+            args = _BEAT_ARGS[beat_type] if 0 <= beat_type <= 2 else (beat_type, False)
+            at = self._emit_time(self.callback_sink, deadline, now)
+            if at is None:
+                self._callback.put(args)
+            else:
+                self._cb_out.put(self._scheduler, args, at, now)
+
+        rec = self.recorder
+        if rec is not None:
+            rec.tick(due, now, beat_type, step, abs_step)
+
+        if listeners:
+            for fn in listeners:
+                fn(model)
+
+        if not self._clicked:
+            self._clicked = True
+            boot.mark("first click after start")
+
+        lead = self._lead
+        self._lead_used = lead
+        if lead:
+            nxt -= lead
+        if nxt < now:
+            nxt = now  # fell a whole step behind; don't burst to catch up
+        return nxt
+
+    def _queue_layers(self, events, deadline, interval, now):
+        # bursts between this step and the next, on a _layers_out slot (with a big
+        # lead the previous step's can still be pending on another)
+        out = self._layers_out
+        i = out.slot(now)
+        run = self._layer_runs[i]
+        run.events = events
+        run.i = 0
+        run.t0 = deadline - self.offsets["midi"]
+        run.interval = interval
+        out.start(self._scheduler, i, run, run.t0 + events[0][0] * interval)
+
+    def add_tick_listener(self, fn):
+        """
+        fn(model) runs on the scheduler thread after every step, so it must not block
+        (hand the model to a Sender/queue). model is a tuple:
+        (deadline, interval, abs_step, step, current_idx, bpm, fill_active, fill_pending, playing)
+        """
+        self._listeners.append(fn)
+
+    def remove_tick_listener(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def timing_model(self):
+        # same shape as the tick model, for the current (possibly stopped) state
+        with self._lock:
+            st = self.state
+            return (None, None, self._ticks, st["step"], st["current_idx"], st["bpm"],
+                    st["fill_active_bars"], st["fill_pending_bars"], st["playing"])
+
+    def follow(self, anchor, anchor_abs, anchor_step, interval, fill_active, fill_pending):
+        """
+        Lock our step grid to a remote timeline: step `anchor_abs` (pattern position
+        `anchor_step`) plays at local clock time `anchor`, then every `interval` seconds.
+        fill_* are the leader's counters just after that step.
+        """
+        with self._lock:
+            self._follow = (anchor, anchor_abs, anchor_step, interval,
+                            anchor_abs, fill_active, fill_pending)
+
+    def unfollow(self):
+        """
+        Back to our own tempo (the leader stopped or went away). tick() keeps _step
+        and _ticks on the leader's grid while following, so we carry on from the
+        step after the last one it imposed, at our own bpm from there.
+        """
+        with self._lock:
+            self._follow = None
+
+    def apply_remote(self, state, phase_deadline=None):
+        """
+        Take pattern, bpm and play state from a sync leader (beat_sync.py). `state`
+        holds current_idx, bpm, playing, fill_active_bars and fill_pending_bars;
+        out-of-range values are ignored and the fill counters only apply while
+        stopped (when playing they come with follow()). If this starts us playing,
+        the first step plays at `phase_deadline` (a point on the leader's grid)
+        rather than right away.
+        """
+        with self._lock:
+            st = self.state
+            keys = ("current_idx", "bpm", "playing", "fill_active_bars", "fill_pending_bars")
+            before = tuple(st[k] for k in keys)
+            idx = state["current_idx"]
+            if 0 <= idx < len(self.patterns):
+                st["current_idx"] = idx
+            if 30 <= state["bpm"] <= 300:
+                st["bpm"] = state["bpm"]
+            playing = bool(state["playing"])
+            started = playing and not before[2]
+            st["playing"] = playing
+            if not playing:
+                self._batch = None   # no next bar to wait for
+                st["fill_active_bars"] = state["fill_active_bars"]
+                st["fill_pending_bars"] = state["fill_pending_bars"]
+            if before != tuple(st[k] for k in keys):
+                self._bump()
+            lead = self._lead
+            if started:
+                self._lead_used = lead   # tick() adds it back to get the step's deadline
+        if started and self._job is not None:
+            if phase_deadline is None:
+                self._scheduler.wake(self._job)
+            else:
+                self._scheduler.reschedule(self._job, phase_deadline - lead)
+
+    def attach(self, sched, beat_callback=None):
+        """
+        Register with a Scheduler. beat_callback(beat_type, is_accent) -> optional
+        hook for LEDs/terminal visuals; it runs on its own Sender thread.
+        """
+        self._scheduler = sched
+        self._callback = Sender(f"{self.name}-callback", beat_callback, unpack=True) if beat_callback else None
+        self._job = sched.job(self.tick)
+        sched.wake(self._job)
+
+    def run_sequencer(self, beat_callback=None):
+        # Blocking: drive this engine from a private scheduler on the calling thread.
+        sched = scheduler.Scheduler(name=f"sequencer-{self.name}")
+        self.attach(sched, beat_callback)
+        sched.run()
+
+    def start(self, beat_callback=None, sched=None):
+        if self._thread_started:
+            return
+        self.load_patterns()
+        self.load_state()
+        # the click runs straight away (LED/screen first); MIDI joins when the port is open
+        self.attach(sched or scheduler.default_scheduler(), beat_callback)
+        self._thread_started = True
+        boot.mark("engine ready")
+        threading.Thread(target=self.init_midi, daemon=True, name=f"midi-{self.name}").start()
 
-def save_state():
-    with _lock:
-        data = {"bpm": state["bpm"], "idx": state["current_idx"]}
-    try:
-        with open(SAVE_FILE, "w") as f:
-            json.dump(data, f)
-    except Exception as e:
-        print(f"Error saving state: {e}")
 
+# ---- rooms: extra engines in the same process ----
 
-def load_state():
-    if not os.path.exists(SAVE_FILE):
-        return
-    try:
-        with open(SAVE_FILE, "r") as f:
-            data = json.load(f)
-        with _lock:
-            state["bpm"] = int(data.get("bpm", state["bpm"]))
-            state["current_idx"] = int(data.get("idx", state["current_idx"]))
-    except Exception as e:
-        print(f"Error loading state: {e}")
+_rooms = {}
+_rooms_lock = threading.Lock()
 
 
-def init_midi():
-    global _outport
+def _load_room_config():
+    # rooms.json (optional): {"booth": {"port": "USB MIDI 2"}, ...}
+    if not os.path.exists(ROOMS_FILE):
+        return {}
     try:
-        ports = mido.get_output_names()
-        if not ports:
-            print("MIDI: No output ports found (dummy mode).")
-            _outport = None
-            return
-
-        matching = [p for p in ports if ("USB" in p) or ("Alesis" in p)]
-        port_name = matching[0] if matching else ports[0]
-        _outport = mido.open_output(port_name)
-        print(f"MIDI: Connected to {port_name}")
+        with open(ROOMS_FILE, "r") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
     except Exception as e:
-        print(f"MIDI Error: {e}. Running in dummy mode.")
-        _outport = None
+        print(f"Error loading rooms: {e}")
+        return {}
 
 
-def _send_note(note, velocity=110, on_time=0.05):
-    if _outport is None:
-        return
-    try:
-        _outport.send(mido.Message("note_on", note=note, velocity=velocity, channel=MIDI_CHANNEL))
-        time.sleep(on_time)
-        _outport.send(mido.Message("note_off", note=note, velocity=0, channel=MIDI_CHANNEL))
-    except Exception as e:
-        print(f"MIDI send error: {e}")
+def valid_room_id(room_id) -> bool:
+    # "default" is the default engine's name (MIDI port cache, web long-poll state)
+    return bool(_ROOM_ID_RE.match(str(room_id or ""))) and room_id != "default"
 
 
-def set_bpm(new_bpm: int):
-    if not (30 <= int(new_bpm) <= 300):
-        return
-    with _lock:
-        state["bpm"] = int(new_bpm)
-    save_state()
+def get_room(room_id, create=True):
+    """
+    Engine for a named room, created and started on first use, or None if it
+    doesn't exist and can't be created: rooms in rooms.json always can, others
+    only while fewer than MAX_ROOMS of those are open.
+    Each room keeps its own settings/patterns files (dh2_settings_<id>.json, patterns_<id>.json).
+    """
+    if not valid_room_id(room_id):
+        raise ValueError("Bad room id")
+    with _rooms_lock:
+        eng = _rooms.get(room_id)
+        if eng is not None or not create:
+            return eng
+        config = _load_room_config()
+        cfg = config.get(room_id)
+        if cfg is None and sum(1 for r in _rooms if r not in config) >= MAX_ROOMS:
+            return None
+        cfg = cfg or {}
+        eng = Engine(
+            name=room_id,
+            save_file=f"dh2_settings_{room_id}.json",
+            patterns_file=f"patterns_{room_id}.json",
+            port_match=cfg.get("port"),
+        )
+        _rooms[room_id] = eng
+    eng.start()
+    return eng
+
+
+def rooms():
+    with _rooms_lock:
+        return dict(_rooms)
+
+
+# ---- module-level API (default engine) used by the existing front-ends ----
+
+_default = Engine()
+_sync = None
+_realtime = None
+_osc = None
+
+state = _default.state
+PATTERNS = _default.patterns
 
 
-def adjust_bpm(delta: int):
-    with _lock:
-        bpm = state["bpm"]
-    set_bpm(bpm + int(delta))
+def patterns_default():
+    return _default.export_patterns()
 
+def save_patterns():
+    _default.save_patterns()
 
-def set_pattern(idx: int):
-    idx = int(idx)
-    if not (0 <= idx < len(PATTERNS)):
-        return
-    with _lock:
-        state["current_idx"] = idx
-        state["pattern_changed"] = True
-    save_state()
-    print(f"Pattern: {PATTERNS[idx]['name']}")
-
-def request_fill(bars: int = 1):
-    bars = int(bars)
-    if bars < 1:
-        return
-    bars = min(FILL_MAX_BARS, bars)
+def load_patterns():
+    _default.load_patterns()
 
-    with _lock:
-        if not state["playing"]:
-            return
-        # queue to start at the next bar boundary
-        state["fill_pending_bars"] = min(FILL_MAX_BARS, state["fill_pending_bars"] + bars)
-
-def next_button_action():
-    # Stopped -> next pattern (current behavior)
-    # Playing -> request 1 bar fill (press twice to request 2 bars)
-    with _lock:
-        playing = state["playing"]
-    if playing:
-        request_fill(1)
-    else:
-        next_pattern()
+def update_pattern_from_text(idx: int, name: str, beats_text: str, fill_text: str):
+    _default.update_pattern_from_text(idx, name, beats_text, fill_text)
 
+def save_state():
+    _default.save_state()
 
-def next_pattern():
-    with _lock:
-        idx = state["current_idx"]
-    set_pattern((idx + 1) % len(PATTERNS))
+def load_state():
+    _default.load_state()
 
+def init_midi():
+    _default.init_midi()
 
-def toggle_play():
-    global _tap_times
-    with _lock:
-        state["playing"] = not state["playing"]
-        playing = state["playing"]
-    if playing:
-        _tap_times = []
-    return playing
+def set_bpm(new_bpm: int, save=True):
+    _default.set_bpm(new_bpm, save)
 
+def adjust_bpm(delta: int):
+    _default.adjust_bpm(delta)
 
-def handle_start():
-    playing = toggle_play()
-    with _lock:
-        name = PATTERNS[state["current_idx"]]["name"]
-        bpm = state["bpm"]
-    if playing:
-        print(f"Started: {name} at {bpm} BPM")
-    else:
-        print("Stopped")
+def set_pattern(idx: int, save=True):
+    _default.set_pattern(idx, save)
 
+def request_fill(bars: int = 1, t=None):
+    _default.request_fill(bars, t)
 
-def handle_tap():
-    global _tap_times
-    now = time.time()
+def next_button_action(t=None):
+    _default.next_button_action(t)
 
-    if _tap_times and (now - _tap_times[-1] > 2.0):
-        _tap_times = []
+def next_pattern():
+    _default.next_pattern()
 
-    _tap_times.append(now)
-    _tap_times = _tap_times[-4:]
+def toggle_play():
+    return _default.toggle_play()
 
-    if len(_tap_times) >= 2:
-        intervals = [t - s for s, t in zip(_tap_times, _tap_times[1:])]
-        avg_interval = sum(intervals) / len(intervals)
-        if avg_interval > 0:
-            new_bpm = int(60.0 / avg_interval)
-            if 30 < new_bpm < 300:
-                set_bpm(new_bpm)
-                print(f"Tap Tempo: {new_bpm} BPM")
+def handle_start():
+    _default.handle_start()
 
+def handle_tap(t=None):
+    _default.handle_tap(t)
 
 def get_status():
-    with _lock:
-        return {
-            "bpm": state["bpm"],
-            "playing": state["playing"],
-            "current_idx": state["current_idx"],
-            "pattern_name": PATTERNS[state["current_idx"]]["name"],
-            "step": state.get("step", 0),
-            "pattern_len": len(PATTERNS[state["current_idx"]]["beats"]),
-            "last_beat_type": state.get("last_beat_type", 0),
-            "beat_count": state.get("beat_count", 0),
-            "has_fill": bool(PATTERNS[state["current_idx"]].get("fill")),
-            "fill_pending_bars": state.get("fill_pending_bars", 0),
-            "fill_active_bars": state.get("fill_active_bars", 0),
-        }
-
+    return _default.get_status()
 
-def run_sequencer(beat_callback=None):
-    """
-    beat_callback(beat_type, is_accent) -> optional hook for LEDs/terminal visuals.
-    """
-    step = 0
-    last_beat_time = time.time()
-
-    while True:
-        with _lock:
-            playing = state["playing"]
-            bpm = state["bpm"]
-            idx = state["current_idx"]
-            changed = state["pattern_changed"]
+def apply_batch(commands, at="now"):
+    return _default.apply_batch(commands, at)
 
-        if not playing:
-            time.sleep(0.05)
-            continue
+def set_offsets(**ms):
+    _default.set_offsets(**ms)
 
-        if changed:
-            step = 0
-            with _lock:
-                state["step"] = 0
-                state["pattern_changed"] = False
+def get_offsets():
+    return _default.get_offsets()
 
-        p = PATTERNS[idx]
-        main = p["beats"]
-        fill = p.get("fill")
+def set_sinks(callback=None, status=None):
+    _default.set_sinks(callback, status)
 
-        # At bar boundary (step==0), decide whether to start/continue a fill
-        if step % len(main) == 0:
-            with _lock:
-                if state.get("fill_active_bars", 0) > 0:
-                    # continue fill, decrement bar count now that a new bar is starting
-                    state["fill_active_bars"] -= 1
-                # if no active fill bars remaining, start queued fill
-                if state.get("fill_active_bars", 0) <= 0 and state.get("fill_pending_bars", 0) > 0:
-                    state["fill_active_bars"] = state["fill_pending_bars"]
-                    state["fill_pending_bars"] = 0
-
-        with _lock:
-            fill_active = state.get("fill_active_bars", 0)
-
-        use_fill = (fill_active > 0) and (fill is not None)
-        pattern = fill if use_fill else main
-        beat_type = pattern[step % len(pattern)]
-        
-        note = None
-        is_accent = False
-        if beat_type == 1:
-            note = SOUNDS["accent"]
-            is_accent = True
-        elif beat_type == 2:
-            note = SOUNDS["click"]
-        elif beat_type == 0:
-            note = None  # set to SOUNDS["subdiv"] if you want audible subdivisions
-
-        with _lock:
-            state["last_beat_type"] = beat_type
-            state["beat_count"] = step
-            state["step"] = step % len(pattern)
+def run_sequencer(beat_callback=None):
+    _default.run_sequencer(beat_callback)
 
-        if beat_callback is not None:
-            try:
-                beat_callback(beat_type, is_accent)
-            except Exception as e:
-                print(f"beat_callback error: {e}")
+def start_engine(beat_callback=None, sync=None, realtime=None, process=None, record=None,
+                 listen=None, osc=None):
+    """
+    process: run the click in its own sequencer process and talk to it through
+    shared memory (defaults to $DRUMASSIST_PROCESS, see sequencer_process.py).
+    That process takes its sync/realtime options from the environment.
+    sync: "leader" / "follower" to phase-lock with other nodes on the LAN
+    (defaults to $DRUMASSIST_SYNC, see beat_sync.py).
+    realtime: True or a dict of realtime.enable() options to give the sequencer
+    thread RT priority, a dedicated core, locked memory and deferred GC
+    (defaults to $DRUMASSIST_REALTIME, see realtime.py).
+    record: directory to log a performance recording to (defaults to
+    $DRUMASSIST_RECORD, see recorder.py).
+    listen: True or a MIDI input name to match, to score the drummer's timing
+    against the click (defaults to $DRUMASSIST_LISTEN, see accuracy.py).
+    osc: UDP port for the OSC control/beat server, True for the default one
+    (defaults to $DRUMASSIST_OSC, see osc_server.py).
+    """
+    global _default, _sync, _realtime
+    process = process if process is not None else os.environ.get("DRUMASSIST_PROCESS", "") not in ("", "0")
+    if process:
+        import sequencer_process
+        if not isinstance(_default, sequencer_process.ProcessEngine):
+            _default = sequencer_process.ProcessEngine(patterns=PATTERNS)
+        _default.start(beat_callback)
+        if listen or os.environ.get("DRUMASSIST_LISTEN"):
+            print("Timing analysis needs the in-process sequencer; skipped.")
+        _start_osc(osc, beats=False)
+        return
+    record = record or os.environ.get("DRUMASSIST_RECORD")
+    if record and record != "0" and _default.recorder is None:
+        import recorder
+        _default.set_recorder(recorder.Recorder("recordings" if record in ("1", True) else record))
+    _default.start(beat_callback)
+    listen = listen or os.environ.get("DRUMASSIST_LISTEN")
+    if listen and listen != "0" and _default.analyzer is None:
+        import accuracy
+        accuracy.start(_default, None if listen in ("1", True) else listen)
+    sync = sync or os.environ.get("DRUMASSIST_SYNC")
+    if sync and _sync is None:
+        import beat_sync
+        _sync = beat_sync.start(_default, sync)
+
+    _start_osc(osc)
+
+    import realtime as rt
+    opts = rt.from_env() if realtime is None else realtime
+    if opts and _realtime is None:
+        _realtime = rt.enable(scheduler.default_scheduler(), **(opts if isinstance(opts, dict) else {}))
+
+
+def _start_osc(osc, beats=True):
+    global _osc
+    if _osc is not None:
+        return
+    import osc_server
+    if osc is None:
+        conf = osc_server.from_env()
+    else:
+        conf = (osc_server.PORT if osc is True else int(osc), []) if osc else None
+    if not conf:
+        return
+    try:
+        _osc = osc_server.start(_default, conf[0], conf[1], beats=beats)
+    except OSError as e:
+        print(f"OSC: can't listen on UDP {conf[0]}: {e}")
 
-        if note is not None:
-            _send_note(note, velocity=110, on_time=0.05)
 
-        # timing
-        sleep_time = 60.0 / max(30, bpm)
-        if len(pattern) > 4:
-            sleep_time /= 2  # simple heuristic for 8th-note grids
+def accuracy_summary():
+    an = _default.analyzer
+    return an.summary() if an is not None else {"enabled": False}
 
-        elapsed = time.time() - last_beat_time
-        remaining = sleep_time - elapsed
-        if remaining > 0:
-            time.sleep(remaining)
-        last_beat_time = time.time()
 
-        step = (step + 1) % len(pattern)
+def startup_complete():
+    # Entry points call this once their own (lazy) imports are done, so gc.freeze()
+    # also covers Flask/gpiozero rather than just what was loaded before start_engine.
+    boot.mark("startup complete")
+    if _realtime and not _realtime.get("gc", "skipped").startswith("skipped"):
+        import realtime as rt
+        rt.control_gc(scheduler.default_scheduler())
 
 
-def start_engine(beat_callback=None):
-    global _thread_started
-    if _thread_started:
-        return
-    load_state()
-    load_patterns()
-    init_midi()
-    t = threading.Thread(target=run_sequencer, args=(beat_callback,), daemon=True)
-    t.start()
-    _thread_started = True
+def metrics():
+    import realtime as rt
+    if _default.remote_sequencer:
+        return {"lateness": None, "applied": None, "gc": None,
+                "error": "n/a in process mode: the click runs in the sequencer process"}
+    out = {"lateness": scheduler.default_scheduler().lateness_stats()}
+    out.update(rt.status())
+    return out
@@ -0,0 +1,86 @@
+# inputs.py
+#
+# Button/keyboard input for the engine. Callback threads (gpiozero, keyboard)
+# only stamp the time and enqueue; a worker applies the actions with that
+# timestamp, so wake-up delay and debounce don't end up in the tap tempo.
+import queue
+import threading
+import time
+
+import scheduler
+
+clock = scheduler.clock
+
+DEBOUNCE = 0.05  # seconds; bounces inside this window are dropped, the first edge wins
+
+
+class InputQueue:
+    """
+    (event, timestamp) pairs -> engine actions.
+    Events: "tap", "start", "next", "fill", "pattern", "bpm_up", "bpm_down".
+    eng can be an Engine or the engine module itself. after(event) runs once an
+    event has been applied (e.g. to update a status LED).
+    """
+
+    def __init__(self, eng, debounce=DEBOUNCE, after=None):
+        self.engine = eng
+        self.debounce = debounce
+        self.after = after
+        self._last = {}
+        self._q = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="inputs")
+        self._thread.start()
+
+    def press(self, event, t=None):
+        # stamp first: everything after this line is latency we don't want to measure
+        if t is None:
+            t = clock()
+        last = self._last.get(event)
+        if last is not None and 0 <= t - last < self.debounce:
+            return
+        self._last[event] = t
+        self._q.put((event, t))
+
+    def handler(self, event):
+        """Zero-arg callback for gpiozero's when_pressed."""
+        def on_edge():
+            self.press(event, clock())
+        return on_edge
+
+    def key_handler(self, event):
+        """Callback for keyboard.on_press_key: uses the hook's own event time when it has one."""
+        def on_key(e=None):
+            t = clock()
+            ev_time = getattr(e, "time", None)
+            if ev_time:
+                # keyboard stamps events with time.time() when the OS hook fires
+                t -= max(0.0, min(1.0, time.time() - ev_time))
+            self.press(event, t)
+        return on_key
+
+    def _run(self):
+        eng = self.engine
+        while True:
+            event, t = self._q.get()
+            try:
+                if event == "tap":
+                    eng.handle_tap(t)
+                elif event == "start":
+                    eng.handle_start()
+                elif event == "next":
+                    eng.next_button_action(t)
+                elif event == "fill":
+                    eng.request_fill(1, t)
+                elif event == "pattern":
+                    eng.next_pattern()
+                elif event == "bpm_up":
+                    eng.adjust_bpm(5)
+                elif event == "bpm_down":
+                    eng.adjust_bpm(-5)
+                else:
+                    print(f"Unknown input event: {event}")
+                    continue
+                if self.after is not None:
+                    self.after(event)
+            except Exception as e:
+                print(f"Input error ({event}): {e}")
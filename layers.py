@@ -0,0 +1,147 @@
+# layers.py
+#
+# Extra sound layers on top of a pattern's click: a 3-against-4 cowbell, a 16th
+# hi-hat, an accent layer... Each layer has its own length and its own subdivision
+# of the bar. They're merged once, when the pattern is loaded, into one event grid
+# over their common (LCM) period, so the sequencer does the same small amount of
+# work per step however many layers there are, and notes that fall at the same
+# time go out as one burst.
+#
+# In patterns.json:
+#
+#   {"name": "4/4 + 3 over 4", "beats": [1, 2, 2, 2],
+#    "layers": [
+#      {"sound": "cowbell", "beats": [1, 2, 2]},                    # triplet quarters (3 per bar)
+#      {"sound": "subdiv", "beats": "x x x x x x x x x x x x x x x x"},  # 16ths
+#      {"sound": 56, "beats": [1, 0, 2], "div": 4}                  # 3-step cycle on quarters
+#    ]}
+#
+# sound: a name from engine.SOUNDS or a MIDI note. beats: 1 = accented hit,
+# 2 = hit, 0 = rest (a list, or text like the pattern editor's). div: steps per
+# bar, default one cycle per bar (len(beats)); a length that isn't div gives a
+# layer that drifts against the bar (polymeter) until the period comes round.
+from math import gcd
+
+MAX_LAYERS = 16
+MAX_DIV = 96               # steps per bar in one layer
+MAX_PERIOD_BARS = 64       # layers must line up again within this many bars
+MAX_UNITS = 1920           # finest grid (LCM of the divisions) per bar
+ACCENT = 128               # added to a note number in a burst key: play it at ACCENT_VELOCITY
+ACCENT_VELOCITY = 127
+
+
+def _lcm(a, b):
+    return a * b // gcd(a, b)
+
+
+def clean_layers(raw, sounds):
+    """Validate a pattern's "layers" list from JSON/the web. Raises ValueError."""
+    from engine import parse_rhythm
+    if raw is None:
+        return None
+    if not isinstance(raw, list):
+        raise ValueError("layers must be a list")
+    if len(raw) > MAX_LAYERS:
+        raise ValueError(f"at most {MAX_LAYERS} layers")
+    out = []
+    units = 1
+    for i, layer in enumerate(raw, 1):
+        if not isinstance(layer, dict):
+            raise ValueError(f"layer {i}: expected an object")
+        sound = layer.get("sound")
+        note = sounds.get(sound) if isinstance(sound, str) else sound
+        if not isinstance(note, int) or isinstance(note, bool) or not (0 <= note <= 127):
+            raise ValueError(f"layer {i}: sound must be one of {', '.join(sounds)} or a MIDI note")
+        beats = layer.get("beats")
+        beats = parse_rhythm(beats) if isinstance(beats, str) else [int(b) for b in beats or []]
+        if not beats or any(b not in (0, 1, 2) for b in beats):
+            raise ValueError(f"layer {i}: beats must be 0/1/2 (or A/x/.) and not empty")
+        div = int(layer.get("div", len(beats)))
+        if not (1 <= div <= MAX_DIV):
+            raise ValueError(f"layer {i}: div must be 1-{MAX_DIV}")
+        units = _lcm(units, div)
+        if units > MAX_UNITS:
+            raise ValueError(f"layer {i}: divisions need a grid of {units} per bar "
+                             f"(max {MAX_UNITS}); use divisions with common factors")
+        clean = {"sound": sound, "beats": beats, "div": div}
+        if layer.get("name"):
+            clean["name"] = str(layer["name"])
+        out.append(clean)
+    return out or None
+
+
+def _key(notes):
+    # burst key: None, a plain note (the engine's usual single message) or a tuple
+    if not notes:
+        return None
+    if len(notes) == 1 and notes[0] < ACCENT:
+        return notes[0]
+    return notes
+
+
+def _merge(*groups):
+    # one note per pitch; an accented hit wins over a plain one
+    by_note = {}
+    for g in groups:
+        for n in g:
+            by_note[n % ACCENT] = max(by_note.get(n % ACCENT, 0), n)
+    return tuple(sorted(by_note.values()))
+
+
+class Grid:
+    """
+    A pattern's layers compiled against its bar of `bar_steps` main steps.
+    steps: period in main steps (a whole number of bars).
+    on[pos]: burst keys for the step at pos, indexed by the main beat type
+      (0 rest, 1 accent, 2 click), so the click note joins the layers' burst.
+    between[pos]: ((fraction of the step, burst key), ...) strictly inside the step.
+    """
+    __slots__ = ("steps", "on", "between")
+
+    def __init__(self, steps, on, between):
+        self.steps = steps
+        self.on = on
+        self.between = between
+
+
+def compile_grid(bar_steps, layers, sounds):
+    if not layers:
+        return None
+    units = bar_steps                        # grid units per bar
+    for layer in layers:
+        units = _lcm(units, layer["div"])
+    if units > MAX_UNITS:
+        raise ValueError(f"a {bar_steps}-step bar and these layers need a grid of {units} "
+                         f"per bar (max {MAX_UNITS})")
+    period = units                           # grid units per period
+    for layer in layers:
+        period = _lcm(period, len(layer["beats"]) * (units // layer["div"]))
+    if period // units > MAX_PERIOD_BARS:
+        raise ValueError(f"layers only line up again after {period // units} bars "
+                         f"(max {MAX_PERIOD_BARS})")
+
+    events = {}
+    for layer in layers:
+        sound = layer["sound"]
+        note = sounds[sound] if isinstance(sound, str) else sound
+        beats = layer["beats"]
+        stride = units // layer["div"]
+        for j in range(period // stride):
+            b = beats[j % len(beats)]
+            if b:
+                events.setdefault(j * stride, []).append(note + ACCENT if b == 1 else note)
+
+    # walk the onsets, not every grid unit: work grows with the notes played
+    per_step = units // bar_steps
+    steps = period // per_step
+    mains = ((), (sounds["accent"],), (sounds["click"],))
+    plain = tuple(_key(m) for m in mains)
+    on = [plain] * steps
+    between = [[] for _ in range(steps)]
+    for u in sorted(events):
+        pos, k = divmod(u, per_step)
+        if k:
+            between[pos].append((k / per_step, _key(_merge(events[u]))))
+        else:
+            on[pos] = tuple(_key(_merge(events[u], m)) for m in mains)
+    return Grid(steps, tuple(on), tuple(tuple(b) for b in between))
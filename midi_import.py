@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# midi_import.py
+#
+# Bulk import of drum-loop .mid files into the pattern store. Per file: read the
+# notes through mido, detect the grid (quarters or 8ths - what the sequencer can
+# play) and quantize onsets to it with NumPy, map kick -> accent, snare/toms ->
+# click, hats/cymbals -> rest, then take the most common bar as the main groove
+# and a differing last bar as its fill.
+#
+#   python3 midi_import.py grooves/                 # whole directory, all cores
+#   python3 midi_import.py a.mid b.mid --jobs 1 --dry-run
+#   python3 midi_import.py grooves/ --patterns patterns_booth.json
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import Engine, PATTERNS_FILE, rhythm_to_text
+
+DRUM_CHANNEL = 9
+KICK = {35, 36}
+SNARE = {37, 38, 39, 40}                         # incl. rim and clap
+TOMS = {41, 43, 45, 47, 48, 50}
+# priority when several notes land on one step: accent > click > rest
+REST, CLICK, ACCENT = 0, 1, 2
+TO_BEAT = {REST: 0, CLICK: 2, ACCENT: 1}        # rank -> parse_rhythm beat value
+
+GRIDS = (1, 2)           # steps per beat the sequencer can play: quarters, 8ths
+GRID_NAMES = {1: "quarters", 2: "8ths"}
+GRID_TOLERANCE = 0.12    # mean error (fraction of a step) a grid may have to be chosen
+BATCH = 50               # patterns written per save
+
+
+def _rank(note):
+    if note in KICK:
+        return ACCENT
+    if note in SNARE or note in TOMS:
+        return CLICK
+    return REST
+
+
+def read_notes(path):
+    """(onsets in beats, ranks, beats per bar, seconds per beat) for one file."""
+    import mido
+    mid = mido.MidiFile(path)
+    tpb = mid.ticks_per_beat
+    tempo = 500000
+    beats_per_bar = 4.0
+    notes = []
+    drums_only = False
+    for track in mid.tracks:
+        tick = 0
+        for msg in track:
+            tick += msg.time
+            if msg.type == "set_tempo" and tick == 0:
+                tempo = msg.tempo
+            elif msg.type == "time_signature" and tick == 0:
+                beats_per_bar = msg.numerator * 4.0 / msg.denominator
+            elif msg.type == "note_on" and msg.velocity > 0:
+                if msg.channel == DRUM_CHANNEL and not drums_only:
+                    # a drum channel exists: ignore everything that isn't on it
+                    drums_only = True
+                    notes = [n for n in notes if n[2]]
+                if msg.channel == DRUM_CHANNEL or not drums_only:
+                    notes.append((tick, msg.note, msg.channel == DRUM_CHANNEL))
+    notes.sort()
+    onsets = [t / tpb for t, _, _ in notes]
+    ranks = [_rank(n) for _, n, _ in notes]
+    return onsets, ranks, beats_per_bar, tempo / 1e6
+
+
+def quantize(onsets, steps_per_beat):
+    """Snap onsets to a grid. Returns (step indexes, per-onset error in steps)."""
+    import numpy as np
+    pos = np.asarray(onsets, dtype=float) * steps_per_beat
+    idx = np.rint(pos)
+    return idx.astype(np.intp), np.abs(pos - idx)
+
+
+def plays_as(beats_per_bar, steps_per_beat):
+    # the sequencer plays patterns longer than 4 steps as 8ths, shorter as quarters
+    return 2 if beats_per_bar * steps_per_beat > 4 else 1
+
+
+def extract(path, steps_per_beat=None):
+    """Import one file: {"name", "beats", "fill", "report"}; runs in a worker process."""
+    import numpy as np
+    t0 = time.perf_counter()
+    onsets, ranks, beats_per_bar, spb = read_notes(path)
+    if not onsets:
+        raise ValueError("no drum notes")
+
+    warnings = []
+
+    def ms(e, sub):
+        # error in steps of a `sub`-per-beat grid -> ms at the file's tempo
+        return e * spb / sub * 1000.0
+
+    if steps_per_beat:
+        # --grid: use it, but say so if it doesn't fit the file or the sequencer
+        sub = steps_per_beat
+        idx, err = quantize(onsets, sub)
+        if err.mean() > GRID_TOLERANCE:
+            warnings.append(f"notes are {ms(err.mean(), sub):.0f} ms off the {GRID_NAMES[sub]} "
+                            f"grid on average (max {ms(err.max(), sub):.0f} ms)")
+        if plays_as(beats_per_bar, sub) != sub:
+            warnings.append(f"a {beats_per_bar:g}-beat bar of {GRID_NAMES[sub]} plays as "
+                            f"{GRID_NAMES[plays_as(beats_per_bar, sub)]} (wrong speed)")
+    else:
+        # the coarsest grid that fits and that the sequencer plays at the right speed
+        tried = []
+        for sub in GRIDS:
+            if plays_as(beats_per_bar, sub) != sub:
+                continue
+            idx, err = quantize(onsets, sub)
+            if err.mean() <= GRID_TOLERANCE:
+                break
+            tried.append(f"{GRID_NAMES[sub]} {ms(err.mean(), sub):.0f} ms "
+                         f"(max {ms(err.max(), sub):.0f} ms)")
+        else:
+            raise ValueError(f"no playable grid fits a {beats_per_bar:g}-beat bar, mean error "
+                             + ", ".join(tried) + "; try --grid")
+    steps = int(round(beats_per_bar * sub))
+    if steps < 1 or abs(beats_per_bar * sub - steps) > 1e-6:
+        raise ValueError(f"{beats_per_bar:g} beats per bar doesn't fit a {sub}-per-beat grid")
+
+    # bars the file's notes actually fall in, before quantizing: a last hit played a
+    # touch early can snap onto the next bar's downbeat, which is the loop's first
+    # one coming round again - fold it back rather than start a near-empty bar
+    n_bars = int(max(onsets) // beats_per_bar) + 1
+    idx %= n_bars * steps
+    grid = np.zeros(n_bars * steps, dtype=np.int8)
+    np.maximum.at(grid, idx, np.asarray(ranks, dtype=np.int8))
+    bars = grid.reshape(n_bars, steps)
+
+    # main = most common bar with anything on it; fill = the last bar if it differs
+    played = bars[bars.any(axis=1)] if bars.any() else bars
+    uniq, counts = np.unique(played, axis=0, return_counts=True)
+    main = uniq[counts.argmax()]
+    last = bars[-1]
+    fill = last if n_bars > 1 and last.any() and not np.array_equal(last, main) else None
+
+    to_beat = np.array([TO_BEAT[REST], TO_BEAT[CLICK], TO_BEAT[ACCENT]])
+    return {
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "beats": to_beat[main].tolist(),
+        "fill": to_beat[fill].tolist() if fill is not None else None,
+        "report": {
+            "file": path,
+            "notes": len(onsets),
+            "bars": n_bars,
+            "grid": GRID_NAMES[sub],
+            "err_mean_ms": float(ms(err.mean(), sub)),
+            "err_max_ms": float(ms(err.max(), sub)),
+            "err_mean_pct": float(err.mean() * 100.0),
+            "warnings": warnings,
+            "seconds": time.perf_counter() - t0,
+        },
+    }
+
+
+def _safe_extract(args):
+    path, steps_per_beat = args
+    try:
+        return extract(path, steps_per_beat), None
+    except Exception as e:
+        return None, f"{path}: {str(e) or type(e).__name__}"
+
+
+def find_files(paths):
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, names in os.walk(p):
+                files.extend(os.path.join(root, n) for n in sorted(names)
+                             if n.lower().endswith((".mid", ".midi")))
+        else:
+            files.append(p)
+    return files
+
+
+def import_files(files, jobs=None, steps_per_beat=None):
+    """Yields (result, error) per file, in order; a process pool when jobs != 1."""
+    work = [(f, steps_per_beat) for f in files]
+    if jobs == 1 or len(files) < 2:
+        yield from map(_safe_extract, work)
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(_safe_extract, work, chunksize=4)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Import drum grooves from MIDI files into patterns")
+    ap.add_argument("paths", nargs="+", help=".mid files or directories")
+    ap.add_argument("--patterns", default=PATTERNS_FILE, help="pattern store to write")
+    ap.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    ap.add_argument("--grid", choices=("auto", "4", "8"), default="auto",
+                    help="use quarters (4) or 8ths (8) instead of detecting; warns if it doesn't fit")
+    ap.add_argument("--dry-run", action="store_true", help="report only, don't write patterns")
+    args = ap.parse_args()
+
+    files = find_files(args.paths)
+    if not files:
+        print("No MIDI files found")
+        return 1
+    steps_per_beat = {"auto": None, "4": 1, "8": 2}[args.grid]
+
+    eng = Engine(name="import", save_file=None, patterns_file=args.patterns)
+    eng.load_patterns()
+
+    t0 = time.perf_counter()
+    batch = []
+    added = replaced = failed = 0
+    print(f"{'file':32} {'notes':>5} {'bars':>4} {'grid':>8} {'err ms':>7} {'max ms':>7} {'ms':>6}  groove | fill")
+    for result, error in import_files(files, args.jobs, steps_per_beat):
+        if error:
+            failed += 1
+            print(f"  skipped {error}")
+            continue
+        r = result["report"]
+        fill = rhythm_to_text(result["fill"]) if result["fill"] else "-"
+        print(f"{os.path.basename(r['file'])[:32]:32} {r['notes']:>5} {r['bars']:>4} {r['grid']:>8} "
+              f"{r['err_mean_ms']:>7.1f} {r['err_max_ms']:>7.1f} {r['seconds'] * 1000:>6.1f}  "
+              f"{rhythm_to_text(result['beats'])} | {fill}")
+        for w in r["warnings"]:
+            print(f"  warning: {w}")
+        batch.append(result)
+        if len(batch) >= BATCH and not args.dry_run:
+            a, b = eng.add_patterns(batch)
+            added, replaced, batch = added + a, replaced + b, []
+    if batch and not args.dry_run:
+        a, b = eng.add_patterns(batch)
+        added, replaced = added + a, replaced + b
+
+    print(f"{len(files)} files in {time.perf_counter() - t0:.2f} s: {added} added, {replaced} replaced, "
+          f"{failed} skipped" + (" (dry run)" if args.dry_run else f" -> {args.patterns}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+#!/usr/bin/env python3
+# osc_server.py
+#
+# Open Sound Control over UDP, for DAWs and lighting desks. Incoming messages drive
+# the engine; every step goes out to subscribers as an OSC bundle time-tagged with
+# the beat's own time, so the receiver can line it up (or schedule it) itself.
+#
+#   DRUMASSIST_OSC=1 python3 drum_assist_web.py               # port 9000
+#   DRUMASSIST_OSC=9100 DRUMASSIST_OSC_TARGETS=192.168.4.20:7000 python3 drum_assist2.py
+#   python3 osc_server.py bench --rate 5000                   # loopback client test
+#
+# In:   /drumassist/bpm <bpm>        /drumassist/tap             /drumassist/toggle
+#       /drumassist/pattern <idx>    /drumassist/fill [bars]     /drumassist/status
+#       /drumassist/subscribe [port] /drumassist/unsubscribe [port]
+# Out:  /drumassist/beat abs_step step beat_type bpm pattern fill_active   (in a bundle)
+#       /drumassist/status bpm pattern playing                            (reply)
+#
+# The codec is plain struct - int32, float32, string, blob, T/F/N, int64, double;
+# bundles nest. Datagrams waiting on the socket are read as one batch: bpm and
+# pattern are latest-wins within it, taps/fills/toggles apply in order, each stamped
+# on arrival or with its bundle's time tag when that's a sane time. The settings file
+# is only written once bpm/pattern have been left alone for SAVE_SETTLE, so a fader
+# sweep doesn't become a stream of SD-card writes.
+#
+# /subscribe is only taken from addresses on $DRUMASSIST_OSC_ALLOW (comma-separated
+# networks, default the private/loopback ranges), and lapses unless it's sent again
+# within SUBSCRIBE_TTL - otherwise one spoofed packet would point the beat stream at
+# anyone. DRUMASSIST_OSC_TARGETS are fixed and never lapse.
+import ipaddress
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+
+import scheduler
+
+clock = scheduler.clock
+
+PORT = 9000
+PREFIX = "/drumassist/"
+MAX_SUBSCRIBERS = 16
+SUBSCRIBE_TTL = 60.0    # seconds a /subscribe lasts unless it's sent again
+LOCAL_NETS = "127.0.0.0/8,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,169.254.0.0/16"
+ALLOW = os.environ.get("DRUMASSIST_OSC_ALLOW", LOCAL_NETS)
+MAX_DATAGRAM = 8192
+MAX_BATCH = 64          # datagrams applied together, so a steady stream still gets applied
+SAVE_SETTLE = 1.0       # seconds without bpm/pattern changes before the settings are saved
+TAG_WINDOW = 1.0        # bundle time tags further than this from now are ignored for taps
+NTP_EPOCH = 2208988800  # 1900 -> 1970
+IMMEDIATE = 1           # OSC "now" time tag
+COMMANDS = ("bpm", "pattern", "tap", "fill", "toggle", "status", "subscribe", "unsubscribe")
+
+_I32 = struct.Struct(">i")
+_F32 = struct.Struct(">f")
+_I64 = struct.Struct(">q")
+_F64 = struct.Struct(">d")
+_U64 = struct.Struct(">Q")
+BUNDLE = b"#bundle\0"
+
+
+# ---- codec ----
+
+def _pad(b):
+    return b + b"\0" * (4 - len(b) % 4)
+
+
+def _blob(b):
+    b = bytes(b)
+    return _I32.pack(len(b)) + b + b"\0" * (-len(b) % 4)
+
+
+def encode_message(address, *args):
+    tags = ","
+    data = []
+    for a in args:
+        if a is True:
+            tags += "T"
+        elif a is False:
+            tags += "F"
+        elif a is None:
+            tags += "N"
+        elif isinstance(a, int):
+            if -2**31 <= a < 2**31:
+                tags += "i"
+                data.append(_I32.pack(a))
+            else:
+                tags += "h"
+                data.append(_I64.pack(a))
+        elif isinstance(a, float):
+            tags += "f"
+            data.append(_F32.pack(a))
+        elif isinstance(a, str):
+            tags += "s"
+            data.append(_pad(a.encode()))
+        elif isinstance(a, (bytes, bytearray, memoryview)):
+            tags += "b"
+            data.append(_blob(a))
+        else:
+            raise TypeError(f"Can't send {type(a).__name__} over OSC")
+    return _pad(address.encode()) + _pad(tags.encode()) + b"".join(data)
+
+
+def encode_bundle(timetag, *elements):
+    """timetag: NTP 64-bit fixed point (see to_timetag); elements: encoded messages/bundles."""
+    return BUNDLE + _U64.pack(timetag) + b"".join(_I32.pack(len(e)) + e for e in elements)
+
+
+def _string(data, i):
+    end = data.index(b"\0", i)
+    return data[i:end].decode("utf-8", "replace"), (end + 4) & ~3
+
+
+def decode_message(data):
+    """One OSC message -> (address, [args])."""
+    address, i = _string(data, 0)
+    if i >= len(data) or data[i:i + 1] != b",":
+        return address, []   # old-style message without a type tag string
+    tags, i = _string(data, i)
+    args = []
+    for t in tags[1:]:
+        if t == "i":
+            args.append(_I32.unpack_from(data, i)[0])
+            i += 4
+        elif t == "f":
+            args.append(_F32.unpack_from(data, i)[0])
+            i += 4
+        elif t == "s" or t == "S":
+            s, i = _string(data, i)
+            args.append(s)
+        elif t == "b":
+            n = _I32.unpack_from(data, i)[0]
+            args.append(bytes(data[i + 4:i + 4 + n]))
+            i += 4 + n + (-n % 4)
+        elif t == "h":
+            args.append(_I64.unpack_from(data, i)[0])
+            i += 8
+        elif t == "d":
+            args.append(_F64.unpack_from(data, i)[0])
+            i += 8
+        elif t == "t":
+            args.append(_U64.unpack_from(data, i)[0])
+            i += 8
+        elif t == "T":
+            args.append(True)
+        elif t == "F":
+            args.append(False)
+        elif t in "NI":
+            args.append(None)
+        else:
+            raise ValueError(f"unsupported OSC type tag '{t}'")
+    return address, args
+
+
+def decode_packet(data, timetag=IMMEDIATE):
+    """Yields (timetag, address, args) for a message or every message in a (nested) bundle."""
+    if data[:8] == BUNDLE:
+        timetag = _U64.unpack_from(data, 8)[0]
+        i = 16
+        while i + 4 <= len(data):
+            n = _I32.unpack_from(data, i)[0]
+            yield from decode_packet(data[i + 4:i + 4 + n], timetag)
+            i += 4 + n
+    else:
+        address, args = decode_message(data)
+        yield timetag, address, args
+
+
+def to_timetag(wall):
+    return int((wall + NTP_EPOCH) * 4294967296.0)
+
+
+def from_timetag(tag):
+    return tag / 4294967296.0 - NTP_EPOCH
+
+
+# ---- server ----
+
+def _parse_target(text):
+    host, _, port = text.strip().rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def _parse_allow(text):
+    return [ipaddress.ip_network(n.strip(), strict=False) for n in text.split(",") if n.strip()]
+
+
+class OscServer:
+    """
+    eng: an Engine (or the engine module's default). beats=False for control only
+    (the beat output needs tick listeners, i.e. the in-process sequencer).
+    targets: (host, port) pairs that always get the beat bundles.
+    allow: networks /subscribe is accepted from, comma-separated (see ALLOW).
+    """
+
+    def __init__(self, eng, host="0.0.0.0", port=PORT, targets=(), beats=True, allow=ALLOW):
+        self.engine = eng
+        # (host, port) -> clock() time it lapses, None for the fixed targets
+        self.subscribers = {tuple(t): None for t in targets}
+        self.allow = _parse_allow(allow)
+        self.refused = 0        # /subscribe from outside the allowed networks
+        self._subs_lock = threading.Lock()
+        self.received = 0       # messages handled
+        self.errors = 0         # datagrams/messages we couldn't decode or apply
+        self.batches = 0        # socket drains
+        self.sent = 0           # beat bundles sent (per subscriber)
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((host, port))
+        self._sock.settimeout(0.5)
+        self.address = self._sock.getsockname()
+        self._running = True
+        self._save_due = None   # clock() time to save settings, after a bpm/pattern change
+        self._q = None
+        threading.Thread(target=self._receive, daemon=True, name="osc-in").start()
+        if beats:
+            self._q = queue.SimpleQueue()
+            eng.add_tick_listener(self._q.put)
+            threading.Thread(target=self._send_beats, daemon=True, name="osc-out").start()
+
+    def stop(self):
+        self._running = False
+        if self._save_due is not None:
+            self._save_due = None
+            self.engine.save_state()
+        if self._q is not None:
+            self.engine.remove_tick_listener(self._q.put)
+            self._q.put(None)
+
+    def status(self):
+        return {"port": self.address[1], "received": self.received, "errors": self.errors,
+                "batches": self.batches, "sent": self.sent, "subscribers": len(self.subscribers), "refused": self.refused}
+
+    # ---- in ----
+
+    def _receive(self):
+        buf = bytearray(MAX_DATAGRAM)
+        view = memoryview(buf)
+        dontwait = getattr(socket, "MSG_DONTWAIT", None)
+        sock = self._sock
+        while self._running:
+            self._save_if_settled()
+            try:
+                n, addr = sock.recvfrom_into(buf)
+            except socket.timeout:
+                continue
+            except OSError:
+                continue
+            # drain whatever else is already waiting, then apply it as one batch
+            pending = {}
+            self.batches += 1
+            for i in range(MAX_BATCH):
+                t = clock()
+                try:
+                    for tag, address, args in decode_packet(bytes(view[:n])):
+                        self._handle(address, args, self._press_time(tag, t), addr, pending)
+                except Exception as e:
+                    self.errors += 1
+                    if self.errors <= 10:
+                        print(f"OSC: bad packet from {addr[0]}: {e}")
+                if dontwait is None or i == MAX_BATCH - 1:
+                    break
+                try:
+                    n, addr = sock.recvfrom_into(buf, 0, dontwait)
+                except (BlockingIOError, socket.timeout, OSError):
+                    break
+            self._flush(pending)
+
+    def _press_time(self, tag, arrived):
+        if tag == IMMEDIATE:
+            return arrived
+        t = from_timetag(tag) - (time.time() - clock())
+        return t if abs(t - arrived) < TAG_WINDOW else arrived
+
+    def _flush(self, pending):
+        eng = self.engine
+        if "bpm" in pending:
+            bpm = pending.pop("bpm")
+            if bpm != eng.get_status()["bpm"]:
+                eng.set_bpm(bpm, save=False)
+                self._save_due = clock() + SAVE_SETTLE
+        if "pattern" in pending:
+            eng.set_pattern(pending.pop("pattern"), save=False)
+            self._save_due = clock() + SAVE_SETTLE
+
+    def _save_if_settled(self):
+        if self._save_due is not None and clock() >= self._save_due:
+            self._save_due = None
+            self.engine.save_state()
+
+    def _handle(self, address, args, t, addr, pending):
+        cmd = address[len(PREFIX):]
+        if not address.startswith(PREFIX) or cmd not in COMMANDS:
+            self.errors += 1
+            return
+        eng = self.engine
+        self.received += 1
+        if cmd == "bpm":
+            pending["bpm"] = int(round(float(args[0])))
+        elif cmd == "pattern":
+            pending["pattern"] = int(args[0])
+        elif cmd in ("tap", "fill", "toggle"):
+            # events: whatever tempo/pattern came before them in the batch goes first
+            self._flush(pending)
+            if cmd == "tap":
+                eng.handle_tap(t)
+            elif cmd == "fill":
+                eng.request_fill(int(args[0]) if args else 1, t)
+            else:
+                eng.handle_start()
+        elif cmd == "status":
+            self._flush(pending)
+            st = eng.get_status()
+            self._reply(addr, encode_message(PREFIX + "status", st["bpm"], st["current_idx"], st["playing"]))
+        elif cmd in ("subscribe", "unsubscribe"):
+            target = (addr[0], int(args[0]) if args else addr[1])
+            subs = self.subscribers
+            with self._subs_lock:
+                if cmd == "unsubscribe":
+                    if subs.get(target, 0) is not None:   # the fixed targets stay
+                        subs.pop(target, None)
+                    return
+                if not self._allowed(addr[0]):
+                    self.refused += 1
+                    if self.refused <= 10:
+                        print(f"OSC: ignoring subscribe from {addr[0]} (not in DRUMASSIST_OSC_ALLOW)")
+                    return
+                if not 0 < target[1] < 65536:
+                    raise ValueError(f"bad port {target[1]}")
+                if target in subs:
+                    if subs[target] is not None:
+                        subs[target] = clock() + SUBSCRIBE_TTL
+                    return
+                if len(subs) >= MAX_SUBSCRIBERS:
+                    print(f"OSC: subscriber limit reached, ignoring {target[0]}:{target[1]}")
+                    return
+                subs[target] = clock() + SUBSCRIBE_TTL
+            print(f"OSC: sending beats to {target[0]}:{target[1]} (re-subscribe within {SUBSCRIBE_TTL:.0f} s)")
+
+    def _allowed(self, host):
+        ip = ipaddress.ip_address(host)
+        return any(ip in net for net in self.allow)
+
+    def _reply(self, addr, data):
+        try:
+            self._sock.sendto(data, addr)
+        except OSError as e:
+            print(f"OSC send error: {e}")
+
+    # ---- out ----
+
+    def _send_beats(self):
+        while True:
+            model = self._q.get()
+            if model is None:
+                return
+            if not self.subscribers:
+                continue
+            try:
+                self._send_beat(model)
+            except Exception as e:
+                # e.g. a pattern index gone after a reload: skip the beat, keep the thread
+                self.errors += 1
+                if self.errors <= 10:
+                    print(f"OSC: can't send beat: {e}")
+
+    def _send_beat(self, model):
+        subs = self.subscribers
+        now = clock()
+        with self._subs_lock:
+            for target, lapses in list(subs.items()):
+                if lapses is not None and lapses < now:
+                    del subs[target]
+                    print(f"OSC: subscription from {target[0]}:{target[1]} lapsed")
+            targets = list(subs)
+        deadline, interval, abs_step, step, idx, bpm, fill_active, fill_pending, playing = model
+        p = self.engine.patterns[idx]
+        pattern = p["fill"] if fill_active > 0 and p.get("fill") else p["beats"]
+        beat_type = pattern[step % len(pattern)]
+        wall = deadline + (time.time() - clock())
+        data = encode_bundle(to_timetag(wall),
+                             encode_message(PREFIX + "beat", abs_step, step % len(pattern), beat_type,
+                                            bpm, idx, fill_active))
+        for target in targets:
+            try:
+                self._sock.sendto(data, target)
+                self.sent += 1
+            except OSError as e:
+                self.errors += 1
+                if self.errors <= 10:
+                    print(f"OSC send error ({target[0]}:{target[1]}): {e}")
+
+
+def from_env():
+    """(port, targets) from $DRUMASSIST_OSC / $DRUMASSIST_OSC_TARGETS, or None when off."""
+    value = os.environ.get("DRUMASSIST_OSC", "")
+    if value in ("", "0"):
+        return None
+    port = PORT if value == "1" else int(value)
+    targets = [_parse_target(t) for t in os.environ.get("DRUMASSIST_OSC_TARGETS", "").split(",") if t.strip()]
+    return port, targets
+
+
+def start(eng, port=PORT, targets=(), beats=True):
+    server = OscServer(eng, port=port, targets=targets, beats=beats)
+    print(f"OSC: listening on UDP {server.address[1]}" + ("" if beats else " (control only)"))
+    return server
+
+
+# ---- loopback test ----
+
+def _bench(rate, seconds):
+    # engine on a private scheduler (no MIDI), server and a client on loopback:
+    # first the click alone, then with `rate` messages/s arriving
+    import engine
+
+    eng = engine.Engine(name="osc-bench", save_file=None, patterns_file=None)
+    eng.state["bpm"] = 120
+    sched = scheduler.Scheduler(name="sched-osc-bench")
+    sched.start()
+    eng.attach(sched)
+    server = OscServer(eng, host="127.0.0.1", port=0)
+
+    client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client.bind(("127.0.0.1", 0))
+    client.settimeout(0.2)
+    beats = []
+    done = threading.Event()
+
+    def listen():
+        while not done.is_set():
+            try:
+                data = client.recv(MAX_DATAGRAM)
+            except socket.timeout:
+                continue
+            t = clock()
+            for tag, address, args in decode_packet(data):
+                if address == PREFIX + "beat":
+                    beats.append(t - (from_timetag(tag) - (time.time() - clock())))
+
+    threading.Thread(target=listen, daemon=True).start()
+    client.sendto(encode_message(PREFIX + "subscribe"), server.address)
+    client.sendto(encode_message(PREFIX + "toggle"), server.address)
+
+    def report(label, sent, elapsed):
+        lat = sched.lateness_stats()
+        b = sorted(beats)
+        line = (f"{label:>10}: {sent / elapsed:8.0f} msg/s in, tick lateness p50 {lat['p50_ms']:.3f} "
+                f"p99 {lat['p99_ms']:.3f} max {lat['max_ms']:.3f} ms ({lat['count']} ticks)")
+        if b:
+            line += f", beat bundles {len(b)} arrived p50 {b[len(b) // 2] * 1000.0:+.3f} ms"
+        print(line)
+
+    time.sleep(0.5)
+    sched.reset_metrics()
+    del beats[:]
+    time.sleep(seconds)
+    report("idle", 0, seconds)
+
+    # tempo sweep + occasional status/fill, like a desk fader and buttons
+    msgs = [encode_message(PREFIX + "bpm", 100 + i % 40) for i in range(200)]
+    msgs[50] = encode_message(PREFIX + "status")
+    msgs[150] = encode_message(PREFIX + "fill", 1)
+    sched.reset_metrics()
+    del beats[:]
+    before = server.received + server.errors
+    start_t = clock()
+    sent = 0
+    period = 1.0 / rate
+    while clock() - start_t < seconds:
+        client.sendto(msgs[sent % len(msgs)], server.address)
+        sent += 1
+        ahead = start_t + sent * period - clock()
+        if ahead > 0.001:
+            time.sleep(ahead)
+    elapsed = clock() - start_t
+    time.sleep(0.3)
+    report("flooded", sent, elapsed)
+    handled = server.received + server.errors - before
+    print(f"handled {handled}/{sent} messages ({sent - handled} dropped by the socket), "
+          f"{server.batches} batches, {server.errors} errors")
+    done.set()
+    server.stop()
+    sched.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="DrumAssist OSC server loopback test")
+    ap.add_argument("command", choices=("bench",))
+    ap.add_argument("--rate", type=int, default=5000, help="messages per second to send")
+    ap.add_argument("--seconds", type=float, default=5.0)
+    args = ap.parse_args()
+    _bench(args.rate, args.seconds)
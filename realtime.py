@@ -0,0 +1,182 @@
+# realtime.py
+#
+# Opt-in real-time mode for the scheduler thread (Linux; each measure is
+# skipped with a note where the platform or permissions don't allow it):
+#
+#   priority - SCHED_FIFO for the sequencer thread (needs root or CAP_SYS_NICE)
+#   affinity - pin the sequencer thread to one core on multi-core boards
+#   mlock    - mlockall() so a beat never waits on a page fault (RLIMIT_MEMLOCK)
+#   gc       - gc.freeze() everything loaded at startup, turn off automatic GC and
+#              collect only in idle gaps between ticks
+#
+#   DRUMASSIST_REALTIME=1 python3 drum_assist_web.py
+#   DRUMASSIST_REALTIME=1 DRUMASSIST_RT_CPU=3 DRUMASSIST_RT_PRIORITY=60 python3 drum_assist2.py
+import ctypes
+import ctypes.util
+import gc
+import os
+import time
+
+MEASURES = ("priority", "affinity", "mlock", "gc")
+DEFAULT_PRIORITY = 50
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+
+_gc_threshold = None
+_applied = {}
+gc_stats = {"collections": 0, "max_pause_ms": 0.0, "total_pause_ms": 0.0}
+_gc_started = 0.0
+
+
+def _libc():
+    name = ctypes.util.find_library("c")
+    if not name:
+        raise OSError("libc not found")
+    return ctypes.CDLL(name, use_errno=True)
+
+
+def _wait_for_thread(sched, timeout=2.0):
+    end = time.monotonic() + timeout
+    while sched.native_id is None and time.monotonic() < end:
+        time.sleep(0.001)
+    if sched.native_id is None:
+        raise RuntimeError("scheduler thread not running")
+    return sched.native_id
+
+
+def set_priority(sched, priority=DEFAULT_PRIORITY):
+    if not hasattr(os, "sched_setscheduler"):
+        raise OSError("sched_setscheduler not available on this platform")
+    tid = _wait_for_thread(sched)
+    priority = max(1, min(int(priority), os.sched_get_priority_max(os.SCHED_FIFO)))
+    os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(priority))
+    return f"SCHED_FIFO {priority}"
+
+
+def set_affinity(sched, cpu=None):
+    if not hasattr(os, "sched_setaffinity"):
+        raise OSError("sched_setaffinity not available on this platform")
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < 2:
+        raise OSError("single-core board, nothing to pin")
+    # default: the last core, leaving core 0 for interrupts and the web server
+    cpu = cpus[-1] if cpu is None else int(cpu)
+    os.sched_setaffinity(_wait_for_thread(sched), {cpu})
+    return f"cpu {cpu}"
+
+
+def lock_memory():
+    libc = _libc()
+    if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return "mlockall(MCL_CURRENT|MCL_FUTURE)"
+
+
+def unlock_memory():
+    try:
+        _libc().munlockall()
+    except OSError:
+        pass
+
+
+def _gc_callback(phase, info):
+    global _gc_started
+    if phase == "start":
+        _gc_started = time.perf_counter()
+    else:
+        ms = (time.perf_counter() - _gc_started) * 1000.0
+        gc_stats["collections"] += 1
+        gc_stats["total_pause_ms"] += ms
+        if ms > gc_stats["max_pause_ms"]:
+            gc_stats["max_pause_ms"] = ms
+
+
+# smallest idle gap (seconds) we'll start a collection of each generation in;
+# a full collection can take tens of ms on a Pi, so it waits for a real pause
+GC_GAP = (0.005, 0.020, 0.100)
+
+
+def idle_collect(gap):
+    """
+    Scheduler idle hook: the collections automatic GC would have done, done now -
+    but only the ones that fit before the next tick.
+    """
+    counts = gc.get_count()
+    for gen in (2, 1, 0):
+        if counts[gen] >= _gc_threshold[gen] and (gap is None or gap >= GC_GAP[gen]):
+            gc.collect(gen)
+            return
+
+
+def control_gc(sched):
+    global _gc_threshold
+    if _gc_threshold is None:
+        _gc_threshold = gc.get_threshold()
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+    if _gc_callback not in gc.callbacks:
+        gc.callbacks.append(_gc_callback)
+    sched.idle = idle_collect
+    return f"frozen {gc.get_freeze_count()} objects, collecting in idle gaps"
+
+
+def release_gc(sched):
+    sched.idle = None
+    if _gc_callback in gc.callbacks:
+        gc.callbacks.remove(_gc_callback)
+    gc.unfreeze()
+    gc.enable()
+
+
+def enable(sched, measures=MEASURES, priority=DEFAULT_PRIORITY, cpu=None):
+    """
+    Apply the requested measures to a running Scheduler. Returns {measure: result}
+    where result is a description, or "skipped: <reason>".
+    """
+    results = {}
+    for m in measures:
+        try:
+            if m == "priority":
+                results[m] = set_priority(sched, priority)
+            elif m == "affinity":
+                results[m] = set_affinity(sched, cpu)
+            elif m == "mlock":
+                results[m] = lock_memory()
+            elif m == "gc":
+                results[m] = control_gc(sched)
+            else:
+                results[m] = "skipped: unknown measure"
+        except (OSError, RuntimeError, ValueError) as e:
+            results[m] = f"skipped: {e}"
+    _applied.update(results)
+    for m, r in results.items():
+        print(f"Realtime: {m}: {r}")
+    return results
+
+
+def disable(sched):
+    # undo what can be undone (used between benchmark runs)
+    release_gc(sched)
+    unlock_memory()
+    _applied.clear()
+
+
+def from_env():
+    """Options for enable() from $DRUMASSIST_REALTIME / $DRUMASSIST_RT_*, or None if off."""
+    flag = os.environ.get("DRUMASSIST_REALTIME", "")
+    if flag in ("", "0"):
+        return None
+    measures = MEASURES if flag in ("1", "all") else tuple(m.strip() for m in flag.split(","))
+    cpu = os.environ.get("DRUMASSIST_RT_CPU")
+    return {
+        "measures": measures,
+        "priority": int(os.environ.get("DRUMASSIST_RT_PRIORITY", DEFAULT_PRIORITY)),
+        "cpu": int(cpu) if cpu else None,
+    }
+
+
+def status():
+    return {"applied": dict(_applied), "gc": dict(gc_stats)}
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# recorder.py
+#
+# Performance event recorder: every tick (deadline and when it actually went out),
+# MIDI sends and errors, taps, fill requests, pattern/tempo changes and start/stop,
+# as fixed-size binary records in memory-mapped segment files. A write is one
+# struct.pack_into() into the mapping - no syscalls, nothing to flush on the tick path.
+# Segments rotate by size; only the newest `keep` are kept.
+#
+#   DRUMASSIST_RECORD=recordings python3 drum_assist_web.py
+#
+#   python3 recorder.py summary recordings/           # after the gig
+#   python3 recorder.py decode recordings/drumassist-00003.rec
+#   python3 recorder.py csv recordings/ -o gig.csv
+import argparse
+import glob
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+
+import scheduler
+
+clock = scheduler.clock
+
+MAGIC = b"DAREC1\0\0"
+# magic, record size, capacity (records), records written, segment no,
+# wall time and clock() when the segment was created
+HEADER = struct.Struct("<8sHIQIdd")
+HEADER_SIZE = 64
+COUNT = struct.Struct("<Q")
+COUNT_AT = 14
+# t (clock() when it happened), ref (deadline / press time), kind, a, b, c
+RECORD = struct.Struct("<ddBBhi")
+
+SEGMENT_BYTES = 1 << 20
+KEEP = 8
+PREFIX = "drumassist-"
+
+TICK, MIDI_SENT, MIDI_ERROR, TAP, FILL, PATTERN, BPM, PLAY, HIT = range(1, 10)
+KIND_NAMES = {TICK: "tick", MIDI_SENT: "midi_sent", MIDI_ERROR: "midi_error", TAP: "tap",
+              FILL: "fill", PATTERN: "pattern", BPM: "bpm", PLAY: "play", HIT: "hit"}
+# what a/b/c mean per kind (for decode/CSV)
+FIELDS = {
+    TICK: ("beat_type", "step", "abs_step"),
+    MIDI_SENT: ("note_on", "note", ""),
+    MIDI_ERROR: ("", "", ""),
+    TAP: ("", "bpm", ""),
+    FILL: ("bars", "", ""),
+    PATTERN: ("", "idx", ""),
+    BPM: ("", "bpm", ""),
+    PLAY: ("playing", "", ""),
+    HIT: ("note", "step", "bar"),   # ref = the click it was matched to (accuracy.py)
+}
+
+
+class Recorder:
+    def __init__(self, directory="recordings", segment_bytes=SEGMENT_BYTES, keep=KEEP):
+        self.directory = directory
+        self.keep = max(1, int(keep))
+        self.capacity = (int(segment_bytes) - HEADER_SIZE) // RECORD.size
+        if self.capacity < 1:
+            raise ValueError("segment too small")
+        self.dropped = 0   # records lost because the next segment wasn't ready
+        os.makedirs(directory, exist_ok=True)
+
+        existing = _segments(directory)
+        self._next_no = (_segment_no(existing[-1]) + 1) if existing else 1
+        self._lock = threading.Lock()
+        self._spare = None
+        self._ready = threading.Event()
+        self._retire = queue.SimpleQueue()   # full segments to close, None to stop
+
+        self._mm, self._path = self._new_segment()
+        self._count = 0
+        self._prepare()
+        self._thread = threading.Thread(target=self._rotator, daemon=True, name="recorder")
+        self._thread.start()
+
+    # ---- segments ----
+
+    def _new_segment(self):
+        no = self._next_no
+        self._next_no += 1
+        path = os.path.join(self.directory, f"{PREFIX}{no:05d}.rec")
+        size = HEADER_SIZE + self.capacity * RECORD.size
+        with open(path, "w+b") as f:
+            f.truncate(size)
+            mm = mmap.mmap(f.fileno(), size)
+        HEADER.pack_into(mm, 0, MAGIC, RECORD.size, self.capacity, 0, no, time.time(), clock())
+        return mm, path
+
+    def _prepare(self):
+        self._spare = self._new_segment()
+        self._ready.set()
+
+    def _prune(self):
+        spare = self._spare[1] if self._spare is not None else None
+        written = [p for p in _segments(self.directory) if p != spare]
+        for path in written[:-self.keep]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _rotator(self):
+        # file work (close, delete, create the next segment) stays off the writers
+        while True:
+            mm = self._retire.get()
+            if mm is None:
+                return
+            try:
+                mm.flush()
+                mm.close()
+                self._prepare()
+                self._prune()
+            except Exception as e:
+                print(f"Recorder rotation error: {e}")
+
+    # ---- writing ----
+
+    def write(self, kind, t, ref=0.0, a=0, b=0, c=0):
+        with self._lock:
+            mm = self._mm
+            if mm is None:
+                return
+            i = self._count
+            if i >= self.capacity:
+                if not self._ready.is_set():
+                    self.dropped += 1
+                    return
+                self._ready.clear()
+                self._retire.put(mm)
+                (mm, self._path), self._spare = self._spare, None
+                self._mm = mm
+                i = 0
+            RECORD.pack_into(mm, HEADER_SIZE + i * RECORD.size, t, ref, kind, a, b, c)
+            self._count = i + 1
+            COUNT.pack_into(mm, COUNT_AT, i + 1)
+
+    def tick(self, deadline, now, beat_type, step, abs_step):
+        self.write(TICK, now, deadline, beat_type, step, abs_step)
+
+    def midi_sent(self, msg):
+        # Sender.on_sent: runs on the port's sender thread right after port.send()
+        # (a tuple is a burst of notes sent together)
+        t = clock()
+        for m in (msg if type(msg) is tuple else (msg,)):
+            self.write(MIDI_SENT, t, 0.0, m.type == "note_on", getattr(m, "note", 0))
+
+    def midi_error(self, msg=None, error=None):
+        self.write(MIDI_ERROR, clock())
+
+    def tap(self, t, bpm):
+        self.write(TAP, clock(), t, 0, bpm)
+
+    def fill(self, t, bars):
+        self.write(FILL, clock(), t or 0.0, bars)
+
+    def pattern(self, idx):
+        self.write(PATTERN, clock(), 0.0, 0, idx)
+
+    def bpm(self, bpm):
+        self.write(BPM, clock(), 0.0, 0, bpm)
+
+    def play(self, playing):
+        self.write(PLAY, clock(), 0.0, 1 if playing else 0)
+
+    def hit(self, t, click, note, step, bar):
+        self.write(HIT, t, click, note, step, bar)
+
+    def close(self):
+        with self._lock:
+            mm, self._mm = self._mm, None
+        if mm is not None:
+            mm.flush()
+            mm.close()
+        self._retire.put(None)
+        self._thread.join(timeout=2.0)
+        if self._spare is not None:
+            # never written: don't leave an empty segment behind
+            spare_mm, path = self._spare
+            self._spare = None
+            spare_mm.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def from_env():
+    directory = os.environ.get("DRUMASSIST_RECORD", "")
+    if directory in ("", "0"):
+        return None
+    return Recorder("recordings" if directory == "1" else directory)
+
+
+# ---- reading ----
+
+def _segment_no(path):
+    try:
+        return int(os.path.basename(path)[len(PREFIX):-4])
+    except ValueError:
+        return 0
+
+
+def _segments(directory):
+    return sorted(glob.glob(os.path.join(directory, f"{PREFIX}*.rec")), key=_segment_no)
+
+
+def expand_paths(paths):
+    # directories -> their segments, oldest first
+    files = []
+    for p in paths:
+        files.extend(_segments(p) if os.path.isdir(p) else [p])
+    return files
+
+
+def read_segment(path):
+    """Yields (wall time, kind, t, ref, a, b, c) for every record in one segment file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, rec_size, capacity, count, no, wall0, clock0 = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or rec_size != RECORD.size:
+        raise ValueError(f"{path}: not a DrumAssist recording")
+    count = min(count, capacity, (len(data) - HEADER_SIZE) // rec_size)
+    for t, ref, kind, a, b, c in RECORD.iter_unpack(data[HEADER_SIZE:HEADER_SIZE + count * rec_size]):
+        yield wall0 + (t - clock0), kind, t, ref, a, b, c
+
+
+def read(paths):
+    for path in expand_paths(paths):
+        yield from read_segment(path)
+
+
+def _fmt_wall(wall):
+    return time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall * 1000) % 1000:03d}"
+
+
+def decode(paths, out=sys.stdout):
+    for wall, kind, t, ref, a, b, c in read(paths):
+        name = KIND_NAMES.get(kind, f"kind{kind}")
+        extra = " ".join(f"{label}={v}" for label, v in zip(FIELDS.get(kind, ("a", "b", "c")), (a, b, c)) if label)
+        if kind in (TICK, HIT):
+            extra += f" late_ms={(t - ref) * 1000.0:.3f}"
+        elif ref:
+            extra += f" ref={ref:.6f}"
+        out.write(f"{_fmt_wall(wall)} {t:.6f} {name:10} {extra}\n")
+
+
+def _pct(vals, q):
+    return vals[min(len(vals) - 1, (len(vals) * q) // 100)]
+
+
+def summarize(paths, out=sys.stdout):
+    counts = {}
+    late = []
+    send_after = []   # MIDI note_on leaving the port, relative to its tick's deadline
+    first = last = None
+    last_deadline = None
+    for wall, kind, t, ref, a, b, c in read(paths):
+        counts[kind] = counts.get(kind, 0) + 1
+        first = wall if first is None else first
+        last = wall
+        if kind == TICK:
+            late.append(t - ref)
+            last_deadline = ref
+        elif kind == MIDI_SENT and a and last_deadline is not None:
+            send_after.append(t - last_deadline)
+            last_deadline = None
+
+    if first is None:
+        out.write("no records\n")
+        return
+    out.write(f"from {_fmt_wall(first)} to {_fmt_wall(last)} ({last - first:.1f} s)\n")
+    for kind in sorted(counts):
+        out.write(f"  {KIND_NAMES.get(kind, kind):10} {counts[kind]:>8}\n")
+    for label, vals in (("tick lateness", late), ("MIDI send after deadline", send_after)):
+        if not vals:
+            continue
+        vals.sort()
+        out.write(f"{label} (ms): mean {1000.0 * sum(vals) / len(vals):.3f}  p50 {1000.0 * _pct(vals, 50):.3f}  "
+                  f"p99 {1000.0 * _pct(vals, 99):.3f}  max {1000.0 * vals[-1]:.3f}\n")
+
+
+def to_csv(paths, out):
+    import csv
+    w = csv.writer(out)
+    w.writerow(["wall_time", "kind", "t", "ref", "a", "b", "c"])
+    for wall, kind, t, ref, a, b, c in read(paths):
+        w.writerow([f"{wall:.6f}", KIND_NAMES.get(kind, kind), f"{t:.6f}", f"{ref:.6f}", a, b, c])
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Decode DrumAssist performance recordings")
+    ap.add_argument("command", choices=("decode", "summary", "csv"))
+    ap.add_argument("paths", nargs="*", default=["recordings"], help="segment files or directories")
+    ap.add_argument("-o", "--output", help="CSV output file (default: stdout)")
+    args = ap.parse_args()
+    if args.command == "decode":
+        decode(args.paths)
+    elif args.command == "summary":
+        summarize(args.paths)
+    elif args.output:
+        with open(args.output, "w", newline="") as f:
+            to_csv(args.paths, f)
+    else:
+        to_csv(args.paths, sys.stdout)
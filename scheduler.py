@@ -0,0 +1,298 @@
+# scheduler.py
+#
+# One timing thread for any number of engines: a min-heap of upcoming deadlines,
+# each popped and dispatched when due. Anything that can block (MIDI writes,
+# LED callbacks that sleep) is handed to a Sender thread so it never delays
+# the next deadline.
+import heapq
+import itertools
+import queue
+import threading
+import time
+from array import array
+
+clock = time.perf_counter
+
+LATENESS_HISTORY = 4096
+
+
+class Sender:
+    """
+    Worker thread that runs handler(item) for each queued item, in order
+    (handler(*item) with unpack=True). put() allocates nothing, so the scheduler
+    thread can hand over preallocated messages/tuples for free.
+    """
+
+    def __init__(self, name, handler, unpack=False):
+        self.name = name
+        self.handler = handler
+        self.unpack = unpack
+        self._q = queue.SimpleQueue()
+        self.put = self._q.put
+        # optional hooks, on the sender thread: on_sent(item) after each item,
+        # on_error(item, exc) when the handler raises (recorder.py uses both)
+        self.on_sent = None
+        self.on_error = None
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"sender-{name}")
+        self._thread.start()
+
+    def _run(self):
+        get = self._q.get
+        handler = self.handler
+        while True:
+            item = get()
+            try:
+                if self.unpack:
+                    handler(*item)
+                else:
+                    handler(item)
+            except Exception as e:
+                print(f"{self.name} send error: {e}")
+                if self.on_error is not None:
+                    self.on_error(item, e)
+            else:
+                if self.on_sent is not None:
+                    self.on_sent(item)
+
+
+_port_senders = {}
+_port_lock = threading.Lock()
+
+
+def _burst_send(send):
+    # a tuple of messages is a burst (notes due at the same time): one queue item,
+    # sent back to back
+    def handler(item):
+        if type(item) is tuple:
+            for msg in item:
+                send(msg)
+        else:
+            send(item)
+    return handler
+
+
+def port_sender(port_name, open_port):
+    """
+    Shared Sender for a MIDI output, opened once via open_port(port_name).
+    Engines that pick the same port share the same sender.
+    """
+    with _port_lock:
+        s = _port_senders.get(port_name)
+        if s is None:
+            port = open_port(port_name)
+            s = Sender(port_name, _burst_send(port.send))
+            s.port = port
+            _port_senders[port_name] = s
+        return s
+
+
+class Job:
+    """
+    A heap entry owner. fn(deadline, now) -> next deadline, or None to park.
+    Each job owns one reusable heap entry [deadline, id, job], so rescheduling
+    it doesn't allocate. active: on the heap or running; queued: on the heap.
+    """
+    __slots__ = ("fn", "active", "queued", "kicked", "again", "entry")
+    _ids = itertools.count()
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.active = False
+        self.queued = False
+        self.kicked = False
+        self.again = None      # deadline asked for by reschedule() while running
+        # the unique id breaks deadline ties, so job objects are never compared
+        self.entry = [0.0, next(Job._ids), self]
+
+
+class Scheduler:
+    def __init__(self, name="scheduler"):
+        self.name = name
+        self._heap = []
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.native_id = None
+
+        # idle(gap): housekeeping (e.g. deferred GC) run only when the next deadline is
+        # at least idle_min seconds away, at most once per gap between events.
+        # gap is the time left until the next deadline (None if nothing is scheduled).
+        self.idle = None
+        self.idle_min = 0.010
+
+        # tick lateness (seconds) ring, for metrics/benchmarks
+        self.lateness = array("d", bytes(8 * LATENESS_HISTORY))
+        self.dispatched = 0
+
+    def _push(self, deadline, job):
+        job.active = True
+        job.queued = True
+        entry = job.entry
+        entry[0] = deadline
+        heapq.heappush(self._heap, entry)
+
+    def job(self, fn):
+        return Job(fn)
+
+    def at(self, deadline, fn):
+        # one-shot (or self-rescheduling) callback at an absolute clock() time
+        job = Job(fn)
+        with self._cond:
+            self._push(deadline, job)
+            self._cond.notify()
+        return job
+
+    def wake(self, job, deadline=None):
+        """Put a parked job back on the heap (or make sure it won't park)."""
+        with self._cond:
+            if job.active:
+                job.kicked = True
+                return
+            self._push(clock() if deadline is None else deadline, job)
+            self._cond.notify()
+
+    def reschedule(self, job, deadline):
+        """
+        Run job at `deadline`, wherever it is. Unlike wake(), a job already on the
+        heap moves to the new deadline instead of keeping its old one.
+        """
+        cond = self._cond
+        cond.acquire()   # not `with`: that makes a bound method per call (check_alloc.py)
+        try:
+            if job.queued:
+                job.entry[0] = deadline
+                heapq.heapify(self._heap)
+            elif job.active:
+                job.again = deadline   # running right now: next time is `deadline`
+                return
+            else:
+                self._push(deadline, job)
+            cond.notify()
+        finally:
+            cond.release()
+
+    def reset_metrics(self):
+        with self._cond:
+            self.dispatched = 0
+
+    def lateness_stats(self):
+        n = min(self.dispatched, LATENESS_HISTORY)
+        if n == 0:
+            return {"count": 0, "mean_ms": 0.0, "p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        vals = sorted(self.lateness[:n])
+        return {
+            "count": self.dispatched,
+            "mean_ms": 1000.0 * sum(vals) / n,
+            "p50_ms": 1000.0 * vals[n // 2],
+            "p99_ms": 1000.0 * vals[min(n - 1, (n * 99) // 100)],
+            "max_ms": 1000.0 * vals[-1],
+        }
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, daemon=True, name=self.name)
+        self._thread.start()
+
+    def run(self):
+        # blocking variant of start(): dispatch on the calling thread
+        self._running = True
+        self._loop()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _loop(self):
+        self.native_id = threading.get_native_id()
+        heap = self._heap
+        cond = self._cond
+        idle_done = False
+        while True:
+            with cond:
+                while True:
+                    if not self._running:
+                        return
+                    delay = heap[0][0] - clock() if heap else None
+                    if delay is not None and delay <= 0:
+                        break
+                    if self.idle is not None and not idle_done and (delay is None or delay >= self.idle_min):
+                        idle_done = True
+                        cond.release()
+                        try:
+                            self.idle(delay)
+                        except Exception as e:
+                            print(f"{self.name}: idle error: {e}")
+                        finally:
+                            cond.acquire()
+                        continue
+                    if delay is None:
+                        # nothing scheduled; still come back now and then for idle work
+                        cond.wait(1.0 if self.idle is not None else None)
+                        idle_done = False
+                    else:
+                        cond.wait(delay)
+                entry = heapq.heappop(heap)
+                entry[2].queued = False
+            idle_done = False
+            self._dispatch(entry[0], entry[2], clock())
+
+    def _dispatch(self, deadline, job, now):
+        self.lateness[self.dispatched % LATENESS_HISTORY] = now - deadline
+        self.dispatched += 1
+
+        try:
+            nxt = job.fn(deadline, now)
+        except Exception as e:
+            print(f"{self.name}: job error: {e}")
+            nxt = None
+
+        cond = self._cond
+        cond.acquire()
+        try:
+            if job.again is not None:
+                nxt, job.again = job.again, None
+            elif nxt is None and job.kicked:
+                nxt = clock()
+            job.kicked = False
+            if nxt is None:
+                job.active = False
+            else:
+                self._push(nxt, job)
+        finally:
+            cond.release()
+
+    def dispatch_due(self, now):
+        """
+        Run everything due at `now` on the calling thread, without the timing loop.
+        For driving a scheduler with a simulated clock (check_alloc.py).
+        """
+        heap = self._heap
+        cond = self._cond
+        while True:
+            cond.acquire()
+            try:
+                if not heap or heap[0][0] > now:
+                    return
+                entry = heapq.heappop(heap)
+                entry[2].queued = False
+            finally:
+                cond.release()
+            self._dispatch(entry[0], entry[2], now)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    # the process-wide scheduler every started Engine shares
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = Scheduler()
+            _default.start()
+        return _default
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# sequencer_process.py
+#
+# Run the timing core in its own process, so Flask handlers, JSON and the
+# front-ends never share a GIL with the click - and a web server crash or
+# restart doesn't stop it.
+#
+# The two sides talk through a small memory-mapped block (in /dev/shm where
+# available), each half guarded by a seqlock:
+#
+#   status  - written only by the sequencer process (bpm, pattern, playing,
+#             step, fill counters, state version, heartbeat). Front-ends read it
+#             with plain memory loads: no syscalls, no locks shared with the click.
+#   control - written by front-ends: requested bpm / pattern / play state as
+#             (generation, value) pairs, a running total of requested fill bars
+#             with the last press time, and a patterns-file generation.
+#             The sequencer polls it every few milliseconds and applies whatever
+#             changed in one write as one batch (for the bar if the write says so).
+#
+#   DRUMASSIST_PROCESS=1 python3 drum_assist_web.py
+#   python3 sequencer_process.py --stop          # stop a detached sequencer
+import argparse
+import mmap
+import os
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import scheduler
+from engine import Engine, SAVE_FILE, PATTERNS_FILE, FILL_MAX_BARS, parse_batch
+
+clock = scheduler.clock
+
+POLL_INTERVAL = 0.005     # sequencer: how often to look at the control block
+STALE_AFTER = 2.0         # front-end: heartbeat older than this -> sequencer is gone
+SPAWN_TIMEOUT = 10.0
+ACK_TIMEOUT = 0.1         # front-end: wait this long for the sequencer to apply a control
+READ_TIMEOUT = 0.05       # a write takes microseconds; odd for longer = writer died mid-write
+CONTROL_RESET_AFTER = 0.5 # sequencer: reopen a control half stuck this long (writer is gone)
+
+BLOCK_SIZE = 256
+SEQ = struct.Struct("<Q")
+# pid, version, ticks, heartbeat, bpm, idx, playing, step, beat_count, last_beat_type,
+# fill_pending, fill_active, patterns generation, last control seq applied, batch pending
+STATUS = struct.Struct("<qqqdiiiiiiiiiqi")
+STATUS_SEQ_AT = 0
+STATUS_AT = 8
+# bpm gen/value, idx gen/value, play gen/value, fill bars total, last fill press time,
+# patterns generation, "apply this write at the next bar"
+CONTROL = struct.Struct("<iiiiiiidii")
+CONTROL_FIELDS = ("bpm_gen", "bpm", "idx_gen", "idx", "play_gen", "play",
+                  "fill_total", "fill_t", "patterns_gen", "bar")
+CONTROL_SEQ_AT = 128
+CONTROL_AT = 136
+
+
+def shm_path(name="default"):
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, f"drumassist-{name}.shm")
+
+
+def _map(path, create):
+    if create:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        os.ftruncate(fd, BLOCK_SIZE)
+    else:
+        fd = os.open(path, os.O_RDWR)
+    try:
+        return mmap.mmap(fd, BLOCK_SIZE)
+    finally:
+        os.close(fd)
+
+
+class StuckBlock(RuntimeError):
+    """A half of the block stayed mid-write: its writer died (or hung) while writing."""
+
+
+def _read_seq(mm, seq_at, body, body_at, timeout=READ_TIMEOUT):
+    # seqlock read: retry while a write is in progress or raced with us, but not forever
+    end = None
+    while True:
+        s1 = SEQ.unpack_from(mm, seq_at)[0]
+        if not s1 & 1:
+            vals = body.unpack_from(mm, body_at)
+            if SEQ.unpack_from(mm, seq_at)[0] == s1:
+                return s1, vals
+        if end is None:
+            end = clock() + timeout
+        elif clock() > end:
+            raise StuckBlock(f"shared block half at {seq_at} stuck mid-write (seq {s1})")
+        time.sleep(0)   # let the writer finish
+
+
+def _read(mm, seq_at, body, body_at, timeout=READ_TIMEOUT):
+    return _read_seq(mm, seq_at, body, body_at, timeout)[1]
+
+
+def _reset_seq(mm, seq_at):
+    # only for a half whose writer is gone: make it readable (and writable) again
+    s = SEQ.unpack_from(mm, seq_at)[0]
+    if s & 1:
+        SEQ.pack_into(mm, seq_at, s + 1)
+        return True
+    return False
+
+
+def _write(mm, seq_at, body, body_at, *vals):
+    # seqlock write: odd while the body is being changed (single writer per half)
+    s = SEQ.unpack_from(mm, seq_at)[0]
+    SEQ.pack_into(mm, seq_at, s + 1)
+    body.pack_into(mm, body_at, *vals)
+    SEQ.pack_into(mm, seq_at, s + 2)
+    return s + 2
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+# ---- sequencer side ----
+
+class SequencerHost:
+    """Owns the real Engine inside the sequencer process and mirrors it into the block."""
+
+    def __init__(self, eng, path):
+        self.engine = eng
+        self.mm = _map(path, create=True)
+        self.heartbeat = 0.0
+        self._publish_lock = threading.Lock()   # ticks and the control loop both publish
+        # a previous sequencer killed mid-publish leaves status odd; we're its only writer
+        if _reset_seq(self.mm, STATUS_SEQ_AT):
+            print("Sequencer: previous process died mid-write; status block reset")
+        # start from whatever front-ends already asked for, not from zero
+        self._stuck_since = None
+        control = None
+        while control is None:
+            control = self._read_control()
+        (self.bpm_gen, _, self.idx_gen, _, self.play_gen, _,
+         self.fill_total, _, self.patterns_gen, _) = control[1]
+        self.applied = SEQ.unpack_from(self.mm, CONTROL_SEQ_AT)[0]
+
+    def _read_control(self):
+        # (seq, values), or None while control is stuck mid-write. A front-end killed
+        # mid-write would leave it odd for good, so once it's been stuck for
+        # CONTROL_RESET_AFTER we reopen it (only the sequencer does that)
+        try:
+            control = _read_seq(self.mm, CONTROL_SEQ_AT, CONTROL, CONTROL_AT)
+        except StuckBlock:
+            now = clock()
+            if self._stuck_since is None:
+                self._stuck_since = now
+            if now - self._stuck_since < CONTROL_RESET_AFTER:
+                return None
+            _reset_seq(self.mm, CONTROL_SEQ_AT)
+            print("Sequencer: a front-end died mid-write; control block reset")
+            control = _read_seq(self.mm, CONTROL_SEQ_AT, CONTROL, CONTROL_AT)
+        self._stuck_since = None
+        return control
+
+    def publish(self):
+        eng = self.engine
+        with eng._lock:
+            st = eng.state
+            vals = (os.getpid(), eng._version, eng._ticks, self.heartbeat, st["bpm"], st["current_idx"],
+                    1 if st["playing"] else 0, st["step"], st["beat_count"], st["last_beat_type"],
+                    st["fill_pending_bars"], st["fill_active_bars"], self.patterns_gen, self.applied,
+                    1 if eng._batch is not None else 0)
+        with self._publish_lock:
+            _write(self.mm, STATUS_SEQ_AT, STATUS, STATUS_AT, *vals)
+
+    def on_tick(self, model):
+        self.publish()
+
+    def poll(self):
+        # runs on the process's main thread, so settings/pattern file I/O never
+        # holds up the scheduler thread
+        eng = self.engine
+        control = self._read_control()
+        if control is None:
+            self.heartbeat = clock()   # still alive, just not taking orders right now
+            self.publish()
+            return
+        seq, (bpm_gen, bpm, idx_gen, idx, play_gen, play,
+              fill_total, fill_t, patterns_gen, bar) = control
+
+        if patterns_gen != self.patterns_gen:
+            self.patterns_gen = patterns_gen
+            eng.load_patterns()
+            with eng._lock:
+                eng.state["pattern_changed"] = True
+                eng._bump()
+        # everything that changed since the last poll goes in as one batch
+        cmds = []
+        if idx_gen != self.idx_gen:
+            self.idx_gen = idx_gen
+            cmds.append(("pattern", idx))
+        if bpm_gen != self.bpm_gen:
+            self.bpm_gen = bpm_gen
+            if 30 <= bpm <= 300:
+                cmds.append(("bpm", bpm))
+        if play_gen != self.play_gen:
+            self.play_gen = play_gen
+            cmds.append(("play", bool(play)))
+        if fill_total != self.fill_total:
+            bars = fill_total - self.fill_total
+            self.fill_total = fill_total
+            if bars > 0:
+                # scheduler.clock() is CLOCK_MONOTONIC: press times compare across processes
+                cmds.append(("fill", (min(FILL_MAX_BARS, bars), fill_t or None)))
+        if cmds:
+            eng._apply_commands(cmds, "bar" if bar else "now")
+        self.applied = seq
+
+        self.heartbeat = clock()
+        self.publish()
+
+
+def run_sequencer_process(name, path):
+    eng = Engine(name=name, save_file=SAVE_FILE, patterns_file=PATTERNS_FILE)
+    host = SequencerHost(eng, path)
+    import recorder
+    rec = recorder.from_env()
+    if rec is not None:
+        eng.set_recorder(rec)
+    eng.start()
+    eng.add_tick_listener(host.on_tick)
+    sched = eng._scheduler
+
+    sync = os.environ.get("DRUMASSIST_SYNC")
+    if sync:
+        import beat_sync
+        beat_sync.start(eng, sync)
+
+    import realtime
+    opts = realtime.from_env()
+    if opts:
+        realtime.enable(sched, **opts)
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # only --stop / SIGTERM end the click
+    print(f"Sequencer process {os.getpid()} running ({path})", flush=True)
+    while not stop.wait(POLL_INTERVAL):
+        host.poll()
+    with eng._lock:
+        eng.state["playing"] = False
+    host.heartbeat = 0.0
+    host.publish()
+
+
+# ---- front-end side ----
+
+_NO_STATUS = STATUS.unpack(bytes(STATUS.size))   # pid 0, heartbeat 0: nobody running
+
+class ProcessEngine(Engine):
+    """
+    Engine look-alike for front-ends when the click runs in a sequencer process.
+    Patterns are still edited/saved here (the sequencer reloads the file);
+    every other control goes through the control block.
+    """
+    remote_sequencer = True
+
+    def __init__(self, name="default", patterns=None, path=None):
+        super().__init__(name=name, save_file=None, patterns_file=PATTERNS_FILE)
+        if patterns is not None:
+            self.patterns = patterns   # keep the module-level PATTERNS list alive
+        self.path = path or shm_path(name)
+        self.mm = None
+        self._ctl_lock = threading.Lock()
+        self._watcher = None
+        self._last_status = _NO_STATUS
+        self._stuck_seq = None     # status seq it was stuck at, so we don't wait on it again
+
+    # -- process management --
+
+    def _status(self):
+        # a sequencer killed mid-write leaves status stuck: serve the last good copy
+        # (its heartbeat goes stale, so alive() turns False) until one is restarted
+        if self._stuck_seq is not None:
+            if SEQ.unpack_from(self.mm, STATUS_SEQ_AT)[0] == self._stuck_seq:
+                return self._last_status
+            self._stuck_seq = None
+        try:
+            vals = _read(self.mm, STATUS_SEQ_AT, STATUS, STATUS_AT)
+        except StuckBlock as e:
+            self._stuck_seq = SEQ.unpack_from(self.mm, STATUS_SEQ_AT)[0]
+            print(f"Sequencer: {e}")
+            return self._last_status
+        self._last_status = vals
+        return vals
+
+    def alive(self):
+        if self.mm is None:
+            return False
+        vals = self._status()
+        pid, heartbeat = vals[0], vals[3]
+        return _pid_alive(pid) and clock() - heartbeat < STALE_AFTER
+
+    def start(self, beat_callback=None, sched=None):
+        if self._thread_started:
+            return
+        self.load_patterns()
+        if os.path.exists(self.path):
+            self.mm = _map(self.path, create=False)
+        if self.alive():
+            print(f"Sequencer: attached to running process {self._status()[0]}")
+        else:
+            self._spawn()
+        self._thread_started = True
+        if beat_callback is not None:
+            self._watcher = threading.Thread(target=self._watch, args=(beat_callback,),
+                                             daemon=True, name=f"beat-watch-{self.name}")
+            self._watcher.start()
+
+    def _spawn(self):
+        if self.mm is not None and _reset_seq(self.mm, STATUS_SEQ_AT):
+            print("Sequencer: last process died mid-write; status block reset")
+        # own session: not killed with the web server, not hit by its Ctrl-C
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--name", self.name,
+                          "--shm", self.path], start_new_session=True)
+        end = time.monotonic() + SPAWN_TIMEOUT
+        while time.monotonic() < end:
+            if self.mm is None and os.path.exists(self.path):
+                self.mm = _map(self.path, create=False)
+            if self.alive():
+                print(f"Sequencer: started process {self._status()[0]}")
+                return
+            time.sleep(0.02)
+        raise RuntimeError("sequencer process did not start")
+
+    def stop_process(self):
+        if self.mm is not None:
+            pid = self._status()[0]
+            if _pid_alive(pid):
+                os.kill(pid, signal.SIGTERM)
+
+    def _watch(self, beat_callback):
+        # LEDs/terminal visuals in this process follow the tick counter in the block
+        last = self._status()[2]
+        while True:
+            vals = self._status()
+            ticks, beat_type = vals[2], vals[9]
+            if ticks != last:
+                last = ticks
+                try:
+                    beat_callback(beat_type, beat_type == 1)
+                except Exception as e:
+                    print(f"beat_callback error: {e}")
+            time.sleep(0.002)
+
+    # -- control block --
+
+    def _control(self, bump=(), **changes):
+        # front-end threads share one writer slot: serialize them, then seqlock-write.
+        # bump: generation field(s) to increment
+        with self._ctl_lock:
+            # a stuck control half gets reopened by the sequencer (see _read_control)
+            vals = list(_read(self.mm, CONTROL_SEQ_AT, CONTROL, CONTROL_AT, 2 * CONTROL_RESET_AFTER))
+            for b in ((bump,) if isinstance(bump, str) else bump):
+                i = CONTROL_FIELDS.index(b)
+                vals[i] += 1
+            vals[CONTROL_FIELDS.index("bar")] = 0   # only for the write that asks for it
+            for k, v in changes.items():
+                i = CONTROL_FIELDS.index(k)
+                vals[i] = vals[i] + v if k == "fill_total" else v
+            seq = _write(self.mm, CONTROL_SEQ_AT, CONTROL, CONTROL_AT, *vals)
+        # like Engine, return once the change is visible in get_status()
+        end = clock() + ACK_TIMEOUT
+        while self._status()[13] < seq and clock() < end:
+            time.sleep(0.001)
+
+    # -- Engine API --
+
+    def save_state(self):
+        pass  # the sequencer process owns the settings file
+
+    def load_state(self):
+        pass
+
+    def init_midi(self):
+        pass
+
+    def get_offsets(self):
+        # the front-end's are all zero; the sequencer's came from the settings file
+        raise ValueError("n/a in process mode: latency offsets are read from \"offsets\" in "
+                         "the settings file when the sequencer process starts")
+
+    def set_offsets(self, **ms):
+        # offsets live with the click: change them in the settings file and restart it
+        raise ValueError("Latency offsets can't be changed while the sequencer runs in its own "
+                         "process; edit \"offsets\" in the settings file and restart it")
+
+    def save_patterns(self):
+        super().save_patterns()
+        self._control(bump="patterns_gen")
+
+    def set_bpm(self, new_bpm: int, save=True):
+        # the sequencer process saves settings itself
+        if not (30 <= int(new_bpm) <= 300):
+            return
+        self._control(bump="bpm_gen", bpm=int(new_bpm))
+
+    def adjust_bpm(self, delta: int):
+        self.set_bpm(self._status()[4] + int(delta))
+
+    def set_pattern(self, idx: int, save=True):
+        idx = int(idx)
+        if not (0 <= idx < len(self.patterns)):
+            return
+        self._control(bump="idx_gen", idx=idx)
+        print(f"Pattern: {self.patterns[idx]['name']}")
+
+    def request_fill(self, bars: int = 1, t=None):
+        bars = min(FILL_MAX_BARS, int(bars))
+        if bars < 1:
+            return
+        self._control(fill_total=bars, fill_t=t or 0.0)   # fill_total adds up
+
+    def next_button_action(self, t=None):
+        if self._status()[6]:
+            self.request_fill(1, t)
+        else:
+            self.next_pattern()
+
+    def next_pattern(self):
+        self.set_pattern((self._status()[5] + 1) % len(self.patterns))
+
+    def toggle_play(self):
+        playing = not self._status()[6]
+        if playing:
+            self._tap_times = []
+        self._control(bump="play_gen", play=1 if playing else 0)
+        return playing
+
+    def handle_start(self):
+        playing = self.toggle_play()
+        vals = self._status()
+        idx, bpm = vals[5], vals[4]
+        if playing:
+            print(f"Started: {self.patterns[idx]['name']} at {bpm} BPM")
+        else:
+            print("Stopped")
+
+    def apply_batch(self, commands, at="now"):
+        # resolved against the current status here, sent as one control write
+        if at not in ("now", "bar"):
+            raise ValueError("at must be 'now' or 'bar'")
+        cmds = parse_batch(commands, len(self.patterns))
+        vals = self._status()
+        bpm, playing = vals[4], bool(vals[6])
+        bumps = []
+        changes = {}
+        for name, value in cmds:
+            if name == "bpm" or (name == "bpm_delta" and 30 <= bpm + value <= 300):
+                bpm = value if name == "bpm" else bpm + value
+                bumps.append("bpm_gen")
+                changes["bpm"] = bpm
+            elif name == "pattern":
+                bumps.append("idx_gen")
+                changes["idx"] = value
+            elif name in ("play", "toggle"):
+                playing = value if name == "play" else not playing
+                bumps.append("play_gen")
+                changes["play"] = 1 if playing else 0
+            elif name == "fill":
+                changes["fill_total"] = changes.get("fill_total", 0) + value[0]
+                changes["fill_t"] = 0.0
+        if at == "bar":
+            changes["bar"] = 1
+        # one bump per field is enough: the sequencer only compares generations
+        self._control(sorted(set(bumps)), **changes)
+        return not (at == "bar" and vals[6])
+
+    def get_status(self):
+        (_, version, _, _, bpm, idx, playing, step, beat_count, last_beat_type,
+         fill_pending, fill_active, _, _, batch_pending) = self._status()
+        if not (0 <= idx < len(self.patterns)):
+            idx = 0
+        p = self.patterns[idx]
+        return {
+            "version": version,
+            "bpm": bpm,
+            "playing": bool(playing),
+            "current_idx": idx,
+            "pattern_name": p["name"],
+            "step": step,
+            "pattern_len": len(p["beats"]),
+            "last_beat_type": last_beat_type,
+            "beat_count": beat_count,
+            "has_fill": bool(p.get("fill")),
+            "fill_pending_bars": fill_pending,
+            "fill_active_bars": fill_active,
+            "batch_pending": bool(batch_pending),
+        }
+
+    def wait_for_change(self, since, timeout):
+        # no shared condition variable across processes: poll the block
+        end = clock() + timeout
+        while True:
+            version = self._status()[1]
+            if version != since or clock() >= end:
+                return version
+            time.sleep(0.005)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="DrumAssist sequencer process")
+    ap.add_argument("--name", default="default")
+    ap.add_argument("--shm", default=None)
+    ap.add_argument("--stop", action="store_true", help="stop a running sequencer process")
+    args = ap.parse_args()
+    path = args.shm or shm_path(args.name)
+    if args.stop:
+        pe = ProcessEngine(name=args.name, path=path)
+        if os.path.exists(path):
+            pe.mm = _map(path, create=False)
+        if pe.alive():
+            pe.stop_process()
+            print("Stopped sequencer process")
+        else:
+            print("No sequencer process running")
+    else:
+        run_sequencer_process(args.name, path)